@@ -21,8 +21,6 @@ os.environ["JUPYTER_CADQUERY"] = "1"
 
 from cad_viewer_widget import (
     AnimationTrack,
-    close_sidecar as close_viewer,
-    close_sidecars as close_viewers,
     get_sidecar as get_viewer,
     get_sidecars as get_viewers,
     get_default_sidecar as get_default_viewer,
@@ -58,10 +56,31 @@ from ocp_vscode.show import show_all, reset_show, show_clear
 
 
 from .app import JupyterCadqueryBackend
+from .comms import (
+    set_compression,
+    set_measure_backend,
+    set_measure_transport,
+    set_mesh_encoding,
+)
 from .config import get_user_defaults, save_user_defaults
 from ._version import __version__
 from .tools import auto_show, get_pick
+from .measure import interference_check, measure_batch, shape_ids
+from .pool import get_viewer_pool, set_viewer_pool
+from .budget import get_tessellation_plan
+from .decimate import get_decimation, set_decimation
+from .merge import get_merge_mode, set_merge_mode
+from .lazy import get_lazy_paths
+from .arrays import RawMesh, set_array_chunking
+from .faces import get_face_cache_stats, set_face_cache
+from .timing import (
+    get_timings,
+    clear_timings,
+    set_timings_history,
+    timings_to_openmetrics,
+)
 from .show import *
+from .interactive import interactive_show
 
 try:
     from ocp_tessellate.tessellator import (
@@ -114,6 +133,8 @@ try:
     shell_name = get_ipython().__class__.__name__
     if shell_name == "ZMQInteractiveShell":
         auto_show()
+        if os.environ.get("JUPYTER_CADQUERY_VIEWER_POOL") is not None:
+            set_viewer_pool(int(os.environ["JUPYTER_CADQUERY_VIEWER_POOL"]))
 except Exception as ex:
     ...
 
@@ -16,24 +16,120 @@
 
 import os
 import secrets
+import time
 
 import orjson
+from tornado import web, websocket
+from tornado.ioloop import IOLoop
+from traitlets import Integer
 from jupyter_server.base.handlers import JupyterHandler
+from jupyter_server.base.websocket import WebSocketMixin
 from jupyter_server.extension.application import ExtensionApp
 from jupyter_server.extension.handler import ExtensionHandlerMixin
 
 # ensure the Jupyter Cadquery comms routines will be loaded
 os.environ["JUPYTER_CADQUERY"] = "1"
-from ocp_vscode.backend import ViewerBackend
-from ocp_vscode.comms import MessageType
 
-BACKENDS = {}
+from .metrics import (
+    REGISTRY,
+    REQUESTS,
+    REQUEST_DURATION,
+    PAYLOAD_SIZE,
+    LOAD_MODEL_DURATION,
+    HANDLE_EVENT_DURATION,
+    COMPRESSION_RATIO,
+    Gauge,
+)
+from .channel import pack, unpack
+from .compression import (
+    PayloadTooLarge,
+    available_codecs,
+    content_hasher,
+    decompressor,
+)
+from .store import BackendHost, UnknownViewerError
+from .workers import WorkerError, WorkerPool
+
+# the viewer backends, in process or in worker processes (see backend_workers)
+HOST = BackendHost()
+
+# HOST.stats() of the current scrape, fetched once by MetricsHandler for all gauges
+HOST_STATS = {"backends": 0, "models": 0, "memory": 0}
+
+REGISTRY.register(
+    Gauge(
+        "backends",
+        "Number of live viewer backends.",
+        lambda: HOST_STATS["backends"],
+    )
+)
+REGISTRY.register(
+    Gauge(
+        "models",
+        "Number of distinct models loaded.",
+        lambda: HOST_STATS["models"],
+    )
+)
+REGISTRY.register(
+    Gauge(
+        "backends_memory_bytes",
+        "Estimated memory of the live viewer backends (serialized model size).",
+        lambda: HOST_STATS["memory"],
+    )
+)
 
 API_KEY = secrets.token_urlsafe(32)
+APIKEY_HEADER = "X-Jupyter-Cadquery-Apikey"
+
+# maximum size of an uploaded model in MB, see max_payload_size
+MAX_PAYLOAD_SIZE = 1024
+
+
+async def run(func, *args):
+    """Call the backend host, offloading blocking hosts (worker pools) from the IOLoop"""
+    if HOST.blocking:
+        return await IOLoop.current().run_in_executor(None, func, *args)
+    return func(*args)
+
+
+class MetricsMixin:
+    """Count requests and record their latency per handler"""
+
+    metrics_name = None
+
+    def on_finish(self):
+        REQUESTS.inc(self.metrics_name, str(self.get_status()))
+        REQUEST_DURATION.observe(self.request.request_time(), self.metrics_name)
+        super().on_finish()
+
+
+async def measure(viewer, message, log):
+    """Run a measurement request against the backend of viewer, return the response"""
+    if viewer is None:
+        log.error("Unknown viewer")
+        return {"error": "Unknown viewer"}
+    elif message is None:
+        log.error("Missing message")
+        return {"error": "Missing shape ID(s) or active Tool"}
 
+    log.info(f"Identifiers received {message} for viewer {viewer}")
+    start = time.perf_counter()
+    try:
+        result = await run(HOST.handle_event, viewer, message)
+    except UnknownViewerError:
+        log.error("Unknown viewer")
+        return {"error": "Unknown viewer"}
+    except WorkerError as ex:
+        log.error(str(ex))
+        return {"error": str(ex)}
+    HANDLE_EVENT_DURATION.observe(time.perf_counter() - start)
+    return {"success": result}
 
-class MeasureHandler(ExtensionHandlerMixin, JupyterHandler):
-    def post(self):
+
+class MeasureHandler(MetricsMixin, ExtensionHandlerMixin, JupyterHandler):
+    metrics_name = "measure"
+
+    async def post(self):
         viewer = self.get_body_argument("viewer")
         message = orjson.loads(self.get_body_argument("data"))
 
@@ -44,48 +140,277 @@ class MeasureHandler(ExtensionHandlerMixin, JupyterHandler):
             self.finish(orjson.dumps({"error": "Invalid API key"}))
             return
 
-        if viewer is None:
-            self.log.error("Unknown viewer")
-            self.finish(orjson.dumps({"error": "Unknown viewer"}))
-        elif message is None:
-            self.log.error("Missing message")
-            self.finish(orjson.dumps({"error": "Missing shape ID(s) or active Tool"}))
+        self.finish(orjson.dumps(await measure(viewer, message, self.log)))
+
+
+class MeasureSocketHandler(
+    WebSocketMixin, websocket.WebSocketHandler, ExtensionHandlerMixin, JupyterHandler
+):
+    """
+    Persistent measurement channel of a kernel, see channel.py for the frame format.
+
+    The API key is checked once when the connection is opened. Requests are handled
+    concurrently and answered in completion order.
+    """
+
+    metrics_name = "measure_ws"
+
+    async def get(self, *args, **kwargs):
+        if self.request.headers.get(APIKEY_HEADER) != API_KEY:
+            self.log.error("Invalid API key")
+            raise web.HTTPError(401, "Invalid API key")
+        await super().get(*args, **kwargs)
+
+    def on_message(self, message):
+        IOLoop.current().spawn_callback(self.reply, message)
+
+    async def reply(self, frame):
+        start = time.perf_counter()
+        try:
+            request_id, body = unpack(frame)
+        except ValueError as ex:
+            # nothing to answer to, the client times out and falls back to http
+            self.log.error(f"Malformed measure frame: {ex}")
+            REQUESTS.inc(self.metrics_name, "400")
+            return
+
+        status = "200"
+        try:
+            request = orjson.loads(body)
+            if not isinstance(request, dict):
+                raise ValueError("Request is not a JSON object")
+        except ValueError as ex:
+            self.log.error(f"Malformed measure request: {ex}")
+            result, status = {"error": f"Malformed request: {ex}"}, "400"
         else:
-            backend = BACKENDS.get(viewer)
-            if backend is None:
-                self.log.error("Unknown viewer")
-                self.finish(orjson.dumps({"error": "Unknown viewer"}))
-            else:
-                self.log.info(f"Identifiers received {message} for viewer {viewer}")
-                result = backend.handle_event(message, MessageType.UPDATES)
-                self.finish(orjson.dumps({"success": result}))
-
-
-class ObjectsHandler(ExtensionHandlerMixin, JupyterHandler):
-    def post(self):
-        viewer = self.get_body_argument("viewer")
-        data = orjson.loads(self.get_body_argument("data"))
+            try:
+                result = await measure(
+                    request.get("viewer"), request.get("data"), self.log
+                )
+            except Exception as ex:  # pylint: disable=broad-except
+                self.log.exception("Measurement failed")
+                result, status = {"error": f"Measurement failed: {ex}"}, "500"
 
-        apikey = self.get_body_argument("apikey")
-        if apikey != API_KEY:
+        try:
+            await self.write_message(
+                pack(request_id, orjson.dumps(result)), binary=True
+            )
+        except websocket.WebSocketClosedError:
+            return
+        REQUESTS.inc(self.metrics_name, status)
+        REQUEST_DURATION.observe(time.perf_counter() - start, self.metrics_name)
+
+
+@web.stream_request_body
+class ObjectsHandler(MetricsMixin, ExtensionHandlerMixin, JupyterHandler):
+    """
+    Receive the models of the viewers.
+
+    The body is the raw (optionally compressed) model JSON and is streamed: every
+    chunk is decompressed, hashed and appended as it arrives, so neither the form
+    encoded nor the compressed body is ever held in memory. The metadata comes as
+    query arguments (viewer, timeit, encoding, hash) and the API key as header.
+    """
+
+    metrics_name = "objects"
+
+    async def prepare(self):
+        await super().prepare()
+        if self._finished:
+            return
+
+        # all replies are JSON, the kernel tells them from Jupyter's own pages
+        self.set_header("Content-Type", "application/json")
+
+        self.raw_data = bytearray()
+        self.received = 0
+        self.error = None
+        self.decoder = None
+        self.hasher = content_hasher()
+
+        if self.request.headers.get(APIKEY_HEADER) != API_KEY:
             self.log.error("Invalid API key")
             self.set_status(401, reason="Invalid API key")
             self.finish(orjson.dumps({"error": "Invalid API key"}))
             return
 
+        if self.request.method != "POST":
+            return
+
+        limit = MAX_PAYLOAD_SIZE * 1024 * 1024
+        size = int(self.request.headers.get("Content-Length", 0))
+        if size > limit:
+            self.reject_payload(size)
+            return
+        self.request.connection.set_max_body_size(limit)
+
+        encoding = self.get_query_argument("encoding", None)
+        if encoding is not None and encoding not in available_codecs():
+            self.log.error(f"Unsupported encoding {encoding}")
+            self.set_status(415, reason="Unsupported encoding")
+            self.finish(
+                orjson.dumps(
+                    {
+                        "error": f"Unsupported encoding {encoding}",
+                        "codecs": available_codecs(),
+                    }
+                )
+            )
+            return
+        self.decoder = decompressor(encoding, limit)
+
+    def data_received(self, chunk):
+        if self.error is not None:
+            return
+
+        self.received += len(chunk)
+        try:
+            data = self.decoder.decompress(chunk)
+        except PayloadTooLarge:
+            # the compressed body passed the Content-Length check, the model does not.
+            # Decoding stops here, the rest of the body is only counted
+            self.error = (413, self.payload_error())
+            self.raw_data = bytearray()
+            self.decoder = None
+            return
+        except Exception as ex:  # pylint: disable=broad-except
+            self.error = (400, f"Corrupt payload: {ex}")
+            self.decoder = None
+            return
+
+        self.hasher.update(data)
+        self.raw_data += data
+
+    def payload_error(self, size=None):
+        model = "Model" if size is None else f"Model of {size / 1024 / 1024:.1f} MB"
+        return (
+            f"{model} exceeds the maximum payload size of"
+            f" {MAX_PAYLOAD_SIZE} MB (c.JupyterCadqueryBackend.max_payload_size)"
+        )
+
+    def reject_payload(self, size):
+        message = self.payload_error(size)
+        self.log.error(message)
+        self.set_status(413, reason="Payload too large")
+        self.finish(orjson.dumps({"error": message}))
+
+    async def post(self):
+        viewer = self.get_query_argument("viewer", None)
+
+        if self.error is not None:
+            status, message = self.error
+            self.log.error(message)
+            self.set_status(status)
+            self.finish(orjson.dumps({"error": message}))
+            return
+
         if viewer is None:
             self.log.error("Unknown viewer")
             self.finish(orjson.dumps({"error": "Unknown viewer"}))
-        elif data is None:
-            self.log.error("Missing objects")
-            self.finish(orjson.dumps({"error": "Missing objects"}))
-        else:
-            BACKENDS[viewer] = ViewerBackend(port=0, jcv_id=viewer)
-            BACKENDS[viewer].load_model(data["model"])
-            self.log.info(f"Objects received for viewer {viewer}")
+            return
+
+        if self.received == 0:
+            # the kernel assumes the server knows the model and only sent its hash
+            model_hash = self.get_query_argument("hash", None)
+            try:
+                attached = await run(HOST.attach, viewer, model_hash)
+            except WorkerError as ex:
+                self.log.error(str(ex))
+                attached = False
+
+            if not attached:
+                self.log.info(f"Unknown model {model_hash} for viewer {viewer}")
+                self.set_status(404, reason="Unknown model")
+                self.finish(
+                    orjson.dumps(
+                        {"error": "Unknown model", "codecs": available_codecs()}
+                    )
+                )
+                return
+
+            self.log.info(f"Model {model_hash} reused for viewer {viewer}")
             self.finish(
-                orjson.dumps({"success": f"Objects received for viewer {viewer}"})
+                orjson.dumps(
+                    {
+                        "success": f"Objects received for viewer {viewer}",
+                        "hash": model_hash,
+                        "timings": {"load_model": 0.0},
+                        "codecs": available_codecs(),
+                    }
+                )
+            )
+            return
+
+        raw_data, self.raw_data = self.raw_data, None
+        ratio = None
+        if self.get_query_argument("encoding", None) is not None:
+            ratio = len(raw_data) / max(self.received, 1)
+
+        model_hash = self.hasher.hexdigest()
+        try:
+            # parsing and building the model takes seconds for large models, never
+            # run it on the IOLoop, even for the in process host
+            load_model = await IOLoop.current().run_in_executor(
+                None, HOST.load, viewer, model_hash, raw_data
             )
+        except ValueError as ex:
+            self.log.error(str(ex))
+            self.finish(orjson.dumps({"error": str(ex)}))
+            return
+        except WorkerError as ex:
+            self.log.error(str(ex))
+            self.set_status(500, reason="Backend worker failed")
+            self.finish(orjson.dumps({"error": str(ex)}))
+            return
+
+        PAYLOAD_SIZE.observe(len(raw_data))
+        LOAD_MODEL_DURATION.observe(load_model)
+        if ratio is not None:
+            COMPRESSION_RATIO.observe(ratio)
+            self.log.info(f"Compression ratio for viewer {viewer}: {ratio:.1f}")
+
+        self.log.info(f"Objects received for viewer {viewer}")
+        if self.get_query_argument("timeit", "0") == "1":
+            self.log.info(f"load_model for viewer {viewer}: {load_model:.3f} sec")
+        self.finish(
+            orjson.dumps(
+                {
+                    "success": f"Objects received for viewer {viewer}",
+                    "hash": model_hash,
+                    "timings": {"load_model": load_model},
+                    "compression_ratio": ratio,
+                    "codecs": available_codecs(),
+                }
+            )
+        )
+
+    async def delete(self):
+        viewer = self.get_query_argument("viewer")
+
+        try:
+            await run(HOST.release, viewer)
+        except WorkerError as ex:
+            self.log.error(str(ex))
+        self.log.info(f"Backend released for viewer {viewer}")
+        self.finish(orjson.dumps({"success": f"Backend released for viewer {viewer}"}))
+
+
+class MetricsHandler(MetricsMixin, ExtensionHandlerMixin, JupyterHandler):
+    metrics_name = "metrics"
+
+    @web.authenticated
+    async def get(self):
+        # worker pools answer over pipes and wait behind long loads, never block
+        # the IOLoop of the Jupyter server on a scrape
+        try:
+            stats = await IOLoop.current().run_in_executor(None, HOST.stats)
+        except WorkerError as ex:
+            self.log.error(str(ex))
+        else:
+            HOST_STATS.update(stats)
+
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(REGISTRY.render())
 
 
 def wrapper(self, init_http):
@@ -105,15 +430,48 @@ class JupyterCadqueryBackend(ExtensionApp):
     static_paths = []
     template_paths = []
 
+    backend_workers = Integer(
+        0,
+        config=True,
+        help="Number of worker processes hosting the viewer backends (0: in process)",
+    )
+
+    worker_memory_limit = Integer(
+        0,
+        config=True,
+        help="Address space limit per backend worker process in MB (0: unlimited)",
+    )
+
+    max_payload_size = Integer(
+        1024,
+        config=True,
+        help="Maximum size of an uploaded model in MB (after decompression)",
+    )
+
     def initialize_handlers(self):
         self.handlers.append((r"/measure", MeasureHandler))
+        self.handlers.append((r"/measure/ws", MeasureSocketHandler))
         self.handlers.append((r"/objects", ObjectsHandler))
+        self.handlers.append((r"/jupyter_cadquery/metrics", MetricsHandler))
 
         init_http = self.serverapp.init_httpserver
         self.serverapp.init_httpserver = wrapper(self.serverapp, init_http)
 
     def initialize_settings(self):
-        pass
+        global HOST, MAX_PAYLOAD_SIZE  # pylint: disable=global-statement
+
+        MAX_PAYLOAD_SIZE = self.max_payload_size
+
+        if self.backend_workers > 0:
+            HOST = WorkerPool(
+                workers=self.backend_workers,
+                memory_limit=self.worker_memory_limit,
+                log=self.log,
+            )
+            self.log.info(f"Started {self.backend_workers} backend worker(s)")
+
+    async def stop_extension(self):
+        HOST.shutdown()
 
     def initialize_templates(self):
         pass
@@ -0,0 +1,391 @@
+"""Numpy meshes and point clouds, sent to the viewer without tessellation"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# show() accepts RawMesh objects, (n, 3) arrays and paths of .npy files (point
+# clouds) next to CAD objects. They bypass OCC and ocp_tessellate: their parts are
+# added to the root group after numpy_to_buffer_json, so the arrays stay numpy and
+# cad_viewer_widget sends them as binary buffers of the comm message. float32
+# vertices, normals and colors and uint32 triangles are sent without a copy, .npy
+# files are memory mapped.
+#
+#   mesh:         {"type": "shapes", "shape": {"vertices", "normals", "triangles",
+#                  ..., "colors"}} with one face and no edges
+#   point cloud:  {"type": "vertices", "shape": {"obj_vertices", "colors"}}
+#
+# "colors" (per vertex, uint8 or float32 rgb) needs a viewer that draws vertex
+# colors, for others it is left out and the part color is used. With
+# set_array_chunking(chunk_size), arrays larger than chunk_size bytes are
+# replaced by
+#
+#   {"chunked": key, "shape": [n], "dtype": ..., "chunks": k}
+#
+# and sent after the model as k custom messages {"type": "array_chunk", "key",
+# "index", "chunks"} with one buffer each. This needs a viewer that reassembles
+# the arrays before it draws the part, set_array_chunking refuses to enable it
+# for others (see features.py).
+#
+
+import os
+import threading
+import warnings
+from itertools import count
+
+import numpy as np
+from ocp_tessellate.defaults import get_default
+from ocp_tessellate.utils import Color
+
+from .features import VIEWER_VERSION, require_viewer, viewer_supports
+
+__all__ = ["RawMesh", "set_array_chunking"]
+
+CHUNKING = {"chunk_size": None}
+
+# per thread: parts of the raw objects of the running show(), added to the shapes
+# when serialized (parts), and (content, buffer) of the chunked arrays of the last
+# serialized model (chunks)
+_LOCAL = threading.local()
+
+_KEYS = count()
+
+
+def set_array_chunking(chunk_size=8 * 1024 * 1024):
+    """
+    Send arrays of RawMesh objects and point clouds larger than chunk_size bytes in
+    chunks. Needs a viewer that reassembles them (see arrays.py), enabling raises
+    RuntimeError for viewers that cannot.
+
+    Parameters:
+        chunk_size:  Maximum bytes per message (default=8MB), None sends every array
+                     within the model message (default behavior)
+    """
+    if chunk_size is not None:
+        require_viewer("array_chunks")
+    CHUNKING["chunk_size"] = chunk_size
+
+
+def _load(value):
+    if isinstance(value, (str, os.PathLike)):
+        return np.load(value, mmap_mode="r")
+    return value
+
+
+def _contiguous(value, dtype, columns):
+    if value is None:
+        return None
+    value = np.asarray(_load(value))
+    if value.dtype != dtype:
+        value = value.astype(dtype)
+    return np.ascontiguousarray(value).reshape(-1, columns)
+
+
+def _normals(vertices, triangles):
+    """Area weighted vertex normals"""
+    p0, p1, p2 = (vertices[triangles[:, k]] for k in range(3))
+    cross = np.cross(p1 - p0, p2 - p0)
+    normals = np.column_stack(
+        [
+            np.bincount(
+                triangles.ravel(),
+                weights=np.repeat(cross[:, k], 3),
+                minlength=len(vertices),
+            )
+            for k in range(3)
+        ]
+    )
+    norm = np.linalg.norm(normals, axis=1, keepdims=True)
+    return (normals / np.where(norm == 0, 1, norm)).astype(np.float32)
+
+
+class RawMesh:
+    """
+    A triangle mesh or point cloud given as numpy arrays or .npy files
+
+    Parameters:
+        vertices:   (n, 3) positions
+        triangles:  (m, 3) vertex indices, None for a point cloud
+        normals:    (n, 3) vertex normals, computed for meshes if None
+        colors:     (n, 3) vertex colors, uint8 or float in [0, 1]. Ignored with a
+                    warning by viewers that cannot draw them
+        color:      Color of the part (default: default_color)
+        name:       Name in the viewer tree
+        size:       Point size of point clouds (default=2)
+    """
+
+    def __init__(
+        self,
+        vertices,
+        triangles=None,
+        normals=None,
+        colors=None,
+        color=None,
+        name=None,
+        size=2,
+    ):
+        self.vertices = _contiguous(vertices, np.float32, 3)
+        self.triangles = _contiguous(triangles, np.uint32, 3)
+        self.normals = _contiguous(normals, np.float32, 3)
+        if self.triangles is not None and self.normals is None:
+            self.normals = _normals(self.vertices, self.triangles)
+
+        self.colors = None
+        if colors is not None and not viewer_supports("vertex_colors"):
+            warnings.warn(
+                f"cad_viewer_widget {VIEWER_VERSION} cannot draw vertex colors,"
+                " using the color of the part",
+                stacklevel=2,
+            )
+        elif colors is not None:
+            colors = np.asarray(_load(colors))
+            dtype = np.uint8 if colors.dtype == np.uint8 else np.float32
+            self.colors = _contiguous(colors, dtype, 3)
+
+        self.color = color
+        self.name = name
+        self.size = size
+
+    @property
+    def kind(self):
+        return "Points" if self.triangles is None else "Mesh"
+
+
+def is_raw(obj):
+    """True for objects show() sends as numpy arrays"""
+    if isinstance(obj, RawMesh):
+        return True
+    if isinstance(obj, np.ndarray):
+        return obj.ndim == 2 and obj.shape[1] == 3
+    return isinstance(obj, (str, os.PathLike)) and str(obj).endswith(".npy")
+
+
+def _bb(vertices):
+    if len(vertices) == 0:
+        return None
+    lower, upper = vertices.min(axis=0), vertices.max(axis=0)
+    return {
+        f"{axis}{bound}": float(value[i])
+        for i, axis in enumerate("xyz")
+        for bound, value in (("min", lower), ("max", upper))
+    }
+
+
+def _part(obj, name, color, alpha):
+    if color is None:
+        color = get_default("default_color") if obj.color is None else obj.color
+    # a copy, the color of show() may be a string, a tuple or the user's Color
+    color = Color(color)
+    if alpha is not None:
+        color.a = alpha
+
+    part = {
+        "name": name,
+        "color": color.web_color,
+        "alpha": color.a,
+        "loc": None,
+        "bb": _bb(obj.vertices),
+    }
+    if obj.triangles is None:
+        part.update(
+            {
+                "type": "vertices",
+                "shape": {"obj_vertices": obj.vertices},
+                "state": [3, 1],
+                "size": obj.size,
+            }
+        )
+    else:
+        empty = np.empty(0, dtype=np.float32)
+        part.update(
+            {
+                "type": "shapes",
+                "subtype": "solid",
+                "shape": {
+                    "vertices": obj.vertices,
+                    "normals": obj.normals,
+                    "triangles": obj.triangles,
+                    "edges": empty,
+                    "obj_vertices": empty,
+                    "face_types": np.zeros(1, dtype=np.int32),
+                    "triangles_per_face": np.array(
+                        [len(obj.triangles)], dtype=np.int32
+                    ),
+                    "edge_types": np.empty(0, dtype=np.int32),
+                    "segments_per_edge": np.empty(0, dtype=np.int32),
+                },
+                "state": [1, 3],
+                "renderback": False,
+                "accuracy": None,
+                "texture": None,
+            }
+        )
+    if obj.colors is not None:
+        part["shape"]["colors"] = obj.colors
+    return part
+
+
+def split(cad_objs, names, colors, alphas):
+    """
+    Split the raw objects off the objects of a show() call. Returns the remaining
+    objects, names, colors and alphas and the viewer parts of the raw objects.
+    """
+    objs, attrs, parts = [], [], []
+    for i, obj in enumerate(cad_objs):
+        name = None if names is None else names[i]
+        color = None if colors is None else colors[i]
+        alpha = None if alphas is None else alphas[i]
+        if not is_raw(obj):
+            objs.append(obj)
+            attrs.append((name, color, alpha))
+            continue
+
+        if not isinstance(obj, RawMesh):
+            obj = RawMesh(obj)
+        if name is None:
+            name = obj.name or obj.kind
+        parts.append(_part(obj, name, color, alpha))
+
+    def column(values, i):
+        return None if values is None else [a[i] for a in attrs]
+
+    return (
+        objs,
+        column(names, 0),
+        column(colors, 1),
+        column(alphas, 2),
+        parts,
+    )
+
+
+def _chunks():
+    chunks = getattr(_LOCAL, "chunks", None)
+    if chunks is None:
+        chunks = _LOCAL.chunks = []
+    return chunks
+
+
+def _chunked(value):
+    chunk_size = CHUNKING["chunk_size"]
+    if not isinstance(value, np.ndarray) or value.nbytes <= chunk_size:
+        return value
+
+    flat = value.ravel()
+    key = f"array:{next(_KEYS)}"
+    step = max(1, chunk_size // flat.itemsize)
+    chunks = (len(flat) + step - 1) // step
+    for index in range(chunks):
+        content = {"type": "array_chunk", "key": key, "index": index, "chunks": chunks}
+        _chunks().append((content, memoryview(flat[index * step : (index + 1) * step])))
+    return {
+        "chunked": key,
+        "shape": [len(flat)],
+        "dtype": str(flat.dtype),
+        "chunks": chunks,
+    }
+
+
+def add_parts(shapes, parts):
+    """Add the raw parts to the root group of shapes and extend its bounding box"""
+    names = {part["name"] for part in shapes["parts"]}
+    # without CAD parts, shapes has a default box around the origin
+    root = shapes.get("bb") if shapes["parts"] else None
+    for part in parts:
+        name, n = part["name"], 1
+        while name in names:
+            name, n = f"{part['name']}_{n}", n + 1
+        names.add(name)
+
+        part = {**part, "name": name, "id": f"{shapes['id']}/{name}"}
+        if CHUNKING["chunk_size"] is not None:
+            part["shape"] = {k: _chunked(v) for k, v in part["shape"].items()}
+        shapes["parts"].append(part)
+
+        bb = part["bb"]
+        if bb is None:
+            continue
+        if root is None:
+            root = dict(bb)
+        else:
+            for axis in "xyz":
+                root[f"{axis}min"] = min(root[f"{axis}min"], bb[f"{axis}min"])
+                root[f"{axis}max"] = max(root[f"{axis}max"], bb[f"{axis}max"])
+
+    if root is not None:
+        shapes["bb"] = root
+    return shapes
+
+
+def raw_objects(func):
+    """Wrap to_ocpgroup to split the raw objects off the running show()"""
+    if getattr(func, "_jcq_raw", False):
+        return func
+
+    def wrapper(*cad_objs, names=None, colors=None, alphas=None, **kwargs):
+        cad_objs, names, colors, alphas, _LOCAL.parts = split(
+            cad_objs, names, colors, alphas
+        )
+        return func(*cad_objs, names=names, colors=colors, alphas=alphas, **kwargs)
+
+    wrapper._jcq_raw = True
+    return wrapper
+
+
+def without_cad_objects(func):
+    """Wrap tessellate_group to accept the empty group of a show() of raw objects"""
+    if getattr(func, "_jcq_raw", False):
+        return func
+
+    def wrapper(group, instances, *args, **kwargs):
+        if group.objects:
+            return func(group, instances, *args, **kwargs)
+
+        mapping, shapes = group.collect("", instances, None, None, None)
+        shapes.update({"normal_len": 0, "bb": None})
+        return [], shapes, mapping
+
+    wrapper._jcq_raw = True
+    return wrapper
+
+
+def with_raw_parts(func):
+    """Wrap numpy_to_buffer_json to add the raw parts as numpy arrays"""
+    if getattr(func, "_jcq_raw", False):
+        return func
+
+    def wrapper(value):
+        result = func(value)
+        _chunks().clear()
+        parts, _LOCAL.parts = getattr(_LOCAL, "parts", None), None
+        if parts and isinstance(result, dict) and "shapes" in result:
+            add_parts(result["shapes"], parts)
+        return result
+
+    wrapper._jcq_raw = True
+    return wrapper
+
+
+def take_chunks():
+    """The chunked arrays of the last model serialized by the calling thread"""
+    chunks = list(_chunks())
+    _chunks().clear()
+    return chunks
+
+
+def send_chunks(viewer, chunks):
+    """Send chunked arrays (see take_chunks) to viewer"""
+    for content, buffer in chunks:
+        viewer.widget.send(content=content, buffers=[buffer])
@@ -0,0 +1,104 @@
+"""Measurement backend running inside the kernel"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import base64
+import os
+
+# ensure the Jupyter Cadquery comms routines will be loaded
+os.environ["JUPYTER_CADQUERY"] = "1"
+
+from ocp_tessellate.ocp_utils import deserialize, make_compound, tq_to_loc
+from ocp_tessellate.tessellator import get_edges, get_faces, get_vertices
+from ocp_vscode.backend import ViewerBackend
+from ocp_vscode.build123d import Compound, Edge, Face, Location, Vertex, downcast
+from ocp_vscode.comms import MessageType
+
+
+def _shape(obj):
+    # live TopoDS_Shape from show() or base64 BRep (e.g. the logo)
+    if isinstance(obj, str):
+        return deserialize(base64.b64decode(obj.encode("utf-8")))
+    return obj
+
+
+def _location(loc):
+    if loc is None:
+        return Location().wrapped
+    elif isinstance(loc, (list, tuple)):
+        return tq_to_loc(*loc)
+    return loc
+
+
+def build_model(mapping):
+    """
+    Build the backend model (shape id -> build123d shape) from the mapping of show().
+
+    Same result as ViewerBackend.load_model, but the mapping holds the live OCC
+    shapes of the kernel, so nothing needs to be serialized and deserialized.
+    """
+    model = {}
+
+    def walk(group):
+        for v in group["parts"]:
+            if v.get("parts") is not None:
+                walk(v)
+                continue
+
+            id_ = v["id"]
+            loc = _location(v["loc"])
+            if isinstance(v["shape"], dict):
+                compound = _shape(v["shape"]["obj"])
+            else:
+                shape = [_shape(s) for s in v["shape"]]
+                compound = make_compound(shape) if len(shape) > 1 else shape[0]
+
+            model[id_] = Compound(compound.Moved(loc))
+            for i, face in enumerate(get_faces(compound)):
+                model[f"{id_}/faces/faces_{i}"] = Face(face.Moved(loc))
+            for i, edge in enumerate(get_edges(compound)):
+                model[f"{id_}/edges/edges_{i}"] = Edge(edge.Moved(loc))
+            for i, vertex in enumerate(get_vertices(compound)):
+                model[f"{id_}/vertices/vertices{i}"] = Vertex(
+                    downcast(vertex.Moved(loc))
+                )
+
+    walk(mapping)
+    return model
+
+
+class KernelBackend(ViewerBackend):
+    """
+    ViewerBackend of one viewer on the shapes shown by the kernel. The model is only
+    built when it is needed. Local backends answer the measurement requests of the
+    viewer, the others are only used for batch measurements (see measure.py).
+    """
+
+    def __init__(self, jcv_id, mapping, local=True):
+        super().__init__(port=0, jcv_id=jcv_id)
+        self.mapping = mapping
+        self.local = local
+
+    def get_model(self):
+        if self.model is None:
+            self.model = build_model(self.mapping)
+            self.mapping = None
+        return self.model
+
+    def measure(self, message):
+        self.get_model()
+        return self.handle_event(message, MessageType.UPDATES)
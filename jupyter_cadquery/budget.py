@@ -0,0 +1,249 @@
+"""Triangle budget driven tessellation of the parts of a show() call"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# Without a budget every part is tessellated relative to its own size, so a screw
+# gets as many triangles as the housing. With a budget, all parts start with the
+# tolerance the whole scene would get as one part. Parts are then refined, largest
+# first, in steps halving deviation and angular tolerance, as long as the rendered
+# triangles (instances times references) stay within the budget. No part gets finer
+# than without a budget. If the starting level exceeds the budget, all parts are
+# coarsened once by the overshoot (at most MAX_COARSENING). Curved faces need a few
+# triangles at any tolerance, so very small budgets can still be exceeded.
+#
+
+import importlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from OCP.BRepBuilderAPI import BRepBuilderAPI_Copy
+from OCP.BRepTools import BRepTools
+from OCP.TopLoc import TopLoc_Location
+from ocp_tessellate import convert
+from ocp_tessellate.defaults import preset
+from ocp_tessellate.ocp_utils import BoundingBox, bounding_box
+from ocp_tessellate.tessellator import cache, compute_quality, make_key, tessellate
+from ocp_tessellate.utils import round_sig
+
+from .faces import CACHE_LOCK, face_cached
+
+__all__ = ["get_tessellation_plan"]
+
+MAX_COARSENING = 8
+
+MAX_ANGULAR_TOLERANCE = 1.0
+
+# per thread: triangle budget of the running show() call, None disables budgeting
+# (budget), cache id -> (deviation, quality, angular_tolerance, triangles) of the
+# running show() (plan) and the summary of the last budgeted show() (last_plan)
+_LOCAL = threading.local()
+
+# tessellate of ocp_tessellate with the face cache in front, see faces.py
+_TESSELLATE = face_cached(tessellate)
+
+
+@contextmanager
+def triangle_budget(budget):
+    """Tessellate the show() calls in this context within budget triangles"""
+    previous = getattr(_LOCAL, "budget", None)
+    _LOCAL.budget = budget
+    try:
+        yield
+    finally:
+        _LOCAL.budget = previous
+
+
+def get_tessellation_plan():
+    """
+    Deviation, angular tolerance and triangles of every part of the last show() call
+    of this thread with a triangle_budget
+    """
+    return getattr(_LOCAL, "last_plan", None)
+
+
+def _walk(group, loc, refs, boxes, instances):
+    loc = loc if group.loc is None else loc * group.loc
+    for obj in group.objects:
+        if hasattr(obj, "objects"):
+            _walk(obj, loc, refs, boxes, instances)
+        elif getattr(obj, "ref", None) is not None:
+            refs[obj.ref] += 1
+            obj_loc = loc if obj.loc is None else loc * obj.loc
+            shape = instances[obj.ref]["obj"]
+            boxes.append(BoundingBox(shape.Moved(obj_loc)))
+
+
+def _scene_box(boxes):
+    return BoundingBox(
+        {
+            "xmin": min(b.xmin for b in boxes),
+            "xmax": max(b.xmax for b in boxes),
+            "ymin": min(b.ymin for b in boxes),
+            "ymax": max(b.ymax for b in boxes),
+            "zmin": min(b.zmin for b in boxes),
+            "zmax": max(b.zmax for b in boxes),
+        }
+    )
+
+
+class _Part:
+    def __init__(self, instance, refs, deviation, angular_tolerance, render_edges):
+        self.instance = instance
+        self.refs = refs
+        self.bb = bounding_box(instance["obj"], loc=None, optimal=False)
+        self.quality = compute_quality(self.bb, deviation=deviation)
+        self.deviation = deviation
+        self.angular_tolerance = angular_tolerance
+        self.render_edges = render_edges
+        self.factor = 1.0
+        self.triangles = 0
+        # copy of the shape to mesh the levels on, see mesh
+        self.shape = None
+
+    def level(self, factor):
+        deviation = round_sig(self.deviation * factor, 3)
+        return (
+            deviation,
+            compute_quality(self.bb, deviation=deviation),
+            round_sig(min(self.angular_tolerance * factor, MAX_ANGULAR_TOLERANCE), 3),
+        )
+
+    def mesh(self, factor):
+        """Tessellate at factor times the default tolerances, return the triangles"""
+        deviation, quality, angular_tolerance = self.level(factor)
+        cache_id = self.instance["cache_id"]
+        kwargs = {
+            "deviation": deviation,
+            "quality": quality,
+            "angular_tolerance": angular_tolerance,
+            "compute_edges": self.render_edges,
+            "shape_id": "n/a",
+        }
+        with CACHE_LOCK:
+            cached = make_key(self.instance["obj"], cache_id, **kwargs) in cache
+        if not cached:
+            # BRepMesh keeps a finer triangulation, coarser levels need a clean
+            # shape. The user's shape may be shown by other threads, so the levels
+            # are meshed on a copy sharing its geometry.
+            if self.shape is None:
+                self.shape = BRepBuilderAPI_Copy(self.instance["obj"], False).Shape()
+            BRepTools.Clean_s(self.shape)
+        # cached meshes are found by cache_id, the copy is never looked at
+        shape = self.instance["obj"] if self.shape is None else self.shape
+        mesh = _TESSELLATE(shape, cache_id, **kwargs)
+        self.factor = factor
+        self.triangles = len(mesh["triangles"]) // 3 * self.refs
+        return self.triangles
+
+
+def plan_tessellation(group, instances, kwargs, budget):
+    """Deviation and angular tolerance per instance to stay within budget triangles"""
+    deviation = preset("deviation", kwargs.get("deviation"))
+    angular_tolerance = preset("angular_tolerance", kwargs.get("angular_tolerance"))
+    render_edges = preset("render_edges", kwargs.get("render_edges"))
+
+    refs = [0] * len(instances)
+    boxes = []
+    _walk(group, TopLoc_Location(), refs, boxes, instances)
+    if not boxes:
+        return {}
+
+    scene_quality = compute_quality(_scene_box(boxes), deviation=deviation)
+    parts = [
+        _Part(instance, max(1, count), deviation, angular_tolerance, render_edges)
+        for instance, count in zip(instances, refs)
+    ]
+
+    # start with the tolerance of the whole scene
+    coarsest = [max(1.0, scene_quality / max(p.quality, 1e-12)) for p in parts]
+    total = sum(p.mesh(f) for p, f in zip(parts, coarsest))
+
+    if total > budget:
+        # deflection scales roughly with the inverse of the triangle count
+        scale = min(total / budget, MAX_COARSENING)
+        total = sum(p.mesh(f * scale) for p, f in zip(parts, coarsest))
+
+    # larger parts first, halving assumes twice the triangles per refinement
+    order = sorted(parts, key=lambda p: p.quality, reverse=True)
+    refined = True
+    while refined:
+        refined = False
+        for part in order:
+            if part.factor <= 1.0 or total + part.triangles > budget:
+                continue
+            factor, triangles = part.factor, part.triangles
+            total += part.mesh(max(1.0, factor / 2)) - triangles
+            if total > budget:
+                # more than predicted, back to the cached coarser mesh
+                total += part.mesh(factor) - part.triangles
+            else:
+                refined = True
+
+    return {p.instance["cache_id"]: p.level(p.factor) + (p.triangles,) for p in parts}
+
+
+def _tessellate(shape, cache_key, deviation, quality, angular_tolerance, **kwargs):
+    plan = getattr(_LOCAL, "plan", None)
+    if plan is not None and cache_key in plan:
+        deviation, quality, angular_tolerance, _ = plan[cache_key]
+    return _TESSELLATE(
+        shape, cache_key, deviation, quality, angular_tolerance, **kwargs
+    )
+
+
+def budgeted(func):
+    """Wrap tessellate_group to apply the triangle budget of the running show()"""
+    if getattr(func, "_jcq_budget", False):
+        return func
+
+    def wrapper(group, instances, kwargs=None, *args, **kw):
+        budget = getattr(_LOCAL, "budget", None)
+        if budget is None or not instances:
+            return func(group, instances, kwargs, *args, **kw)
+
+        plan = _LOCAL.plan = plan_tessellation(group, instances, kwargs or {}, budget)
+        try:
+            return func(group, instances, kwargs, *args, **kw)
+        finally:
+            _LOCAL.last_plan = {
+                "budget": budget,
+                "triangles": int(np.sum([p[3] for p in plan.values()])),
+                "parts": [
+                    {
+                        "name": instance["name"],
+                        "deviation": plan[instance["cache_id"]][0],
+                        "angular_tolerance": plan[instance["cache_id"]][2],
+                        "triangles": plan[instance["cache_id"]][3],
+                    }
+                    for instance in instances
+                    if instance["cache_id"] in plan
+                ],
+            }
+            _LOCAL.plan = None
+
+    wrapper._jcq_budget = True
+    return wrapper
+
+
+if convert.tessellate is tessellate:
+    convert.tessellate = _tessellate
+
+# ocp_vscode.show is shadowed by the show function in the ocp_vscode namespace
+_show_module = importlib.import_module("ocp_vscode.show")
+_show_module.tessellate_group = budgeted(_show_module.tessellate_group)
@@ -0,0 +1,127 @@
+"""Persistent WebSocket channel for measurements between kernel and server extension"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# Frame format (binary frames in both directions)
+#
+#   8 bytes  request id, unsigned little endian
+#   n bytes  JSON, {"viewer": ..., "data": ...} for requests and the response
+#            body of the /measure handler ({"success": ...} or {"error": ...})
+#
+# Responses may arrive out of order, the request id matches them to requests.
+#
+
+import asyncio
+import itertools
+import struct
+import threading
+
+import orjson
+from tornado.httpclient import HTTPRequest
+from tornado.websocket import websocket_connect
+
+HEADER = struct.Struct("<Q")
+
+
+def pack(request_id, body):
+    return HEADER.pack(request_id) + body
+
+
+def unpack(frame):
+    """(request id, body) of a frame, ValueError for frames without a request id"""
+    if not isinstance(frame, (bytes, bytearray)) or len(frame) < HEADER.size:
+        raise ValueError("Frame without request id")
+    return HEADER.unpack_from(frame)[0], frame[HEADER.size :]
+
+
+class MeasureChannel:
+    """
+    WebSocket connection to the measure socket of the server extension.
+
+    The widget calls the measure callback synchronously on the kernel thread, hence
+    the connection lives in its own event loop in a daemon thread and callers block
+    on concurrent futures.
+    """
+
+    def __init__(self, url, headers, timeout=10):
+        self.timeout = timeout
+        self.ids = itertools.count()
+        self.pending = {}
+        self.closed = False
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="jupyter-cadquery-measure", daemon=True
+        )
+        self.thread.start()
+        try:
+            self.conn = self._run(self._connect(url, headers)).result(timeout)
+        except Exception:
+            self.close()
+            raise
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _connect(self, url, headers):
+        conn = await websocket_connect(HTTPRequest(url, headers=headers))
+        self.loop.create_task(self._read(conn))
+        return conn
+
+    async def _read(self, conn):
+        while True:
+            frame = await conn.read_message()
+            if frame is None:
+                break
+            try:
+                request_id, body = unpack(frame)
+            except ValueError:
+                continue
+            future = self.pending.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_result(body)
+
+        self.closed = True
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Measure channel closed"))
+        self.pending.clear()
+
+    async def _request(self, viewer, data):
+        request_id = next(self.ids)
+        future = self.loop.create_future()
+        self.pending[request_id] = future
+        message = orjson.dumps({"viewer": viewer, "data": data})
+        await self.conn.write_message(pack(request_id, message), binary=True)
+        return await future
+
+    def submit(self, viewer, data):
+        """Send a measurement request without waiting, returns a concurrent future"""
+        if self.closed:
+            raise ConnectionError("Measure channel closed")
+        return self._run(self._request(viewer, data))
+
+    def measure(self, viewer, data):
+        """Send a measurement request and return the response body as str"""
+        return self.submit(viewer, data).result(self.timeout).decode("utf-8")
+
+    def close(self):
+        self.closed = True
+        conn = getattr(self, "conn", None)
+        if conn is not None:
+            self.loop.call_soon_threadsafe(conn.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
@@ -17,8 +17,12 @@
 #
 
 
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
 from enum import Enum
 import os
+import threading
+import warnings
 
 import orjson
 import requests
@@ -26,7 +30,15 @@ from cad_viewer_widget import get_default_sidecar, get_sidecar, show
 from cad_viewer_widget.utils import display_args, viewer_args
 from ocp_vscode.comms import default as json_default
 
+from .arrays import send_chunks, take_chunks
+from .backend import KernelBackend
+from .channel import MeasureChannel
+from .compression import choose_codec, compress, content_hash
 from .config import get_user_defaults
+from .features import require_viewer
+from .jobs import in_kernel
+from .quantize import encode_shapes
+from .timing import add_stage, stage
 
 __all__ = [
     "set_jupyter_port",
@@ -35,17 +47,189 @@ __all__ = [
     "send_data",
     "send_command",
     "send_backend",
+    "send_backend_async",
+    "release_backend",
     "send_measure_request",
     "send_config",
+    "set_compression",
+    "set_mesh_encoding",
+    "set_measure_transport",
+    "set_measure_backend",
 ]
 
 SESSION = None
 
+SESSION_LOCK = threading.Lock()
+
+# per thread http session, sharing the (thread safe) cookie jar of SESSION
+_SESSIONS = threading.local()
+
+# serializes widget updates of show() calls from several threads
+WIDGET_LOCK = threading.RLock()
+
+# codecs the server extension announced in its last /objects response
+SERVER_CODECS = None
+
+# content hashes of the models the server extension has already loaded
+KNOWN_MODELS = set()
+
+# viewer id -> (content hash, data) of its last model uploaded to the server
+# extension, sent again when the server lost the backend (e.g. a restarted worker)
+SENT_MODELS = {}
+
+COMPRESSION = {"codec": "auto", "threshold": 1024 * 1024, "level": 3}
+
+# None (float32 meshes) or "quantized", see quantize.py
+MESH_ENCODING = {"encoding": None, "max_error": 0.1}
+
+# "websocket" (persistent channel, falls back to http) or "http"
+MEASURE_TRANSPORT = "websocket"
+
+CHANNEL = None
+
+# "server" (upload models to the server extension) or "kernel"
+MEASURE_BACKEND = "server"
+
+# viewer id -> KernelBackend, local for viewers shown with MEASURE_BACKEND == "kernel"
+KERNEL_BACKENDS = {}
+
+# viewer id -> future of its background upload (see send_backend_async)
+UPLOADS = {}
+
+UPLOADER = None
+
+# viewer that send_data updates instead of opening or looking up one, per thread
+_TARGET = threading.local()
+
+
+def set_compression(codec="auto", threshold=1024 * 1024, level=3):
+    """
+    Configure compression of the models uploaded to the server extension
+
+    Parameters:
+        codec:      "auto" (zstd if available, else lz4), "zstd", "lz4" or None to disable
+        threshold:  Payloads smaller than threshold bytes are sent uncompressed (default=1MB)
+        level:      zstd compression level (default=3)
+    """
+    COMPRESSION.update({"codec": codec, "threshold": threshold, "level": level})
+
+
+def set_mesh_encoding(encoding="quantized", max_error=0.1):
+    """
+    Configure the encoding of the meshes sent to the viewer. Quantized meshes need a
+    viewer that decodes them (int16 positions, octahedral normals, uint16 indices),
+    enabling them raises RuntimeError for viewers that cannot.
+
+    Parameters:
+        encoding:   "quantized" or None to send float32 meshes (default)
+        max_error:  Maximum position error as fraction of the linear deflection of the
+                    tessellation, meshes exceeding it are sent as float32 (default=0.1)
+    """
+    if encoding not in (None, "quantized"):
+        raise ValueError(f"Unknown mesh encoding {encoding}")
+    if encoding == "quantized":
+        require_viewer("quantized_meshes")
+    MESH_ENCODING.update({"encoding": encoding, "max_error": max_error})
+
+
+def set_measure_transport(transport="websocket"):
+    """
+    Select how measurement requests reach the server extension
+
+    Parameters:
+        transport:  "websocket" (persistent connection, falls back to http if it
+                    cannot be established) or "http" (one POST per request)
+    """
+    global MEASURE_TRANSPORT
+
+    if transport not in ("websocket", "http"):
+        raise ValueError(f"Unknown measure transport {transport}")
+    MEASURE_TRANSPORT = transport
+    if transport == "http":
+        close_channel()
+
+
+def set_measure_backend(backend="server"):
+    """
+    Select where measurements of the viewers shown from now on are computed
+
+    Parameters:
+        backend:  "server" (models are uploaded to the Jupyter server extension) or
+                  "kernel" (measurements use the shapes held by the kernel, no upload)
+    """
+    global MEASURE_BACKEND
+
+    if backend not in ("server", "kernel"):
+        raise ValueError(f"Unknown measure backend {backend}")
+    MEASURE_BACKEND = backend
+
+
+def get_channel(url):
+    """Return the measure channel, (re-)connecting if needed, None if unavailable"""
+    global CHANNEL, MEASURE_TRANSPORT
+
+    if CHANNEL is not None and not CHANNEL.closed:
+        return CHANNEL
+
+    headers = {
+        "X-Jupyter-Cadquery-Apikey": os.environ.get("JUPYTER_CADQUERY_API_KEY"),
+        "Cookie": "; ".join(f"{k}={v}" for k, v in SESSION.cookies.items()),
+    }
+    try:
+        CHANNEL = MeasureChannel(f"ws{url[4:]}/measure/ws", headers)
+    except Exception as ex:  # pylint: disable=broad-except
+        # e.g. an older server extension, do not retry on every click
+        warnings.warn(f"Measure channel not available, switching to http: {ex}")
+        MEASURE_TRANSPORT = "http"
+        CHANNEL = None
+    return CHANNEL
+
+
+def close_channel():
+    global CHANNEL
+
+    if CHANNEL is not None:
+        CHANNEL.close()
+        CHANNEL = None
+
+
 def init_session(url):
     global SESSION
     session = requests.Session()
     session.get(url)
     SESSION = session
+    KNOWN_MODELS.clear()
+    close_channel()
+
+
+def ensure_session(url):
+    # background uploads may start the session concurrently
+    with SESSION_LOCK:
+        if SESSION is None:
+            init_session(url)
+
+
+def get_session(url):
+    """The http session of the calling thread, with the cookies of SESSION"""
+    ensure_session(url)
+    shared = SESSION
+    session = getattr(_SESSIONS, "session", None)
+    if session is None or session.cookies is not shared.cookies:
+        session = requests.Session()
+        session.cookies = shared.cookies
+        _SESSIONS.session = session
+    return session
+
+
+def wait_upload(jcv_id, cancel=False):
+    """Wait for the background upload of a viewer, or cancel it if not started yet"""
+    future = UPLOADS.pop(jcv_id, None)
+    if future is None or (cancel and future.cancel()):
+        return
+    try:
+        future.result()
+    except Exception as ex:  # pylint: disable=broad-except
+        print(f"Background upload failed: {ex}")
 
 
 def send_data(data, port=None, timeit=False):
@@ -77,18 +261,80 @@ def send_data(data, port=None, timeit=False):
     if config.get("orbit_control") is not None:
         config["control"] = "orbit" if config["orbit_control"] else "trackball"
 
+    if MESH_ENCODING["encoding"] == "quantized":
+        with stage("quantize", timeit):
+            data = encode_shapes(
+                data,
+                deviation=config.get("deviation", 0.1),
+                max_error=MESH_ENCODING["max_error"],
+            )
+
     all_args = viewer_args(config)
     all_args.update(display_args(config))
-    viewer = show(
-        data,
-        title=config.get("viewer"),
-        anchor=config.get("anchor"),
-        **all_args,
-    )
-    viewer.widget.measure_callback = send_measure_request
+    chunks = take_chunks()
+    viewer = getattr(_TARGET, "viewer", None)
+    captured = getattr(_TARGET, "captured", None)
+    if captured is not None:
+        captured.update(data=data, args=viewer_args(all_args), chunks=chunks)
+        return viewer
+
+    with stage("widget_sync", timeit):
+        if viewer is not None:
+            # from the render thread of show_async, the sync runs on the kernel thread
+            in_kernel(update_viewer, viewer, data, viewer_args(all_args), chunks)
+        else:
+            with WIDGET_LOCK:
+                viewer = show(
+                    data,
+                    title=config.get("viewer"),
+                    anchor=config.get("anchor"),
+                    **all_args,
+                )
+                update_viewer(viewer, None, None, chunks)
     return viewer
 
 
+def update_viewer(viewer, data, args, chunks):
+    """Add the model data (if given) and its chunked arrays to viewer"""
+    with WIDGET_LOCK:
+        if data is not None:
+            viewer.add_shapes(data, **args)
+        send_chunks(viewer, chunks)
+        viewer.widget.measure_callback = send_measure_request
+
+
+def get_target_viewer():
+    """The viewer the show() calls of this thread update, None if show() picks it"""
+    return getattr(_TARGET, "viewer", None)
+
+
+@contextmanager
+def target_viewer(viewer):
+    """Let the show() calls of this thread in this context update viewer"""
+    previous = getattr(_TARGET, "viewer", None)
+    _TARGET.viewer = viewer
+    try:
+        yield viewer
+    finally:
+        _TARGET.viewer = previous
+
+
+@contextmanager
+def capture(viewer):
+    """
+    Collect what the show() calls of this thread in this context would send to
+    viewer (data, args and chunks of the model, model for the backend) instead of
+    sending it
+    """
+    previous = getattr(_TARGET, "captured", None)
+    _TARGET.captured = {}
+    try:
+        with target_viewer(viewer):
+            yield _TARGET.captured
+    finally:
+        _TARGET.captured = previous
+
+
 def send_command(data, port=None, title=None, timeit=False):
     """
     Send command to the viewer.
@@ -124,19 +370,155 @@ def send_backend(data, port=None, jcv_id=None, timeit=False):
 
     Called by ocp_vscode.show.show() to send model to backend
     """
+    captured = getattr(_TARGET, "captured", None)
+    if captured is not None:
+        captured["model"] = data
+        return None
+
+    # the new model replaces a pending background upload of the viewer
+    wait_upload(jcv_id, cancel=True)
+    return _send_backend(data, port=port, jcv_id=jcv_id, timeit=timeit)
+
+
+def send_backend_async(data, port=None, jcv_id=None, timeit=False):
+    """
+    Send data to the backend in a background thread, e.g. the logo of a new viewer
+
+    Later backend calls for the viewer wait for the upload (or cancel it)
+    """
+    global UPLOADER
+
+    wait_upload(jcv_id, cancel=True)
+    if UPLOADER is None:
+        UPLOADER = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="jupyter-cadquery-upload"
+        )
+    future = UPLOADER.submit(
+        _send_backend, data, port=port, jcv_id=jcv_id, timeit=timeit
+    )
+    UPLOADS[jcv_id] = future
+    future.add_done_callback(
+        lambda f: UPLOADS.pop(jcv_id) if UPLOADS.get(jcv_id) is f else None
+    )
+    return future
+
+
+def _json_reply(response):
+    """Body of a reply of the objects handler, None for other replies (e.g. HTML)"""
+    if not response.headers.get("Content-Type", "").startswith("application/json"):
+        return None
+    try:
+        result = orjson.loads(response.text)
+    except orjson.JSONDecodeError:
+        return None
+    return result if isinstance(result, dict) else None
+
+
+def _send_backend(data, port=None, jcv_id=None, timeit=False, retry=True):
+    global SERVER_CODECS
+
+    local = MEASURE_BACKEND == "kernel"
+    previous = KERNEL_BACKENDS.get(jcv_id)
+    if local and SESSION is not None and (previous is None or not previous.local):
+        # the viewer may have been shown in server mode before
+        _release_backend(jcv_id)
+    KERNEL_BACKENDS[jcv_id] = KernelBackend(jcv_id, data["model"], local=local)
+    if local:
+        return 200
+
     port = os.environ.get("JUPYTER_PORT", "8888")
     url = f"http://localhost:{port}"
 
-    if SESSION is None:
-        init_session(url)
+    session = get_session(url)
 
-    message = {
-        "_xsrf": SESSION.cookies.get("_xsrf"),
-        "apikey": os.environ.get("JUPYTER_CADQUERY_API_KEY"),
-        "viewer": jcv_id,
-        "data": orjson.dumps(data, default=json_default).decode("utf-8"),
+    # the server streams the body, hence metadata goes into query and headers
+    params = {"viewer": jcv_id, "timeit": "1" if timeit else "0"}
+    headers = {
+        "X-XSRFToken": session.cookies.get("_xsrf"),
+        "X-Jupyter-Cadquery-Apikey": os.environ.get("JUPYTER_CADQUERY_API_KEY"),
+        "Content-Type": "application/octet-stream",
     }
-    response = SESSION.post(f"{url}/objects", data=message)
+    with stage("backend_upload", timeit):
+        payload = orjson.dumps(data, default=json_default)
+        model_hash = content_hash(payload)
+        codec = None
+        if len(payload) >= COMPRESSION["threshold"]:
+            codec = choose_codec(COMPRESSION["codec"], SERVER_CODECS)
+
+        if model_hash in KNOWN_MODELS:
+            # the server has the model loaded already, only send its hash
+            params["hash"] = model_hash
+            body = b""
+        elif codec is None:
+            body = payload
+        else:
+            body = compress(payload, codec, COMPRESSION["level"])
+            params["encoding"] = codec
+            if timeit:
+                ratio = len(payload) / max(len(body), 1)
+                print(
+                    f"compression: {codec}, {len(payload)} -> {len(body)} bytes"
+                    f" (ratio {ratio:.1f})"
+                )
+        response = session.post(
+            f"{url}/objects", params=params, data=body, headers=headers
+        )
+
+    result = _json_reply(response)
+    if result is None:
+        # e.g. Jupyter's 404 page when the server extension is not loaded
+        return response.status_code
+
+    if response.status_code in (200, 404, 415):
+        SERVER_CODECS = result.get("codecs", [])
+
+    if response.status_code == 200:
+        KNOWN_MODELS.add(result.get("hash"))
+        SENT_MODELS[jcv_id] = (result.get("hash"), data)
+        add_stage("load_model", result.get("timings", {}).get("load_model"))
+    elif response.status_code == 404 and "hash" in params:
+        # the server dropped the model (e.g. after a restart), upload it once more
+        KNOWN_MODELS.discard(model_hash)
+        if retry:
+            return _send_backend(
+                data, port=port, jcv_id=jcv_id, timeit=timeit, retry=False
+            )
+    elif response.status_code == 413:
+        # measurements are not available for this model
+        print(result.get("error"))
+
+    return response.status_code
+
+
+def release_backend(jcv_id):
+    """
+    Release the backend of a closed viewer
+
+    The server drops the model when no other viewer shows it anymore
+    """
+    wait_upload(jcv_id, cancel=True)
+    return _release_backend(jcv_id)
+
+
+def _release_backend(jcv_id):
+    SENT_MODELS.pop(jcv_id, None)
+    backend = KERNEL_BACKENDS.pop(jcv_id, None)
+    if backend is not None and backend.local:
+        return 200
+
+    port = os.environ.get("JUPYTER_PORT", "8888")
+    url = f"http://localhost:{port}"
+
+    session = get_session(url)
+
+    response = session.delete(
+        f"{url}/objects",
+        params={"viewer": jcv_id},
+        headers={
+            "X-XSRFToken": session.cookies.get("_xsrf"),
+            "X-Jupyter-Cadquery-Apikey": os.environ.get("JUPYTER_CADQUERY_API_KEY"),
+        },
+    )
     return response.status_code
 
 
@@ -147,19 +529,56 @@ def send_measure_request(jcv_id, shape_ids):
     Called as callbacks by cad_viewer_widget.widget.CadViewerWidget.active_tool and
     cad_viewer_widget.widget.CadViewerWidget.selected_shape_ids to retrieve measurements
     """
+    wait_upload(jcv_id)
+    backend = KERNEL_BACKENDS.get(jcv_id)
+    if backend is not None and backend.local:
+        result = backend.measure(shape_ids)
+        return 200, orjson.dumps({"success": result}).decode("utf-8")
+
     port = os.environ.get("JUPYTER_PORT", "8888")
     url = f"http://localhost:{port}"
 
-    if SESSION is None:
-        init_session(url)
+    status, text = _measure(url, jcv_id, shape_ids)
+    sent = SENT_MODELS.get(jcv_id)
+    if sent is not None and _unknown_viewer(text):
+        # the server lost the backend, e.g. its worker was restarted after a crash
+        # or hitting the memory limit: upload the model again (not only its hash)
+        model_hash, data = sent
+        KNOWN_MODELS.discard(model_hash)
+        _send_backend(data, jcv_id=jcv_id)
+        status, text = _measure(url, jcv_id, shape_ids)
+    return status, text
+
+
+def _unknown_viewer(text):
+    try:
+        return orjson.loads(text).get("error") == "Unknown viewer"
+    except (orjson.JSONDecodeError, AttributeError):
+        return False
+
+
+def _measure(url, jcv_id, shape_ids):
+    session = get_session(url)
+
+    if MEASURE_TRANSPORT == "websocket":
+        channel = get_channel(url)
+        if channel is not None:
+            try:
+                return 200, channel.measure(jcv_id, shape_ids)
+            except (ConnectionError, FutureTimeoutError) as ex:
+                # shown once per kind of failure, the next request reconnects
+                warnings.warn(
+                    f"Measure channel failed ({type(ex).__name__}), using http"
+                )
+                close_channel()
 
     message = {
-        "_xsrf": SESSION.cookies.get("_xsrf"),
+        "_xsrf": session.cookies.get("_xsrf"),
         "apikey": os.environ.get("JUPYTER_CADQUERY_API_KEY"),
         "viewer": jcv_id,
         "data": orjson.dumps(shape_ids).decode("utf-8"),
     }
-    response = SESSION.post(f"{url}/measure", data=message)
+    response = session.post(f"{url}/measure", data=message)
     return response.status_code, response.text
 
 
@@ -180,7 +599,8 @@ def send_config(config, port=None, title=None, timeit=False):
     if cv is None:
         return
 
-    for k, v in config["config"].items():
-        if v is not None:
-            if not k in ["port", "title"]:
-                setattr(cv, k, v)
+    with WIDGET_LOCK:
+        for k, v in config["config"].items():
+            if v is not None:
+                if not k in ["port", "title"]:
+                    setattr(cv, k, v)
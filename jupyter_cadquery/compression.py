@@ -0,0 +1,157 @@
+"""Encoding of payloads between kernel and server extension"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+
+try:
+    import zstandard
+
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+try:
+    import lz4.frame
+
+    HAS_LZ4 = True
+except ImportError:
+    HAS_LZ4 = False
+
+# in order of preference
+CODECS = [
+    codec for codec, available in (("zstd", HAS_ZSTD), ("lz4", HAS_LZ4)) if available
+]
+
+
+def available_codecs():
+    return list(CODECS)
+
+
+def choose_codec(preferred, supported):
+    """Select the codec to use given the preference of the client and the server codecs"""
+    if preferred is None or supported is None:
+        return None
+    candidates = CODECS if preferred == "auto" else [preferred]
+    for codec in candidates:
+        if codec in CODECS and codec in supported:
+            return codec
+    return None
+
+
+def compress(data, codec, level=3):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    elif codec == "lz4":
+        return lz4.frame.compress(data)
+    else:
+        raise ValueError(f"Unknown codec {codec}")
+
+
+def decompress(data, codec):
+    if codec == "zstd":
+        # content size is stored in the frame header by ZstdCompressor.compress
+        return zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "lz4":
+        return lz4.frame.decompress(data)
+    else:
+        raise ValueError(f"Unknown codec {codec}")
+
+
+class PayloadTooLarge(ValueError):
+    """The decoded payload exceeds the limit of the decompressor"""
+
+
+class _Decoder:
+    def __init__(self, limit):
+        self.limit = limit
+        self.remaining = limit
+
+    def take(self, size):
+        """Account for size decoded bytes, raise if they exceed the limit"""
+        if self.remaining is None:
+            return
+        if size > self.remaining:
+            raise PayloadTooLarge(f"Decoded payload exceeds {self.limit} bytes")
+        self.remaining -= size
+
+
+class _Identity(_Decoder):
+    def decompress(self, data):
+        self.take(len(data))
+        return data
+
+
+class _Zstd(_Decoder):
+    # decompressobj has no output limit, the stream writer hands the decoded data
+    # to write() in blocks of DECOMPRESSION_RECOMMENDED_OUTPUT_SIZE instead
+    def __init__(self, limit):
+        super().__init__(limit)
+        self.parts = []
+        self.writer = zstandard.ZstdDecompressor().stream_writer(self)
+
+    def write(self, data):
+        self.take(len(data))
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def decompress(self, data):
+        self.writer.write(data)
+        result, self.parts = b"".join(self.parts), []
+        return result
+
+
+class _Lz4(_Decoder):
+    def __init__(self, limit):
+        super().__init__(limit)
+        self.decoder = lz4.frame.LZ4FrameDecompressor()
+
+    def decompress(self, data):
+        if self.remaining is None:
+            return self.decoder.decompress(data)
+        # one byte more than allowed tells an exceeded limit from an exact fit
+        result = self.decoder.decompress(data, max_length=self.remaining + 1)
+        self.take(len(result))
+        return result
+
+
+def decompressor(codec, limit=None):
+    """
+    Streaming decompressor, decompress(chunk) returns the data decoded so far.
+    It raises PayloadTooLarge as soon as more than limit bytes are decoded, at most
+    one block of output beyond the limit is ever held in memory.
+    """
+    if codec is None:
+        return _Identity(limit)
+    elif codec == "zstd":
+        return _Zstd(limit)
+    elif codec == "lz4":
+        return _Lz4(limit)
+    else:
+        raise ValueError(f"Unknown codec {codec}")
+
+
+def content_hasher():
+    """Incremental version of content_hash, call update(chunk) and hexdigest()"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def content_hash(data):
+    """Hash of the serialized model used to deduplicate uploads"""
+    hasher = content_hasher()
+    hasher.update(data)
+    return hasher.hexdigest()
@@ -0,0 +1,339 @@
+"""Quadric error decimation of very large tessellated parts"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# Vertex clustering with quadric error placement (Lindstrom 2000), vectorized:
+#
+# 1. vertices are welded across faces, so meshes converted to BReps (one face per
+#    triangle) can be decimated, too
+# 2. hard edges (open, non manifold or with a dihedral angle above feature_angle)
+#    are kept: their vertices are never merged or moved
+# 3. all other vertices are clustered on a grid, a cluster is placed at the minimum
+#    of the summed, area weighted plane quadrics of its triangles
+# 4. triangles collapsing within a cluster are dropped, the others keep their face,
+#    so triangles_per_face (face picking) stays valid. Vertices are split per face
+#    again to keep normals (and with them the shading across hard edges) per face
+# 5. a cluster is clamped to the bounding box of its vertices, which lies within
+#    one grid cell: no vertex moves more than the cell diagonal (error)
+# 6. edges of real BReps are kept. Meshes converted to BReps have one edge per
+#    triangle side, these edges and vertices are dropped with the triangles
+#
+
+import threading
+import time
+
+import numpy as np
+from cachetools import LRUCache
+from ocp_tessellate.tessellator import get_size
+
+from .compression import content_hash
+from .timing import add_stage
+
+__all__ = ["set_decimation", "get_decimation"]
+
+DECIMATION = {
+    "ratio": None,
+    "error": None,
+    "min_triangles": 100_000,
+    "feature_angle": 30,
+}
+
+# decimated meshes, keyed by the mesh content and the decimation settings
+CACHE = LRUCache(maxsize=128 * 1024 * 1024, getsizeof=get_size)
+
+# show() may run in several threads, the LRU cache reorders on every lookup
+CACHE_LOCK = threading.Lock()
+
+# bisection steps to find the cell size for a target ratio
+RATIO_STEPS = 12
+
+
+def set_decimation(ratio=None, error=None, min_triangles=100_000, feature_angle=30):
+    """
+    Decimate parts with many triangles before they are sent to the viewer
+
+    Parameters:
+        ratio:          Target fraction of the triangles to keep, e.g. 0.1
+        error:          Maximum distance a vertex may move (in model units), used
+                        instead of ratio. Both None disables decimation (default)
+        min_triangles:  Only parts with more triangles are decimated (default=100000)
+        feature_angle:  Edges with a larger dihedral angle (degrees) are kept
+                        unchanged (default=30)
+    """
+    if ratio is not None and not 0 < ratio <= 1:
+        raise ValueError("ratio needs to be in (0, 1]")
+    DECIMATION.update(
+        {
+            "ratio": ratio,
+            "error": error,
+            "min_triangles": min_triangles,
+            "feature_angle": feature_angle,
+        }
+    )
+
+
+def get_decimation():
+    """Current decimation settings"""
+    return dict(DECIMATION)
+
+
+def _weld(vertices):
+    """Ids of vertices at the same position (faces have their own vertices)"""
+    extent = np.ptp(vertices, axis=0).max() if len(vertices) > 0 else 0
+    tolerance = max(extent, 1.0) * 1e-7
+    keys = np.round(vertices / tolerance).astype(np.int64)
+    _, inverse = np.unique(keys, axis=0, return_inverse=True)
+    return inverse.ravel()
+
+
+def _hard_vertices(triangles, normals, count, feature_angle):
+    """Mask of the (welded) vertices on open, non manifold or sharp edges"""
+    edges = np.sort(triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    keys = edges[:, 0] * count + edges[:, 1]
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    _, start, counts = np.unique(keys, return_index=True, return_counts=True)
+
+    hard = counts != 2
+    manifold = np.flatnonzero(~hard)
+    t1 = order[start[manifold]] // 3
+    t2 = order[start[manifold] + 1] // 3
+    cos = np.einsum("ij,ij->i", normals[t1], normals[t2])
+    hard[manifold] = cos < np.cos(np.radians(feature_angle))
+
+    mask = np.zeros(count, dtype=bool)
+    mask[edges[order[start[hard]]].ravel()] = True
+    return mask
+
+
+def _clusters(points, hard, cell):
+    """Cluster id per welded vertex, hard vertices form their own clusters"""
+    cells = np.floor((points - points.min(axis=0)) / cell).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+    if np.prod(dims.astype(float)) < 2**62:
+        keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+        # unique negative keys for hard vertices, outside of the grid
+        keys[hard] = -1 - np.arange(np.count_nonzero(hard))
+    else:
+        keys = np.column_stack([cells, np.zeros(len(points), dtype=np.int64)])
+        keys[hard] = -1
+        keys[hard, 3] = np.arange(np.count_nonzero(hard))
+    _, inverse = np.unique(
+        keys, axis=0 if keys.ndim == 2 else None, return_inverse=True
+    )
+    return inverse.ravel()
+
+
+def _kept(clustered):
+    return (
+        (clustered[:, 0] != clustered[:, 1])
+        & (clustered[:, 1] != clustered[:, 2])
+        & (clustered[:, 2] != clustered[:, 0])
+    )
+
+
+def _place(points, triangles, clusters, hard):
+    """
+    Position of every cluster at the minimum of its quadrics, clamped to the
+    bounding box of the cluster's vertices
+    """
+    count = clusters.max() + 1
+    p0, p1, p2 = (points[triangles[:, k]] for k in range(3))
+    cross = np.cross(p1 - p0, p2 - p0)
+    area = np.linalg.norm(cross, axis=1)
+    n = cross / np.where(area == 0, 1, area)[:, None]
+    d = -np.einsum("ij,ij->i", n, p0)
+
+    # area weighted quadric (A, b) of every triangle, added to its three clusters
+    weights = (
+        np.column_stack(
+            [(n[:, :, None] * n[:, None, :]).reshape(-1, 9), n * d[:, None]]
+        )
+        * area[:, None]
+    )
+    Q = np.zeros((count, 12))
+    for corner in range(3):
+        owners = clusters[triangles[:, corner]]
+        for k in range(12):
+            Q[:, k] += np.bincount(owners, weights=weights[:, k], minlength=count)
+
+    members = np.bincount(clusters, minlength=count)
+    mean = (
+        np.column_stack(
+            [
+                np.bincount(clusters, weights=points[:, k], minlength=count)
+                for k in range(3)
+            ]
+        )
+        / np.maximum(members, 1)[:, None]
+    )
+
+    # regularized towards the mean, for flat or ill conditioned clusters
+    A = Q[:, :9].reshape(-1, 3, 3)
+    eps = 1e-3 * np.trace(A, axis1=1, axis2=2)[:, None] + 1e-12
+    A = A + eps[:, :, None] * np.eye(3)
+    rhs = -Q[:, 9:] + eps * mean
+    position = np.linalg.solve(A, rhs[:, :, None])[:, :, 0]
+
+    # the minimum can leave the cluster for nearly degenerate quadrics. Inside the
+    # bounding box of its vertices (within one grid cell) no vertex moves further
+    # than the cell diagonal
+    order = np.argsort(clusters, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(members)[:-1]])
+    lower = np.minimum.reduceat(points[order], starts, axis=0)
+    upper = np.maximum.reduceat(points[order], starts, axis=0)
+    position = np.clip(position, lower, upper)
+
+    # hard vertices keep their position
+    position[clusters[hard]] = points[hard]
+    return position
+
+
+def decimate_mesh(mesh, ratio=None, error=None, feature_angle=30):
+    """
+    Decimate a mesh of ocp_tessellate (vertices, triangles, normals and
+    triangles_per_face). Edges and vertices of meshes converted to BReps are
+    dropped, the other entries are returned unchanged
+    """
+    vertices = np.asarray(mesh["vertices"], dtype=np.float32).reshape(-1, 3)
+    triangles = np.asarray(mesh["triangles"], dtype=np.int64).reshape(-1, 3)
+    normals = np.asarray(mesh["normals"], dtype=np.float32).reshape(-1, 3)
+    per_face = np.asarray(mesh["triangles_per_face"], dtype=np.int64)
+    faces = np.repeat(np.arange(len(per_face)), per_face)
+
+    welded = _weld(vertices)
+    count = welded.max() + 1
+    points = np.zeros((count, 3))
+    points[welded] = vertices
+    wt = welded[triangles]
+
+    p0, p1, p2 = (points[wt[:, k]] for k in range(3))
+    cross = np.cross(p1 - p0, p2 - p0)
+    length = np.linalg.norm(cross, axis=1)
+    geometric = cross / np.where(length == 0, 1, length)[:, None]
+    hard = _hard_vertices(wt, geometric, count, feature_angle)
+
+    if error is not None:
+        # vertices move at most a cell diagonal
+        cell = error / np.sqrt(3)
+    else:
+        # bisect the cell size in log space for the target number of triangles
+        target = ratio * len(triangles)
+        low = np.log(np.ptp(points, axis=0).max() * 1e-6 + 1e-12)
+        high = np.log(np.ptp(points, axis=0).max() + 1e-12)
+        for _ in range(RATIO_STEPS):
+            middle = (low + high) / 2
+            clusters = _clusters(points, hard, np.exp(middle))
+            if np.count_nonzero(_kept(clusters[wt])) > target:
+                low = middle
+            else:
+                high = middle
+        cell = np.exp(high)
+
+    clusters = _clusters(points, hard, cell)
+    clustered = clusters[wt]
+    kept = _kept(clustered)
+    clustered, faces = clustered[kept], faces[kept]
+    position = _place(points, wt, clusters, hard)
+
+    # one vertex per cluster and face, with the averaged normal of that face
+    corner_faces = np.repeat(faces, 3)
+    keys = clustered.ravel() * len(per_face) + corner_faces
+    unique, inverse = np.unique(keys, return_inverse=True)
+    cluster_of = unique // len(per_face)
+
+    corner_normals = normals[triangles[kept]].reshape(-1, 3)
+    new_normals = np.column_stack(
+        [
+            np.bincount(inverse, weights=corner_normals[:, k], minlength=len(unique))
+            for k in range(3)
+        ]
+    )
+    norm = np.linalg.norm(new_normals, axis=1, keepdims=True)
+    new_normals /= np.where(norm == 0, 1, norm)
+
+    result = dict(mesh)
+    result["vertices"] = position[cluster_of].astype(np.float32).ravel()
+    result["normals"] = new_normals.astype(np.float32).ravel()
+    result["triangles"] = inverse.astype(np.int32).ravel()
+    result["triangles_per_face"] = np.bincount(faces, minlength=len(per_face)).astype(
+        np.int32
+    )
+    if 2 * len(per_face) > len(triangles):
+        # a mesh converted to a BRep: its edges are the sides of the triangles
+        result["edges"] = np.empty(0, dtype=np.float32)
+        result["edge_types"] = np.empty(0, dtype=np.int32)
+        result["segments_per_edge"] = np.empty(0, dtype=np.int32)
+        result["obj_vertices"] = np.empty(0, dtype=np.float32)
+    return result
+
+
+def _key(mesh):
+    vertices = np.ascontiguousarray(mesh["vertices"], dtype=np.float32)
+    triangles = np.ascontiguousarray(mesh["triangles"], dtype=np.int32)
+    return (
+        content_hash(memoryview(vertices).cast("B"))
+        + content_hash(memoryview(triangles).cast("B")),
+        DECIMATION["ratio"],
+        DECIMATION["error"],
+        DECIMATION["feature_angle"],
+    )
+
+
+def decimate(meshes):
+    """Decimate the meshes with more than min_triangles triangles, cached"""
+    result = []
+    for mesh in meshes:
+        if len(mesh["triangles"]) // 3 <= DECIMATION["min_triangles"]:
+            result.append(mesh)
+            continue
+
+        key = _key(mesh)
+        with CACHE_LOCK:
+            decimated_mesh = CACHE.get(key)
+        if decimated_mesh is None:
+            decimated_mesh = decimate_mesh(
+                mesh,
+                ratio=DECIMATION["ratio"],
+                error=DECIMATION["error"],
+                feature_angle=DECIMATION["feature_angle"],
+            )
+            with CACHE_LOCK:
+                CACHE[key] = decimated_mesh
+        result.append(decimated_mesh)
+    return result
+
+
+def decimated(func):
+    """Wrap tessellate_group to decimate its meshed instances"""
+    if getattr(func, "_jcq_decimate", False):
+        return func
+
+    def wrapper(*args, **kwargs):
+        instances, shapes, mapping = func(*args, **kwargs)
+        if DECIMATION["ratio"] is None and DECIMATION["error"] is None:
+            return instances, shapes, mapping
+
+        start = time.perf_counter()
+        try:
+            return decimate(instances), shapes, mapping
+        finally:
+            add_stage("decimation", time.perf_counter() - start)
+
+    wrapper._jcq_decimate = True
+    return wrapper
@@ -0,0 +1,328 @@
+"""Face level tessellation cache, reused across edits of a shape"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# The tessellation cache of ocp_tessellate is keyed by the whole shape, so a fillet
+# re-tessellates every face of a solid. With the face cache, a shape missing in that
+# cache is tessellated face by face:
+#
+# 1. a face is looked up by its TShape and location (faces kept by the modelling
+#    operation), then by a hash of its geometry (surface type, orientation, uv
+#    bounds, bounding box and vertices, for shapes rebuilt from scratch). Both keys
+#    include the tolerances
+# 2. only the missing faces are meshed, as one compound
+# 3. the face meshes are joined in face order, edges are discretized from their
+#    curves, as the mesh of the edges of cached faces may not exist anymore
+#
+# Faces meshed in different runs may not share the nodes of their common edges.
+#
+# The LRU caches reorder on every lookup, so they (and the tessellation cache of
+# ocp_tessellate, which the wrapper manages instead of its unlocked decorator) are
+# only accessed under CACHE_LOCK. Meshing runs outside the lock.
+#
+
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from cachetools import LRUCache
+from OCP.Bnd import Bnd_Box
+from OCP.BRep import BRep_Builder, BRep_Tool
+from OCP.BRepBndLib import BRepBndLib
+from OCP.BRepGProp import BRepGProp_Face
+from OCP.BRepMesh import BRepMesh_IncrementalMesh
+from OCP.BRepTools import BRepTools
+from OCP.gp import gp_Pnt, gp_Vec
+from OCP.TopAbs import TopAbs_Orientation
+from OCP.TopLoc import TopLoc_Location
+from OCP.TopoDS import TopoDS_Compound
+from ocp_tessellate.ocp_utils import (
+    get_edges,
+    get_face_type,
+    get_faces,
+    get_point,
+    get_vertices,
+)
+from ocp_tessellate.tessellator import cache, discretize_edges, get_size, make_key
+
+__all__ = ["set_face_cache", "get_face_cache_stats"]
+
+FACE_CACHE = {"enabled": False}
+
+# (TShape and location, orientation, tolerances) -> (face, mesh)
+SHAPES = LRUCache(maxsize=128 * 1024 * 1024, getsizeof=lambda v: get_size(v[1]))
+
+# (geometry hash, tolerances) -> mesh
+GEOMETRY = LRUCache(maxsize=128 * 1024 * 1024, getsizeof=get_size)
+
+# guards SHAPES, GEOMETRY and ocp_tessellate's cache
+CACHE_LOCK = threading.Lock()
+
+# counts of the running (stats) and the last show() (last), per thread
+_LOCAL = threading.local()
+
+
+def set_face_cache(enabled=True, size_mb=256):
+    """
+    Tessellate shapes face by face and reuse the meshes of unchanged faces when a
+    shape changed, e.g. after a fillet
+
+    Parameters:
+        enabled:  Use the face cache (default=True)
+        size_mb:  Size of the cache in MB, half for each key type (default=256)
+    """
+    global SHAPES, GEOMETRY
+
+    FACE_CACHE["enabled"] = enabled
+    size = size_mb * 1024 * 1024 // 2
+    with CACHE_LOCK:
+        if size != GEOMETRY.maxsize:
+            SHAPES = LRUCache(maxsize=size, getsizeof=lambda v: get_size(v[1]))
+            GEOMETRY = LRUCache(maxsize=size, getsizeof=get_size)
+
+
+def get_face_cache_stats():
+    """Faces taken from the face cache and meshed in the last show() of this thread"""
+    stats = getattr(_LOCAL, "last", None) or {"hits": 0, "misses": 0}
+    total = stats["hits"] + stats["misses"]
+    return {**stats, "hit_rate": stats["hits"] / total if total else None}
+
+
+@contextmanager
+def face_stats():
+    """Count the faces of the show() call of this thread in this context"""
+    outer = getattr(_LOCAL, "stats", None)
+    if outer is not None:
+        # nested show calls are counted by the outer one
+        yield outer
+        return
+
+    stats = _LOCAL.stats = {"hits": 0, "misses": 0}
+    try:
+        yield stats
+    finally:
+        _LOCAL.stats = None
+        _LOCAL.last = stats
+
+
+def _fingerprint(face):
+    """Hash of the geometry of face, independent of its TShape"""
+    box = Bnd_Box()
+    BRepBndLib.Add_s(face, box, False)
+    values = [
+        get_face_type(face),
+        int(face.Orientation()),
+        *BRepTools.UVBounds_s(face),
+        *box.Get(),
+    ]
+    for vertex in get_vertices(face):
+        values.extend(get_point(vertex))
+    rounded = np.round(np.asarray(values, dtype=np.float64), 9)
+    return hashlib.sha1(rounded.tobytes()).hexdigest()
+
+
+def _empty():
+    return {
+        "vertices": np.empty((0, 3), dtype=np.float32),
+        "triangles": np.empty((0, 3), dtype=np.int32),
+        "normals": np.empty((0, 3), dtype=np.float32),
+    }
+
+
+def _mesh(face):
+    """Vertices, triangles (face local) and normals of the triangulation of face"""
+    loc = TopLoc_Location()
+    poly = BRep_Tool.Triangulation_s(face, loc)
+    if poly is None:
+        return _empty()
+
+    trsf = loc.Transformation()
+    nodes = range(1, poly.NbNodes() + 1)
+    vertices = np.array(
+        [poly.Node(i).Transformed(trsf).Coord() for i in nodes], dtype=np.float32
+    )
+    triangles = (
+        np.array(
+            [poly.Triangle(i).Get() for i in range(1, poly.NbTriangles() + 1)],
+            dtype=np.int32,
+        ).reshape(-1, 3)
+        - 1
+    )
+    if face.Orientation() == TopAbs_Orientation.TopAbs_REVERSED:
+        triangles = triangles[:, [0, 2, 1]]
+
+    if poly.HasUVNodes():
+        prop = BRepGProp_Face(face)
+        p_buf, n_buf = gp_Pnt(), gp_Vec()
+        normals = []
+        for i in nodes:
+            prop.Normal(*poly.UVNode(i).Coord(), p_buf, n_buf)
+            if n_buf.SquareMagnitude() > 0:
+                n_buf.Normalize()
+            normals.append(n_buf.Coord())
+        normals = np.array(normals, dtype=np.float32)
+        if face.Orientation() == TopAbs_Orientation.TopAbs_INTERNAL:
+            normals = -normals
+    else:
+        p0, p1, p2 = (vertices[triangles[:, k]] for k in range(3))
+        cross = np.cross(p1 - p0, p2 - p0)
+        normals = np.column_stack(
+            [
+                np.bincount(
+                    triangles.ravel(),
+                    weights=np.repeat(cross[:, k], 3),
+                    minlength=len(vertices),
+                )
+                for k in range(3)
+            ]
+        )
+        norm = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals = (normals / np.where(norm == 0, 1, norm)).astype(np.float32)
+
+    return {"vertices": vertices, "triangles": triangles, "normals": normals}
+
+
+def _join(faces, meshes):
+    if not meshes:
+        meshes = [_empty()]
+    offsets = np.cumsum([0] + [len(m["vertices"]) for m in meshes[:-1]])
+    return {
+        "vertices": np.concatenate([m["vertices"] for m in meshes]).ravel(),
+        "triangles": np.concatenate(
+            [m["triangles"] + offset for m, offset in zip(meshes, offsets)]
+        )
+        .astype(np.int32)
+        .ravel(),
+        "normals": np.concatenate([m["normals"] for m in meshes]).ravel(),
+        "face_types": np.array([get_face_type(f) for f in faces], dtype=np.int32),
+        "triangles_per_face": np.array(
+            [len(m["triangles"]) for m in meshes[: len(faces)]], dtype=np.int32
+        ),
+    }
+
+
+def tessellate_faces(shape, quality, angular_tolerance, compute_edges=True):
+    """
+    Tessellate shape like ocp_tessellate's tessellate, with the meshes of its faces
+    taken from the face cache where possible. Returns the mesh and the number of
+    cached and meshed faces.
+    """
+    faces = list(get_faces(shape))
+    tolerances = (quality, angular_tolerance)
+    meshes, missing = [None] * len(faces), []
+    for i, face in enumerate(faces):
+        with CACHE_LOCK:
+            entry = SHAPES.get((hash(face), int(face.Orientation()), *tolerances))
+        if entry is not None and entry[0].IsEqual(face):
+            meshes[i] = entry[1]
+            continue
+
+        key = (_fingerprint(face), *tolerances)
+        with CACHE_LOCK:
+            meshes[i] = GEOMETRY.get(key)
+        if meshes[i] is None:
+            missing.append((i, key))
+
+    if missing:
+        builder, compound = BRep_Builder(), TopoDS_Compound()
+        builder.MakeCompound(compound)
+        for i, _ in missing:
+            builder.Add(compound, faces[i])
+        BRepMesh_IncrementalMesh(compound, quality, False, angular_tolerance, True)
+        for i, key in missing:
+            meshes[i] = _mesh(faces[i])
+
+    with CACHE_LOCK:
+        for i, key in missing:
+            GEOMETRY[key] = meshes[i]
+        for face, mesh in zip(faces, meshes):
+            SHAPES[(hash(face), int(face.Orientation()), *tolerances)] = (face, mesh)
+
+    result = _join(faces, meshes)
+    if compute_edges:
+        edges = discretize_edges([e for e, _ in get_edges(shape, True)], quality)
+        del edges["obj_vertices"]
+    else:
+        edges = {
+            "edges": np.empty(0, dtype=np.float32),
+            "edge_types": np.empty(0, dtype=np.int32),
+            "segments_per_edge": np.empty(0, dtype=np.int32),
+        }
+    obj_vertices = [get_point(v) for v in get_vertices(shape)]
+
+    return (
+        {
+            **result,
+            **edges,
+            "obj_vertices": np.asarray(obj_vertices, dtype=np.float32).ravel(),
+        },
+        len(faces) - len(missing),
+        len(missing),
+    )
+
+
+def face_cached(func):
+    """
+    Wrap ocp_tessellate's tessellate to tessellate missing shapes face by face, with
+    its cache accessed under CACHE_LOCK
+    """
+    if getattr(func, "_jcq_faces", False):
+        return func
+
+    # tessellate without the (unlocked) cachetools decorator
+    uncached = getattr(func, "__wrapped__", func)
+
+    def wrapper(shape, cache_key, deviation, quality, angular_tolerance, **kwargs):
+        args = (shape, cache_key, deviation, quality, angular_tolerance)
+        with CACHE_LOCK:
+            # reports "c" to progress for cached shapes
+            key = make_key(*args, **kwargs)
+            mesh = cache.get(key)
+        if mesh is not None:
+            return mesh
+
+        if (
+            not FACE_CACHE["enabled"]
+            or isinstance(shape, (list, tuple))
+            or not kwargs.get("compute_faces", True)
+        ):
+            mesh = uncached(*args, **kwargs)
+        else:
+            mesh, hits, misses = tessellate_faces(
+                shape, quality, angular_tolerance, kwargs.get("compute_edges", True)
+            )
+            stats = getattr(_LOCAL, "stats", None)
+            if stats is not None:
+                stats["hits"] += hits
+                stats["misses"] += misses
+
+            progress = kwargs.get("progress")
+            if progress is not None:
+                # c: faces from the face cache, +: faces meshed
+                if hits:
+                    progress.update("c")
+                if misses:
+                    progress.update("+")
+
+        with CACHE_LOCK:
+            cache[key] = mesh
+        return mesh
+
+    wrapper._jcq_faces = True
+    return wrapper
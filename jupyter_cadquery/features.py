@@ -0,0 +1,56 @@
+"""Payload formats that need support in the viewer"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# Some payload formats are ready on the kernel side before cad-viewer-widget can
+# draw them. VIEWER_FEATURES maps each to the first cad_viewer_widget version that
+# does, None while no released viewer does. The setters enabling a format call
+# require_viewer, so a model is never sent in a format the installed viewer
+# cannot draw.
+#
+
+import re
+
+from cad_viewer_widget import __version__ as VIEWER_VERSION
+
+# feature -> (what the viewer has to do, first cad_viewer_widget version doing it)
+VIEWER_FEATURES = {
+    "quantized_meshes": ("decode quantized meshes (see quantize.py)", None),
+    "merged_meshes": ("draw merged meshes (see merge.py)", None),
+    "array_chunks": ("reassemble chunked arrays (see arrays.py)", None),
+    "vertex_colors": ("draw vertex colors (see arrays.py)", None),
+}
+
+
+def _version(version):
+    return tuple(int(part) for part in re.findall(r"\d+", version)[:3])
+
+
+def viewer_supports(feature, version=VIEWER_VERSION):
+    """True if cad_viewer_widget of version draws payloads with feature"""
+    _, minimum = VIEWER_FEATURES[feature]
+    return minimum is not None and _version(version) >= _version(minimum)
+
+
+def require_viewer(feature):
+    """Raise RuntimeError if the installed cad_viewer_widget cannot draw feature"""
+    if not viewer_supports(feature):
+        what, _ = VIEWER_FEATURES[feature]
+        raise RuntimeError(
+            f"The viewer needs to {what}, cad_viewer_widget {VIEWER_VERSION} cannot"
+        )
@@ -0,0 +1,207 @@
+"""Parametric models re-rendered from interactive controls"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# interactive_show(builder, **params) shows builder(**params) in one viewer and
+# re-renders it when a control changes:
+#
+# 1. throttle: the first change schedules a render after `wait` seconds on the
+#    kernel's IOLoop, later changes only replace the pending values. Values in
+#    between are never built
+# 2. the render runs in the render thread of show_async (one slot per interactive
+#    view), a newer render cancels the one in flight
+# 3. show() runs with comms.capture, the viewer payload (data, args, chunks and the
+#    backend model) is kept in an LRU cache by the values of the controls. Going
+#    back to cached values skips building, tessellation and serialization
+# 4. a payload equal to the one in the viewer is not sent again, others replace
+#    the model with the camera kept. Unchanged parts of a changed model come from
+#    the tessellation and face caches
+#
+# cad_viewer_widget can only replace the whole model, so changed parts cannot be
+# sent on their own.
+#
+
+import asyncio
+import hashlib
+from concurrent.futures import CancelledError
+
+import numpy as np
+from cachetools import LRUCache
+from IPython.display import display
+from ipywidgets import interactive
+from ocp_vscode.config import Camera
+
+from .comms import capture, send_backend_async, update_viewer
+from .jobs import in_kernel, schedule, submit, supersede
+
+__all__ = ["interactive_show"]
+
+
+def _digest(value, md5=None):
+    """Hash of a viewer payload (nested dicts, lists, arrays and scalars)"""
+    if md5 is None:
+        md5 = hashlib.md5()
+    if isinstance(value, dict):
+        for key in sorted(value, key=str):
+            md5.update(repr(key).encode())
+            _digest(value[key], md5)
+    elif isinstance(value, (list, tuple)):
+        md5.update(b"[")
+        for item in value:
+            _digest(item, md5)
+        md5.update(b"]")
+    elif isinstance(value, np.ndarray):
+        md5.update(f"{value.dtype}{value.shape}".encode())
+        md5.update(np.ascontiguousarray(value).data)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        md5.update(value)
+    else:
+        md5.update(repr(value).encode())
+    return md5
+
+
+def _key(params):
+    return repr(sorted(params.items()))
+
+
+class InteractiveShow:
+    """Controls of a parametric model and the viewer it is rendered into"""
+
+    def __init__(self, builder, params, wait=0.2, cache_size=32, show_args=None):
+        self.builder = builder
+        self.wait = wait
+        self.show_args = {} if show_args is None else dict(show_args)
+        self.cache = LRUCache(maxsize=cache_size)
+        self.viewer = None
+        self.slot = None
+        self.pending = None
+        self.scheduled = False
+        self.shown = None  # digest of the payload in the viewer
+        self.error = None
+        self.controls = interactive(self.changed, **params)
+
+    def start(self, viewer):
+        """Render the current values of the controls into viewer"""
+        self.viewer = viewer
+        self.slot = f"interactive:{viewer.widget.id}"
+        self.changed(**self.controls.kwargs)
+
+    def changed(self, **params):
+        """Callback of the controls"""
+        self.pending = params
+        if self.viewer is not None and not self.scheduled:
+            self.scheduled = True
+            schedule(self.flush, self.wait)
+
+    def flush(self):
+        """Render the latest values of the controls"""
+        params, self.pending, self.scheduled = self.pending, None, False
+        if params is None:
+            return
+
+        key = _key(params)
+        entry = self.cache.get(key)
+        if entry is not None:
+            # the render in flight is for older values
+            supersede(self.slot)
+            self.apply(key, entry)
+        else:
+            future = submit(self.slot, self.render, key, params)
+            future.add_done_callback(self.done)
+
+    def render(self, key, params):
+        """Build and convert the model for params, runs in the render thread"""
+        # pylint: disable=import-outside-toplevel,cyclic-import
+        from .show import show
+
+        cad_objs = self.builder(**params)
+        if not isinstance(cad_objs, tuple):
+            cad_objs = (cad_objs,)
+        args = dict(self.show_args)
+        if self.shown is not None:
+            args.setdefault("reset_camera", Camera.KEEP)
+        with capture(self.viewer) as captured:
+            show(*cad_objs, **args)
+
+        entry = dict(captured, digest=_digest(captured.get("data")).hexdigest())
+        in_kernel(self.apply, key, entry)
+        return self.viewer
+
+    def apply(self, key, entry):
+        """Send a rendered payload to the viewer, on the kernel thread"""
+        self.cache[key] = entry
+        self.error = None
+        if entry["digest"] == self.shown:
+            return
+
+        args = entry["args"]
+        if self.shown is not None:
+            args = dict(args, reset_camera=Camera.KEEP.value)
+        update_viewer(self.viewer, entry["data"], args, entry["chunks"])
+        if entry.get("model") is not None:
+            send_backend_async(entry["model"], jcv_id=self.viewer.widget.id)
+        self.shown = entry["digest"]
+
+    def done(self, future):
+        try:
+            future.result()
+        except (CancelledError, asyncio.CancelledError):
+            pass
+        except Exception as ex:  # pylint: disable=broad-except
+            self.error = ex
+            with self.controls.out:
+                print(f"Render failed: {ex!r}")
+
+
+def interactive_show(
+    builder,
+    viewer=None,
+    anchor=None,
+    cad_width=None,
+    height=None,
+    wait=0.2,
+    cache_size=32,
+    show_args=None,
+    **params,
+):
+    """
+    Show builder(**params) with ipywidgets controls for params and re-render the
+    model into the same viewer when they change.
+
+    Parameters:
+        builder:     Function returning the CAD object (or a tuple of them) for params
+        viewer:      Sidecar title, None or "" for a viewer in the cell output
+        anchor, cad_width, height: see show()
+        wait:        Render at most every wait seconds while a control is moved,
+                     with its latest value (default=0.2)
+        cache_size:  Number of rendered parameter sets to keep (default=32)
+        show_args:   Dict of further show() arguments, e.g. {"deviation": 0.5}
+        **params:    Controls, as abbreviations of ipywidgets.interact, e.g.
+                     height=(1, 10, 0.5) or widgets
+
+    Returns: The InteractiveShow with the controls (.controls) and viewer (.viewer)
+    """
+    # pylint: disable=import-outside-toplevel,cyclic-import
+    from .show import open_target
+
+    view = InteractiveShow(builder, params, wait, cache_size, show_args)
+    display(view.controls)
+    layout = dict(anchor=anchor, cad_width=cad_width, height=height)
+    _, target = open_target(viewer, layout)
+    view.start(target)
+    return view
@@ -0,0 +1,177 @@
+"""Background rendering for show_async with cancellation of superseded renders"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# A render job runs show() in the render thread. Every show_async to a viewer slot
+# (the sidecar title, "" for cell viewers) increments the generation of the slot, a
+# job of an older generation stops at its next checkpoint (before conversion,
+# tessellation of a shape and serialization, see cancellable). Widgets are only
+# touched on the kernel thread: the render thread schedules the widget sync on the
+# kernel's IOLoop and never waits for it. The state of a conversion is per thread,
+# so renders do not block show() calls on the kernel thread.
+#
+
+import asyncio
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+
+# viewer slot -> generation of the last show_async
+GENERATIONS = {}
+
+RENDERER = None
+
+_LOCAL = threading.local()
+
+
+class Superseded(CancelledError):
+    """A newer show_async to the same viewer replaced this render"""
+
+
+class RenderJob:
+    """A show_async call, rendered in the background"""
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.generation = supersede(slot)
+        self.future = Future()
+
+    def superseded(self):
+        return GENERATIONS.get(self.slot) != self.generation
+
+    def check(self):
+        if self.superseded():
+            raise Superseded(f"show_async superseded for viewer '{self.slot}'")
+
+
+def supersede(slot):
+    """Cancel the render in flight for the viewer slot, returns the new generation"""
+    GENERATIONS[slot] = GENERATIONS.get(slot, 0) + 1
+    return GENERATIONS[slot]
+
+
+def schedule(callback, delay=None):
+    """
+    Run callback on the kernel's IOLoop (after delay seconds), or right away outside
+    of a kernel
+    """
+    try:
+        # pylint: disable=import-outside-toplevel
+        from IPython import get_ipython
+
+        io_loop = get_ipython().kernel.io_loop
+    except AttributeError:
+        callback()
+    else:
+        # widgets have to be created on the kernel thread, hence the IOLoop
+        if delay is None:
+            io_loop.add_callback(callback)
+        else:
+            io_loop.call_later(delay, callback)
+
+
+def current_job():
+    """The render job of the calling thread, None outside of the render thread"""
+    return getattr(_LOCAL, "job", None)
+
+
+def check():
+    """Stop the render of the calling thread if a newer one was started"""
+    job = current_job()
+    if job is not None:
+        job.check()
+
+
+def cancellable(func):
+    """Wrap a conversion step to check for superseded renders before it runs"""
+    if getattr(func, "_jcq_cancellable", False):
+        return func
+
+    def wrapper(*args, **kwargs):
+        check()
+        return func(*args, **kwargs)
+
+    wrapper._jcq_cancellable = True
+    return wrapper
+
+
+def in_kernel(func, *args, **kwargs):
+    """Call func on the kernel thread, scheduled without waiting from a render job"""
+    job = current_job()
+    if job is None:
+        return func(*args, **kwargs)
+
+    def callback():
+        if not job.superseded() and not job.future.done():
+            try:
+                func(*args, **kwargs)
+            except Exception as ex:  # pylint: disable=broad-except
+                job.future.set_exception(ex)
+
+    schedule(callback)
+    return None
+
+
+def _finish(job, viewer, error):
+    if job.future.done():
+        return
+    if error is not None:
+        job.future.set_exception(error)
+    elif job.superseded():
+        job.future.set_exception(Superseded())
+    else:
+        job.future.set_result(viewer)
+
+
+def _render(job, func, args, kwargs):
+    if not job.future.set_running_or_notify_cancel():
+        return
+
+    viewer, error = None, None
+    _LOCAL.job = job
+    try:
+        job.check()
+        viewer = func(*args, **kwargs)
+    except BaseException as ex:  # pylint: disable=broad-except
+        error = ex
+    finally:
+        _LOCAL.job = None
+
+    # after the widget sync callbacks of this job
+    schedule(lambda: _finish(job, viewer, error))
+
+
+def submit(slot, func, *args, **kwargs):
+    """
+    Run func (a show function for the viewer slot) in the render thread. Returns an awaitable
+    future of its result when called from a running event loop, else a
+    concurrent.futures.Future.
+    """
+    global RENDERER
+
+    if RENDERER is None:
+        RENDERER = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="jupyter-cadquery-render"
+        )
+
+    job = RenderJob(slot)
+    RENDERER.submit(_render, job, func, args, kwargs)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return job.future
+    return asyncio.wrap_future(job.future, loop=loop)
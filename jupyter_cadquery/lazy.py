@@ -0,0 +1,229 @@
+"""Lazy loading of subtrees, tessellated when they are shown in the viewer"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# show(..., lazy=True) replaces the groups below the root (lazy=[paths]: the given
+# groups) by a placeholder, the bounding box of the group with hidden faces. Only
+# the outline is drawn and nothing of the group is tessellated or sent. The viewer
+# reports visibility changes (widget.states) back to the kernel: switching on the
+# faces of a placeholder shows the model again into the same viewer with this group
+# loaded and the camera kept. Tree expansion is not reported by the viewer, so it
+# cannot trigger loading.
+#
+
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from OCP.BRepPrimAPI import BRepPrimAPI_MakeBox
+from OCP.gp import gp_Pnt
+from ocp_tessellate.cad_objects import OcpGroup, OcpObject
+from ocp_tessellate.defaults import get_default
+from ocp_tessellate.ocp_utils import BoundingBox
+
+# lazy argument of the running show() call and the placeholders it created
+# (path -> placeholder), per thread
+_LOCAL = threading.local()
+
+# viewer id -> LazyModel of the last show() into the viewer, shows from other
+# threads and the states callbacks of the kernel thread access it under MODELS_LOCK
+MODELS = {}
+MODELS_LOCK = threading.Lock()
+
+
+class LazyModel:
+    """Objects and arguments of a show() call with placeholders for lazy groups"""
+
+    def __init__(self, cad_objs, kwargs, paths):
+        self.cad_objs = cad_objs
+        self.kwargs = kwargs
+        self.paths = set(paths)
+
+
+@contextmanager
+def lazy_subtrees(lazy):
+    """Replace the lazy groups of the show() calls in this context by placeholders"""
+    previous = getattr(_LOCAL, "lazy", None), getattr(_LOCAL, "placeholders", None)
+    _LOCAL.lazy, _LOCAL.placeholders = lazy, {}
+    try:
+        yield _LOCAL.placeholders
+    finally:
+        _LOCAL.lazy, _LOCAL.placeholders = previous
+
+
+def _root(group):
+    # ocp_vscode uses the only group below the root as root
+    if len(group.objects) == 1 and isinstance(group.objects[0], OcpGroup):
+        return group.objects[0]
+    return group
+
+
+def _bounds(group, loc, instances, boxes):
+    for obj in group.objects:
+        obj_loc = (
+            loc if obj.loc is None else (obj.loc if loc is None else loc * obj.loc)
+        )
+        if isinstance(obj, OcpGroup):
+            _bounds(obj, obj_loc, instances, boxes)
+        else:
+            shape = instances[obj.ref]["obj"] if obj.ref is not None else obj.obj
+            if isinstance(shape, (list, tuple)):
+                boxes.extend(
+                    BoundingBox(s if obj_loc is None else s.Moved(obj_loc))
+                    for s in shape
+                )
+            elif shape is not None:
+                boxes.append(
+                    BoundingBox(shape if obj_loc is None else shape.Moved(obj_loc))
+                )
+    return boxes
+
+
+def _placeholder(group, instances):
+    """Outline of the bounding box of group, in the frame of the group"""
+    boxes = [b for b in _bounds(group, None, instances, []) if b.xmax >= b.xmin]
+    if not boxes:
+        return None
+
+    lower = [min(getattr(b, f"{a}min") for b in boxes) for a in "xyz"]
+    upper = [max(getattr(b, f"{a}max") for b in boxes) for a in "xyz"]
+    size = [max(u - l, 1e-6) for l, u in zip(lower, upper)]
+    box = BRepPrimAPI_MakeBox(gp_Pnt(*lower), *size).Shape()
+
+    key = hashlib.sha256(repr((lower, upper)).encode()).hexdigest()
+    instances.append({"obj": box, "cache_id": f"lazy:{key}", "name": group.name})
+    return OcpObject(
+        "solid",
+        ref=len(instances) - 1,
+        cache_id=f"lazy:{key}",
+        name=group.name,
+        loc=group.loc,
+        color=get_default("default_color"),
+        show_faces=False,
+        show_edges=True,
+    )
+
+
+def _replace(group, path, depth, instances, lazy, placeholders):
+    for i, obj in enumerate(group.objects):
+        if not isinstance(obj, OcpGroup):
+            continue
+        obj_path = f"{path}/{obj.name}"
+        if (lazy is True and depth == 1) or (
+            isinstance(lazy, (list, tuple, set)) and obj_path in lazy
+        ):
+            placeholder = _placeholder(obj, instances)
+            if placeholder is not None:
+                group.objects[i] = placeholder
+                placeholders[obj_path] = placeholder
+        else:
+            _replace(obj, obj_path, depth + 1, instances, lazy, placeholders)
+
+
+def _refs(group, result):
+    for obj in group.objects:
+        if isinstance(obj, OcpGroup):
+            _refs(obj, result)
+        elif obj.ref is not None:
+            result.append(obj)
+    return result
+
+
+def apply_lazy(group, instances, lazy, placeholders):
+    """Replace the lazy groups by placeholders and drop the instances only they use"""
+    root = _root(group)
+    _replace(root, f"/{root.name}", 1, instances, lazy, placeholders)
+    if not placeholders:
+        return group, instances
+
+    objs = _refs(group, [])
+    used = sorted({obj.ref for obj in objs})
+    renumber = {old: new for new, old in enumerate(used)}
+    for obj in objs:
+        obj.ref = renumber[obj.ref]
+    return group, [instances[i] for i in used]
+
+
+def lazy(func):
+    """Wrap to_ocpgroup to replace lazy groups of the running show() by placeholders"""
+    if getattr(func, "_jcq_lazy", False):
+        return func
+
+    def wrapper(*args, **kwargs):
+        group, instances = func(*args, **kwargs)
+        lazy = getattr(_LOCAL, "lazy", None)
+        if lazy:
+            group, instances = apply_lazy(group, instances, lazy, _LOCAL.placeholders)
+        return group, instances
+
+    wrapper._jcq_lazy = True
+    return wrapper
+
+
+def register(viewer, cad_objs, kwargs, placeholders):
+    """Load the groups behind the placeholders when they are shown in viewer"""
+    widget = viewer.widget
+    with MODELS_LOCK:
+        if not placeholders:
+            MODELS.pop(widget.id, None)
+            return
+
+        MODELS[widget.id] = LazyModel(cad_objs, kwargs, placeholders)
+        observe = not getattr(widget, "_jcq_lazy", False)
+        widget._jcq_lazy = True
+    if observe:
+        widget.observe(lambda change: _on_states(viewer, change), names="states")
+
+
+def _on_states(viewer, change):
+    with MODELS_LOCK:
+        model = MODELS.get(viewer.widget.id)
+    states = change["new"] or {}
+    if model is None:
+        return
+
+    shown = {p for p in model.paths if (states.get(p) or (0,))[0] == 1}
+    if shown:
+        load(viewer, shown, states)
+
+
+def load(viewer, paths, states=None):
+    """Tessellate and show the lazy groups at paths in viewer"""
+    # pylint: disable=import-outside-toplevel,cyclic-import
+    from ocp_vscode.config import Camera
+
+    from .comms import target_viewer
+    from .show import show
+
+    with MODELS_LOCK:
+        model = MODELS[viewer.widget.id]
+    remaining = model.paths - set(paths)
+    kwargs = {**model.kwargs, "reset_camera": Camera.KEEP}
+    with target_viewer(viewer):
+        show(*model.cad_objs, lazy=sorted(remaining) or None, **kwargs)
+
+    # keep what the user switched on or off
+    if states:
+        viewer.update_states({k: tuple(v) for k, v in states.items() if k not in paths})
+
+
+def get_lazy_paths(viewer):
+    """Paths of the groups of viewer that are not loaded yet"""
+    with MODELS_LOCK:
+        model = MODELS.get(viewer.widget.id)
+    return [] if model is None else sorted(model.paths)
@@ -0,0 +1,498 @@
+"""Batch measurements without the viewer UI"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import fnmatch
+import multiprocessing
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+try:
+    import pandas as pd
+
+    HAS_PANDAS = True
+except ImportError:
+    HAS_PANDAS = False
+
+from cad_viewer_widget import get_sidecar
+from ocp_tessellate.cad_objects import OcpGroup
+from ocp_tessellate.convert import to_ocpgroup
+from ocp_tessellate.ocp_utils import deserialize, get_curve, get_surface, serialize
+from ocp_vscode.backend import ViewerBackend
+from ocp_vscode.build123d import Compound, Edge, Face, Plane, Solid, Vertex
+
+from .backend import build_model
+from .comms import KERNEL_BACKENDS
+from .spatial import (
+    ShapeIndex,
+    bounding_box,
+    box_distance,
+    close_pairs,
+    common_volume,
+    index_distance,
+)
+
+__all__ = ["interference_check", "measure_batch", "shape_ids"]
+
+KINDS = ("distance", "min_distance", "angle", "properties")
+
+CONICS = ("CIRCLE", "ELLIPSE")
+
+PROPERTIES = ("volume", "area", "length", "width", "radius", "radius2")
+
+# exact distance batches below this size are not worth starting processes (each
+# spawned worker imports jupyter_cadquery and OCP, i.e. seconds)
+POOL_THRESHOLD = 1000
+
+# distances up to this are contact, interferences have a common volume above it
+CONTACT_TOLERANCE = 1e-6
+
+# KernelBackend of a viewer -> MeasureModel, dropped when the viewer shows a new model
+_MODELS = weakref.WeakKeyDictionary()
+
+
+def model_mapping(*cad_objs, names=None):
+    """The mapping show() would create for cad_objs, without tessellating them"""
+    group, instances = to_ocpgroup(*cad_objs, names=names)
+    if len(group.objects) == 1 and isinstance(group.objects[0], OcpGroup):
+        # same shape ids as show()
+        loc = group.loc
+        group = group.objects[0]
+        group.loc = loc * group.loc
+
+    def skip(*_args):
+        return None, None
+
+    mapping, _ = group.collect("", instances, None, skip, skip)
+    return mapping
+
+
+class MeasureModel:
+    """
+    Backend model (shape id -> shape) with the measurement data of its shapes cached,
+    so that repeated batches on the same viewer only compute new shapes
+    """
+
+    def __init__(self, model):
+        self.model = model
+        # only used for get_center, to select the reference points like the viewer
+        self.backend = ViewerBackend(port=0)
+        self.backend.model = model
+        self.centers = {}
+        self.references = {}
+        self.properties = {}
+        self.breps = {}
+        self.indexes = {}
+        self.bboxes = {}
+
+    def check(self, shape_ids):
+        missing = [i for i in shape_ids if i not in self.model]
+        if missing:
+            raise KeyError(f"Unknown shape ids: {', '.join(missing[:10])}")
+
+    def center(self, shape_id, for_distance=True):
+        key = (shape_id, for_distance)
+        if key not in self.centers:
+            center, _ = self.backend.get_center(self.model[shape_id], for_distance)
+            self.centers[key] = center.to_tuple()
+        return self.centers[key]
+
+    def reference(self, shape_id):
+        """Unit direction the angle tool uses and whether it is a plane normal"""
+        if shape_id not in self.references:
+            shape = self.model[shape_id]
+            try:
+                if isinstance(shape, Face):
+                    direction, is_plane = Plane(shape).z_dir, True
+                elif isinstance(shape, Edge) and shape.geom_type in CONICS:
+                    direction, is_plane = shape.normal(), True
+                else:
+                    direction, is_plane = shape % 0, False
+                direction = direction.normalized().to_tuple()
+            except Exception:  # pylint: disable=broad-except
+                # e.g. vertices have no direction
+                direction, is_plane = (np.nan, np.nan, np.nan), False
+            self.references[shape_id] = (direction, is_plane)
+        return self.references[shape_id]
+
+    def property_row(self, shape_id):
+        """Properties as the properties tool shows them, but not rounded"""
+        if shape_id not in self.properties:
+            shape = self.model[shape_id]
+            row = dict.fromkeys(PROPERTIES, np.nan)
+            if isinstance(shape, Edge):
+                if shape.geom_type == "CIRCLE":
+                    row["radius"] = shape.radius
+                elif shape.geom_type == "ELLIPSE":
+                    row["radius"] = get_curve(shape.wrapped).Ellipse().MajorRadius()
+                    row["radius2"] = get_curve(shape.wrapped).Ellipse().MinorRadius()
+                row["length"] = shape.length
+            elif isinstance(shape, Face):
+                if shape.geom_type == "CYLINDER":
+                    row["radius"] = get_surface(shape.wrapped).Cylinder().Radius()
+                row["length"] = shape.length
+                row["width"] = shape.width
+                row["area"] = shape.area
+            elif isinstance(shape, (Solid, Compound)):
+                row["volume"] = shape.volume
+            row["geom_type"] = (
+                None if isinstance(shape, Vertex) else str(shape.geom_type)
+            )
+            row["center"] = self.center(shape_id, False)
+            self.properties[shape_id] = row
+        return self.properties[shape_id]
+
+    def index(self, shape_id):
+        """Face bounding boxes of the shape, built on first use"""
+        if shape_id not in self.indexes:
+            self.indexes[shape_id] = ShapeIndex(self.model[shape_id].wrapped)
+        return self.indexes[shape_id]
+
+    def bbox(self, shape_id):
+        if shape_id not in self.bboxes:
+            if shape_id in self.indexes:
+                self.bboxes[shape_id] = self.indexes[shape_id].bbox
+            else:
+                self.bboxes[shape_id] = bounding_box(self.model[shape_id].wrapped)
+        return self.bboxes[shape_id]
+
+    def part_ids(self):
+        """Ids of the parts with faces, i.e. without their faces, edges and vertices"""
+        return [i for i in self.model if f"{i}/faces/faces_0" in self.model]
+
+    def brep(self, shape_id):
+        if shape_id not in self.breps:
+            self.breps[shape_id] = serialize(self.model[shape_id].wrapped)
+        return self.breps[shape_id]
+
+
+def get_measure_model(viewer_or_model):
+    """Resolve a viewer, a viewer title or CAD object(s) to a MeasureModel"""
+    if isinstance(viewer_or_model, MeasureModel):
+        return viewer_or_model
+
+    viewer = viewer_or_model
+    if isinstance(viewer, str):
+        viewer = get_sidecar(viewer)
+        if viewer is None:
+            raise ValueError(f"Unknown viewer {viewer_or_model}")
+
+    widget = getattr(viewer, "widget", None)
+    if widget is not None:
+        backend = KERNEL_BACKENDS.get(widget.id)
+        if backend is None:
+            raise ValueError("The viewer has no model, show one first")
+        if backend not in _MODELS:
+            _MODELS[backend] = MeasureModel(backend.get_model())
+        return _MODELS[backend]
+
+    if isinstance(viewer_or_model, (list, tuple)):
+        return MeasureModel(build_model(model_mapping(*viewer_or_model)))
+    return MeasureModel(build_model(model_mapping(viewer_or_model)))
+
+
+def shape_ids(viewer_or_model, pattern="*"):
+    """
+    Get the shape ids of a viewer or CAD object(s) usable with measure_batch
+
+    Parameters:
+        viewer_or_model:  A viewer, a viewer title or the CAD object(s) to measure
+        pattern:          fnmatch pattern, e.g. "/bearing/balls/*" or "*/faces/*"
+    """
+    model = get_measure_model(viewer_or_model).model
+    return [i for i in model if fnmatch.fnmatchcase(i, pattern)]
+
+
+#
+# Exact distances, in process or in a process pool
+#
+
+_WORKER_BREPS = {}
+_WORKER_SHAPES = {}
+
+
+def _init_worker(breps):
+    _WORKER_BREPS.update(breps)
+
+
+def _worker_index(shape_id):
+    if shape_id not in _WORKER_SHAPES:
+        _WORKER_SHAPES[shape_id] = ShapeIndex(deserialize(_WORKER_BREPS[shape_id]))
+    return _WORKER_SHAPES[shape_id]
+
+
+def _min_distances(pairs):
+    return [index_distance(_worker_index(a), _worker_index(b)) for a, b in pairs]
+
+
+def check_pair(index1, index2, min_clearance):
+    """
+    (distance, x1, y1, z1, x2, y2, z2, volume) of two parts, volume is the volume of
+    their intersection, computed when their bounding boxes overlap, and distance is 0
+    for intersecting parts. Parts further apart than min_clearance are not measured
+    exactly
+    """
+    row = index_distance(index1, index2, limit=min_clearance)
+    if box_distance(index1.bbox, index2.bbox) > 0:
+        return row + (0.0,)
+
+    # a part inside another one has no touching faces, hence a positive distance
+    volume = common_volume(index1.shape, index2.shape)
+    if volume > CONTACT_TOLERANCE:
+        row = (0.0,) + tuple(row[1:])
+    return row + (volume,)
+
+
+def _check_pairs(pairs, min_clearance):
+    return [
+        check_pair(_worker_index(a), _worker_index(b), min_clearance) for a, b in pairs
+    ]
+
+
+def run_pairs(measure_model, pairs, func, worker_func, workers=None):
+    """
+    Rows of func(index1, index2) for all pairs, in process or in a process pool where
+    worker_func(chunk) computes the rows of a chunk of pairs
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or len(pairs) < POOL_THRESHOLD:
+        index = measure_model.index
+        return [func(index(a), index(b)) for a, b in pairs]
+
+    ids = {i for pair in pairs for i in pair}
+    breps = {i: measure_model.brep(i) for i in ids}
+    chunksize = max(1, len(pairs) // (workers * 4))
+    chunks = [pairs[i : i + chunksize] for i in range(0, len(pairs), chunksize)]
+
+    # spawn, forking a kernel with running threads is unsafe
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(breps,),
+    ) as pool:
+        rows = []
+        for result in pool.map(worker_func, chunks):
+            rows.extend(result)
+    return rows
+
+
+def min_distances(measure_model, pairs, workers=None):
+    """Rows (distance, x1, y1, z1, x2, y2, z2) of the exact distances of pairs"""
+    return run_pairs(measure_model, pairs, index_distance, _min_distances, workers)
+
+
+#
+# Result tables
+#
+
+
+def _table(columns):
+    if HAS_PANDAS:
+        return pd.DataFrame(columns)
+    return np.rec.fromarrays(
+        [np.asarray(v) for v in columns.values()], names=list(columns)
+    )
+
+
+def _pair_columns(pairs, points1, points2):
+    return {
+        "id1": np.array([a for a, _ in pairs], dtype=object),
+        "id2": np.array([b for _, b in pairs], dtype=object),
+        "x1": points1[:, 0],
+        "y1": points1[:, 1],
+        "z1": points1[:, 2],
+        "x2": points2[:, 0],
+        "y2": points2[:, 1],
+        "z2": points2[:, 2],
+    }
+
+
+def measure_batch(viewer_or_model, pairs, kind="distance", workers=None):
+    """
+    Measure many shape pairs at once, e.g. the clearance of every bolt of an assembly
+
+    Parameters:
+        viewer_or_model:  A viewer, a viewer title or the CAD object(s) to measure.
+                          Per shape results of a viewer are cached until it shows a new model
+        pairs:            (id1, id2) tuples of shape ids, or shape ids for "properties".
+                          Use shape_ids() to select them
+        kind:             "distance": distance of the reference points (as the distance tool),
+                          "min_distance": exact minimum distance between the shapes,
+                          "angle": angle in degrees (as the angle tool),
+                          "properties": volume, area, length, ... (as the properties tool)
+        workers:          Number of processes for "min_distance" (default: number of CPUs,
+                          0 or 1: in process). Small batches always run in process
+
+    Returns:
+        A pandas DataFrame (a numpy record array without pandas) with one row per entry
+        of pairs. Values are not rounded; NaN where a measurement does not apply.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown kind {kind}, use one of {', '.join(KINDS)}")
+
+    measure_model = get_measure_model(viewer_or_model)
+
+    if kind == "properties":
+        shape_ids_ = list(pairs)
+        measure_model.check(shape_ids_)
+        rows = [measure_model.property_row(i) for i in shape_ids_]
+        centers = np.array([r["center"] for r in rows], dtype=float).reshape(-1, 3)
+        columns = {
+            "id": np.array(shape_ids_, dtype=object),
+            "geom_type": np.array([r["geom_type"] for r in rows], dtype=object),
+        }
+        for name in PROPERTIES:
+            columns[name] = np.array([r[name] for r in rows], dtype=float)
+        columns.update({"x": centers[:, 0], "y": centers[:, 1], "z": centers[:, 2]})
+        return _table(columns)
+
+    pairs = [tuple(pair) for pair in pairs]
+    measure_model.check({i for pair in pairs for i in pair})
+
+    if kind == "distance":
+        points1 = np.array([measure_model.center(a) for a, _ in pairs], dtype=float)
+        points2 = np.array([measure_model.center(b) for _, b in pairs], dtype=float)
+        points1 = points1.reshape(-1, 3)
+        points2 = points2.reshape(-1, 3)
+        columns = _pair_columns(pairs, points1, points2)
+        columns["distance"] = np.linalg.norm(points2 - points1, axis=1)
+
+    elif kind == "min_distance":
+        rows = np.array(
+            min_distances(measure_model, pairs, workers), dtype=float
+        ).reshape(-1, 7)
+        columns = _pair_columns(pairs, rows[:, 1:4], rows[:, 4:7])
+        columns["distance"] = rows[:, 0]
+
+    else:  # angle
+        refs1 = [measure_model.reference(a) for a, _ in pairs]
+        refs2 = [measure_model.reference(b) for _, b in pairs]
+        dir1 = np.array([d for d, _ in refs1], dtype=float).reshape(-1, 3)
+        dir2 = np.array([d for d, _ in refs2], dtype=float).reshape(-1, 3)
+        is_plane1 = np.array([p for _, p in refs1], dtype=bool)
+        is_plane2 = np.array([p for _, p in refs2], dtype=bool)
+
+        cos = np.clip(np.sum(dir1 * dir2, axis=1), -1.0, 1.0)
+        angle = np.degrees(np.arccos(cos))
+        # angle between a plane and a line is measured against the plane normal
+        angle = np.where(is_plane1 != is_plane2, np.abs(90 - angle), angle)
+        columns = {
+            "id1": np.array([a for a, _ in pairs], dtype=object),
+            "id2": np.array([b for _, b in pairs], dtype=object),
+            "angle": angle,
+        }
+
+    return _table(columns)
+
+
+#
+# Interference and clearance check
+#
+
+
+def highlight_parts(viewer, part_ids):
+    """Show the faces of part_ids only, the other parts keep their edges"""
+    part_ids = set(part_ids)
+    states = {}
+    for path, (faces, edges) in viewer.states.items():
+        if faces != 3:  # 3: the object has no faces
+            faces = 1 if path in part_ids else 0
+        states[path] = [faces, edges]
+    viewer.update_states(states)
+
+
+def interference_check(
+    viewer_or_model, min_clearance=0.0, parts=None, workers=None, highlight=False
+):
+    """
+    Find interfering parts and parts closer than min_clearance, e.g. of an assembly
+
+    Parameters:
+        viewer_or_model:  A viewer, a viewer title or the CAD object(s) to check
+        min_clearance:    Part pairs closer than this are reported (default 0: only
+                          interferences and contacts)
+        parts:            Part ids to check (default: all parts with faces). Use
+                          shape_ids() to select them
+        workers:          Number of processes (default: number of CPUs, 0 or 1: in
+                          process). Few candidate pairs always run in process
+        highlight:        Show only the faces of the reported parts in the viewer
+
+    Returns:
+        A pandas DataFrame (a numpy record array without pandas) with one row per
+        reported pair: the status ("interference", "contact" or "clearance"), the
+        minimum distance (0 for interfering parts, also if one part encloses the
+        other), the closest points and the volume of the intersection.
+
+    Only part pairs whose bounding boxes are closer than min_clearance are measured.
+    """
+    if highlight:
+        viewer = viewer_or_model
+        if isinstance(viewer, str):
+            viewer = get_sidecar(viewer)
+        if getattr(viewer, "widget", None) is None:
+            raise ValueError("highlight needs a viewer")
+
+    measure_model = get_measure_model(viewer_or_model)
+    if parts is None:
+        parts = measure_model.part_ids()
+    else:
+        parts = list(parts)
+        measure_model.check(parts)
+
+    boxes = np.array([measure_model.bbox(i) for i in parts]).reshape(-1, 6)
+    pairs = [(parts[i], parts[j]) for i, j in close_pairs(boxes, min_clearance)]
+
+    rows = run_pairs(
+        measure_model,
+        pairs,
+        partial(check_pair, min_clearance=min_clearance),
+        partial(_check_pairs, min_clearance=min_clearance),
+        workers,
+    )
+    rows = np.array(rows, dtype=float).reshape(-1, 8)
+
+    found = rows[:, 0] <= max(min_clearance, CONTACT_TOLERANCE)
+    pairs = [pair for pair, keep in zip(pairs, found) if keep]
+    rows = rows[found]
+
+    status = np.where(
+        rows[:, 7] > CONTACT_TOLERANCE,
+        "interference",
+        np.where(rows[:, 0] <= CONTACT_TOLERANCE, "contact", "clearance"),
+    )
+    columns = _pair_columns(pairs, rows[:, 1:4], rows[:, 4:7])
+    columns = {
+        "id1": columns.pop("id1"),
+        "id2": columns.pop("id2"),
+        "status": status.astype(object),
+        "distance": rows[:, 0],
+        "volume": rows[:, 7],
+        **columns,
+    }
+
+    if highlight:
+        highlight_parts(viewer, {i for pair in pairs for i in pair})
+
+    return _table(columns)
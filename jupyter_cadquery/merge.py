@@ -0,0 +1,226 @@
+"""Merged draw buffers for assemblies with many parts"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# Merged format: the solids, shells and faces sharing a material (color, alpha,
+# renderback) are concatenated into one mesh of data["merged"], transformed into
+# the frame of the root group. The tree is unchanged, but the shape of a merged
+# part is
+#
+#   {"merged": index into data["merged"], "ranges": {key: [start, count]}}
+#
+# with ranges in units of vertices, triangles, normals (= vertices), edges
+# (segments), obj_vertices, faces (face_types, triangles_per_face) and edge_types
+# (edge_types, segments_per_edge). Triangle indices are offset to the merged
+# vertices. The viewer draws one object per merged mesh and uses the ranges for
+# picking, visibility and highlighting. The locs of the groups below the root are
+# moved into the parts that are not merged (e.g. textured faces), so no loc in the
+# tree applies to a merged mesh a second time. part_mesh is the reference for this
+# layout.
+#
+# cad-viewer-widget 3.0.2 cannot draw merged parts, set_merge_mode refuses to
+# enable merging until features.VIEWER_FEATURES names a viewer that can.
+#
+
+import time
+
+import numpy as np
+from ocp_tessellate.ocp_utils import identity_location, loc_to_tq, tq_to_loc
+
+from .features import require_viewer
+from .timing import add_stage
+
+__all__ = ["set_merge_mode", "get_merge_mode"]
+
+MERGE = {"enabled": False, "min_parts": 100}
+
+# mesh key -> (range key, number of values per unit)
+LAYOUT = {
+    "vertices": ("vertices", 3),
+    "normals": ("vertices", 3),
+    "triangles": ("triangles", 3),
+    "edges": ("edges", 6),
+    "obj_vertices": ("obj_vertices", 3),
+    "face_types": ("faces", 1),
+    "triangles_per_face": ("faces", 1),
+    "edge_types": ("edge_types", 1),
+    "segments_per_edge": ("edge_types", 1),
+}
+
+POSITIONS = ("vertices", "edges", "obj_vertices")
+
+
+def set_merge_mode(enabled=True, min_parts=100):
+    """
+    Send the parts of large assemblies as one mesh per material. Needs a viewer
+    that draws merged meshes (see merge.py), enabling raises RuntimeError for
+    viewers that cannot.
+
+    Parameters:
+        enabled:    Merge the parts (default=True)
+        min_parts:  Only merge models with at least this many solids, shells or
+                    faces (default=100)
+    """
+    if enabled:
+        require_viewer("merged_meshes")
+    MERGE.update({"enabled": enabled, "min_parts": min_parts})
+
+
+def get_merge_mode():
+    """Current merge settings"""
+    return dict(MERGE)
+
+
+def _dtype(key):
+    return np.float32 if key in POSITIONS or key == "normals" else np.int32
+
+
+def _matrix(loc):
+    trsf = loc.Transformation()
+    return np.array([[trsf.Value(i, j) for j in range(1, 5)] for i in range(1, 4)])
+
+
+def _leaves(group, loc, result):
+    for part in group["parts"]:
+        part_loc = loc if part.get("loc") is None else loc * tq_to_loc(*part["loc"])
+        if part.get("parts") is not None:
+            _leaves(part, part_loc, result)
+        elif (
+            part.get("type") == "shapes"
+            and part.get("texture") is None
+            and isinstance(part.get("shape"), dict)
+            and part["shape"].get("ref") is not None
+        ):
+            result.append((part, part_loc))
+    return result
+
+
+def _referencing(group, result):
+    """Parts still referencing an instance, e.g. textured faces"""
+    for part in group["parts"]:
+        if part.get("parts") is not None:
+            _referencing(part, result)
+        elif (
+            isinstance(part.get("shape"), dict) and part["shape"].get("ref") is not None
+        ):
+            result.append(part)
+    return result
+
+
+def _flatten(group, loc):
+    """Move the locs of the groups below group into the parts that are not merged"""
+    for part in group["parts"]:
+        part_loc = loc if part.get("loc") is None else loc * tq_to_loc(*part["loc"])
+        if part.get("parts") is not None:
+            _flatten(part, part_loc)
+            part["loc"] = None
+        elif not (isinstance(part.get("shape"), dict) and "merged" in part["shape"]):
+            part["loc"] = loc_to_tq(part_loc)
+
+
+def _transform(mesh, matrix):
+    result = {}
+    for key in LAYOUT:
+        value = mesh.get(key)
+        if value is None:
+            continue
+        value = np.asarray(value)
+        if key in POSITIONS:
+            value = value.reshape(-1, 3) @ matrix[:, :3].T + matrix[:, 3]
+        elif key == "normals":
+            value = value.reshape(-1, 3) @ matrix[:, :3].T
+        result[key] = value.ravel().astype(_dtype(key))
+    return result
+
+
+def merge(instances, shapes):
+    """
+    Merge the meshes of the parts in shapes with the same material. Returns
+    (instances, shapes, merged), unchanged if there are less than min_parts parts.
+    """
+    leaves = _leaves(shapes, identity_location(), [])
+    if len(leaves) < MERGE["min_parts"]:
+        return instances, shapes, []
+
+    materials = {}
+    for part, loc in leaves:
+        key = (part.get("color"), part.get("alpha"), part.get("renderback"))
+        materials.setdefault(key, []).append((part, loc))
+
+    meshes = []
+    for members in materials.values():
+        arrays = {key: [] for key in LAYOUT}
+        offsets = {unit: 0 for unit, _ in LAYOUT.values()}
+        for part, loc in members:
+            mesh = _transform(instances[part["shape"]["ref"]], _matrix(loc))
+            ranges = {}
+            for key, (unit, size) in LAYOUT.items():
+                value = mesh.get(key, np.empty(0, dtype=_dtype(key)))
+                count = len(value) // size
+                ranges.setdefault(unit, [offsets[unit], count])
+                if key == "triangles":
+                    value = value + offsets["vertices"]
+                arrays[key].append(value)
+            for unit, (_, count) in ranges.items():
+                offsets[unit] += count
+            part["shape"] = {"merged": len(meshes), "ranges": ranges}
+            part["loc"] = None
+
+        meshes.append({key: np.concatenate(values) for key, values in arrays.items()})
+
+    # the merged meshes are in the frame of the root group
+    _flatten(shapes, identity_location())
+
+    # keep the instances still referenced (e.g. textured faces), renumbered
+    remaining = _referencing(shapes, [])
+    used = sorted({part["shape"]["ref"] for part in remaining})
+    renumber = {old: new for new, old in enumerate(used)}
+    for part in remaining:
+        part["shape"]["ref"] = renumber[part["shape"]["ref"]]
+
+    return [instances[i] for i in used], shapes, meshes
+
+
+def part_mesh(merged, part):
+    """Mesh of a merged part (in the frame of the root group) from the merged meshes"""
+    mesh = merged[part["shape"]["merged"]]
+    ranges = part["shape"]["ranges"]
+    result = {}
+    for key, (unit, size) in LAYOUT.items():
+        start, count = ranges[unit]
+        result[key] = mesh[key][start * size : (start + count) * size]
+    result["triangles"] = result["triangles"] - ranges["vertices"][0]
+    return result
+
+
+def merged(func):
+    """Wrap numpy_to_buffer_json to merge the parts of large assemblies first"""
+    if getattr(func, "_jcq_merge", False):
+        return func
+
+    def wrapper(value):
+        if MERGE["enabled"] and isinstance(value, dict) and "shapes" in value:
+            start = time.perf_counter()
+            instances, shapes, meshes = merge(value["instances"], value["shapes"])
+            if meshes:
+                value = {"instances": instances, "shapes": shapes, "merged": meshes}
+            add_stage("merge", time.perf_counter() - start)
+        return func(value)
+
+    wrapper._jcq_merge = True
+    return wrapper
@@ -0,0 +1,147 @@
+"""Prometheus metrics of the Jupyter server extension"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import bisect
+import threading
+
+PREFIX = "jupyter_cadquery"
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = tuple(2**i for i in range(10, 32, 2))  # 1 kB ... 1 GB
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+class Counter:
+    def __init__(self, name, doc, labels=()):
+        self.name = f"{PREFIX}_{name}"
+        self.doc = doc
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, value=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, doc, func):
+        self.name = f"{PREFIX}_{name}"
+        self.doc = doc
+        self.func = func
+
+    def render(self):
+        return [
+            f"# HELP {self.name} {self.doc}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {self.func()}",
+        ]
+
+
+class Histogram:
+    def __init__(self, name, doc, buckets=DURATION_BUCKETS, labels=()):
+        self.name = f"{PREFIX}_{name}"
+        self.doc = doc
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self.values = {}  # labels -> [bucket counts, sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = _labels(self.labels + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _labels(self.labels + ("le",), labels + ("+Inf",))
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(
+    Counter("requests_total", "Number of requests.", ("handler", "status"))
+)
+REQUEST_DURATION = REGISTRY.register(
+    Histogram("request_duration_seconds", "Latency of requests.", labels=("handler",))
+)
+PAYLOAD_SIZE = REGISTRY.register(
+    Histogram(
+        "objects_payload_bytes",
+        "Size of the models received by the objects handler.",
+        buckets=SIZE_BUCKETS,
+    )
+)
+LOAD_MODEL_DURATION = REGISTRY.register(
+    Histogram("load_model_duration_seconds", "Duration of ViewerBackend.load_model.")
+)
+HANDLE_EVENT_DURATION = REGISTRY.register(
+    Histogram(
+        "handle_event_duration_seconds", "Duration of ViewerBackend.handle_event."
+    )
+)
+COMPRESSION_RATIO = REGISTRY.register(
+    Histogram(
+        "objects_compression_ratio",
+        "Compression ratio of the compressed models received by the objects handler.",
+        buckets=(1, 2, 3, 5, 10, 20, 50),
+    )
+)
@@ -0,0 +1,184 @@
+"""Pool of pre-built viewers for open_viewer and cell based show()"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import uuid
+
+import orjson
+from cad_viewer_widget import CadViewer, Sidecar
+from cad_viewer_widget.sidecar import set_default as set_default_sidecar
+from cad_viewer_widget.sidecar import set_sidecar
+from cad_viewer_widget.utils import viewer_args
+from IPython.display import HTML, display
+from ocp_vscode.backend_logo import logo as b_logo
+
+from .comms import release_backend, send_backend_async, send_measure_request
+from .jobs import schedule
+from .logo import logo
+
+__all__ = ["set_viewer_pool", "get_viewer_pool"]
+
+# parsed logo and its viewer arguments, shared by all viewers
+LOGO = None
+
+# number of idle viewers to keep, 0 disables the pool
+POOL_SIZE = 0
+
+# idle viewers: created, logo added and its backend uploaded, but not displayed
+POOL = []
+
+# cad_viewer_widget corrects (cad_width) or rejects (tree_width) smaller sizes,
+# viewers with these are left to it instead of taken from the pool
+MIN_CAD_WIDTH = 780
+MIN_TREE_WIDTH = 240
+
+_FILLING = False
+
+
+def get_logo():
+    global LOGO
+
+    if LOGO is None:
+        l = orjson.loads(logo)
+        l["config"]["collapse"] = "R"
+        LOGO = (l["data"], viewer_args(l["config"]))
+    return LOGO
+
+
+def init_viewer(viewer):
+    """Show the logo in a new viewer and connect its measurement backend"""
+    data, args = get_logo()
+    viewer.add_shapes(data, **args, _is_logo=True)
+
+    # the logo's backend is uploaded in the background, a first show() replaces it
+    send_backend_async({"model": b_logo}, jcv_id=viewer.widget.id)
+    viewer.widget.measure_callback = send_measure_request
+    return viewer
+
+
+def _create():
+    # the display settings are traits of the widget, set when the viewer is taken
+    return init_viewer(CadViewer(id_=str(uuid.uuid4())))
+
+
+def _fill():
+    global _FILLING
+
+    scheduled = False
+    try:
+        if len(POOL) < POOL_SIZE:
+            POOL.append(_create())
+        if len(POOL) < POOL_SIZE:
+            # one viewer per callback to keep the kernel responsive
+            schedule(_fill)
+            scheduled = True
+    finally:
+        # a failed _create stops filling, the next refill() starts over
+        if not scheduled:
+            _FILLING = False
+
+
+def refill():
+    global _FILLING
+
+    if POOL_SIZE > 0 and len(POOL) < POOL_SIZE and not _FILLING:
+        _FILLING = True
+        schedule(_fill)
+
+
+def set_viewer_pool(size=2):
+    """
+    Keep viewers ready for open_viewer and show() into a new viewer, created in the
+    background
+
+    Parameters:
+        size:  Number of idle viewers (default=2, 0 disables the pool)
+    """
+    global POOL_SIZE
+
+    if size < len(POOL):
+        _drain(len(POOL) - size)
+    POOL_SIZE = size
+    refill()
+
+
+def get_viewer_pool():
+    """Number of idle viewers and the pool size"""
+    return {"idle": len(POOL), "size": POOL_SIZE}
+
+
+def _drain(count):
+    for _ in range(count):
+        viewer = POOL.pop()
+        release_backend(viewer.widget.id)
+        viewer.widget.close()
+
+
+def take_viewer(
+    title=None,
+    anchor="right",
+    cad_width=800,
+    tree_width=250,
+    height=600,
+    aspect_ratio=None,
+    theme="browser",
+    glass=True,
+    tools=True,
+    pinning=True,
+    default=True,
+):
+    """
+    Display an idle viewer of the pool like cad_viewer_widget.open_viewer would,
+    None if the pool is empty
+    """
+    if not POOL or cad_width < MIN_CAD_WIDTH or tree_width < MIN_TREE_WIDTH:
+        return None
+
+    viewer = POOL.pop(0)
+    widget = viewer.widget
+    # not displayed yet, the view is rendered with these settings
+    widget.cad_width = cad_width
+    widget.tree_width = tree_width
+    widget.height = height
+    widget.theme = theme
+    widget.glass = glass
+    widget.tools = tools
+    if aspect_ratio is not None:
+        widget.aspect_ratio = aspect_ratio
+
+    if title is None or title == "":
+        widget.pinning = pinning
+        display(widget)
+
+        image_id = f"img_{widget.id}"
+        display(HTML("<div></div>"), display_id=image_id)
+        widget.image_id = image_id
+    else:
+        widget.title = title
+        widget.anchor = anchor
+        out = Sidecar(title=title, anchor=anchor)
+        with out:
+            display(widget)
+        out.resize_sidebar(cad_width + (0 if glass else tree_width) + 12)
+
+        set_sidecar(title, viewer)
+        if default:
+            set_default_sidecar(title)
+
+    viewer.register_viewer()
+    refill()
+    return viewer
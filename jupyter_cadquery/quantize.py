@@ -0,0 +1,195 @@
+"""Quantized encoding of the tessellated meshes sent to the viewer"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# Encoded buffers keep the {"shape", "dtype", "buffer", "codec"} layout of
+# numpy_to_buffer_json and add an "encoding" key:
+#
+#   positions  "quantized":   int16 (x, y, z), value = q * scale + offset, per mesh
+#                             offset (center) and scale (half extent / 32767)
+#   normals    "octahedral":  int16 (u, v) / 32767, octahedral mapping of the unit
+#                             sphere, see oct_decode
+#   indices    uint16 instead of int32 for meshes with at most 65536 vertices, no key
+#
+# Meshes whose quantization error would exceed max_error times the linear deflection
+# of the tessellation (derived from deviation like ocp_tessellate does) keep float32.
+#
+
+import base64
+
+import numpy as np
+
+POSITIONS = ("vertices", "edges", "obj_vertices")
+
+NORMALS = ("normals",)
+
+INDICES = ("triangles",)
+
+INT16_MAX = 32767
+
+
+def _array(buffer):
+    return np.frombuffer(base64.b64decode(buffer["buffer"]), dtype=buffer["dtype"])
+
+
+def _buffer(array, **extra):
+    array = np.ascontiguousarray(array).ravel()
+    return {
+        "shape": array.shape,
+        "dtype": str(array.dtype),
+        "buffer": base64.b64encode(memoryview(array)).decode(),
+        "codec": "b64",
+        **extra,
+    }
+
+
+def _is_buffer(value):
+    return isinstance(value, dict) and "buffer" in value and "dtype" in value
+
+
+def _sign(values):
+    return np.where(values >= 0, 1.0, -1.0)
+
+
+def oct_encode(normals):
+    """Octahedral encoding of (n, 3) unit vectors as (n, 2) int16"""
+    normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+    norm = np.abs(normals).sum(axis=1, keepdims=True)
+    n = normals / np.where(norm == 0, 1.0, norm)
+    x, y, z = n[:, 0], n[:, 1], n[:, 2]
+    lower = z < 0
+    u = np.where(lower, (1 - np.abs(y)) * _sign(x), x)
+    v = np.where(lower, (1 - np.abs(x)) * _sign(y), y)
+    return np.round(np.stack([u, v], axis=1) * INT16_MAX).astype(np.int16)
+
+
+def oct_decode(encoded):
+    """(n, 2) int16 of oct_encode to (n, 3) float32 unit vectors"""
+    uv = np.asarray(encoded, dtype=np.float64).reshape(-1, 2) / INT16_MAX
+    u, v = uv[:, 0], uv[:, 1]
+    z = 1 - np.abs(u) - np.abs(v)
+    t = np.maximum(-z, 0)
+    x = u - t * _sign(u)
+    y = v - t * _sign(v)
+    n = np.stack([x, y, z], axis=1)
+    return (n / np.linalg.norm(n, axis=1, keepdims=True)).astype(np.float32)
+
+
+def linear_deflection(bbox_min, bbox_max, deviation):
+    """Linear deflection of the tessellation, see ocp_tessellate compute_quality"""
+    return np.sum(bbox_max - bbox_min) / 300 * deviation
+
+
+def encode_mesh(mesh, deviation=0.1, max_error=0.1):
+    """
+    Encode the buffers of one mesh (an instance or the shape of an edge or vertex
+    part). Returns the mesh unchanged if quantization would be too coarse.
+    """
+    positions = {
+        k: _array(mesh[k]).reshape(-1, 3) for k in POSITIONS if _is_buffer(mesh.get(k))
+    }
+    if not positions or all(len(p) == 0 for p in positions.values()):
+        return mesh
+
+    stacked = np.concatenate([p for p in positions.values() if len(p) > 0])
+    bbox_min = stacked.min(axis=0).astype(np.float64)
+    bbox_max = stacked.max(axis=0).astype(np.float64)
+    offset = (bbox_min + bbox_max) / 2
+    half = (bbox_max - bbox_min) / 2
+    scale = np.where(half > 0, half / INT16_MAX, 1.0)
+
+    error = np.max(scale) / 2
+    if error > max_error * linear_deflection(bbox_min, bbox_max, deviation):
+        return mesh
+
+    result = dict(mesh)
+    for key, values in positions.items():
+        quantized = np.round((values - offset) / scale)
+        result[key] = _buffer(
+            np.clip(quantized, -INT16_MAX, INT16_MAX).astype(np.int16),
+            encoding="quantized",
+            offset=offset.tolist(),
+            scale=scale.tolist(),
+        )
+
+    for key in NORMALS:
+        if _is_buffer(mesh.get(key)):
+            result[key] = _buffer(oct_encode(_array(mesh[key])), encoding="octahedral")
+
+    vertex_count = len(positions.get("vertices", ()))
+    for key in INDICES:
+        if _is_buffer(mesh.get(key)) and vertex_count <= 65536:
+            result[key] = _buffer(_array(mesh[key]).astype(np.uint16))
+
+    return result
+
+
+def _is_mesh(value):
+    return isinstance(value, dict) and any(_is_buffer(value.get(k)) for k in POSITIONS)
+
+
+def _encode_parts(group, deviation, max_error):
+    parts = []
+    for part in group.get("parts", []):
+        part = dict(part)
+        if part.get("parts") is not None:
+            part = _encode_parts(part, deviation, max_error)
+        elif _is_mesh(part.get("shape")):
+            part["shape"] = encode_mesh(part["shape"], deviation, max_error)
+        parts.append(part)
+    return {**group, "parts": parts}
+
+
+def encode_shapes(data, deviation=0.1, max_error=0.1):
+    """
+    Quantize the meshes of the viewer data ({"instances": ..., "shapes": ...} and
+    "merged" of merge.py, with buffers of numpy_to_buffer_json). The input is not
+    modified.
+
+    Parameters:
+        data:       The data of send_data
+        deviation:  The deviation used for the tessellation
+        max_error:  Maximum position error as fraction of the linear deflection
+    """
+    result = dict(data)
+    if data.get("instances") is not None:
+        result["instances"] = [
+            encode_mesh(mesh, deviation, max_error) for mesh in data["instances"]
+        ]
+    if data.get("merged") is not None:
+        result["merged"] = [
+            encode_mesh(mesh, deviation, max_error) for mesh in data["merged"]
+        ]
+    if data.get("shapes") is not None:
+        result["shapes"] = _encode_parts(data["shapes"], deviation, max_error)
+    return result
+
+
+def decode_buffer(buffer):
+    """Numpy array of an encoded or plain buffer, with the original float32 layout"""
+    array = _array(buffer)
+    encoding = buffer.get("encoding")
+    if encoding == "quantized":
+        scale = np.asarray(buffer["scale"])
+        offset = np.asarray(buffer["offset"])
+        array = (array.reshape(-1, 3) * scale + offset).astype(np.float32).ravel()
+    elif encoding == "octahedral":
+        array = oct_decode(array).ravel()
+    elif array.dtype == np.uint16:
+        array = array.astype(np.int32)
+    return array
@@ -14,7 +14,9 @@
 # limitations under the License.
 #
 
+import threading
 import traceback
+import weakref
 from dataclasses import dataclass, field
 from typing import Any, Dict, List
 
@@ -149,7 +151,12 @@ class Context(object):
         return result
 
 
-_CTX = Context()
+# recording context, per thread: objects can be built with replay enabled in
+# worker threads (see get_context). _ALL_CONTEXTS lets reset_replay reach the
+# contexts of all live threads, not only of the kernel thread
+_CONTEXTS = threading.local()
+_ALL_CONTEXTS = weakref.WeakSet()
+_CONTEXTS_LOCK = threading.Lock()
 DEBUG = False
 REPLAY = False
 HELPER = {"show_bbox": True, "show_result": False}
@@ -161,7 +168,13 @@ def _trace(*objs):
 
 
 def get_context():
-    return _CTX
+    """The replay context of the calling thread"""
+    ctx = getattr(_CONTEXTS, "ctx", None)
+    if ctx is None:
+        ctx = _CONTEXTS.ctx = Context()
+        with _CONTEXTS_LOCK:
+            _ALL_CONTEXTS.add(ctx)
+    return ctx
 
 
 def _add_context(self, name):
@@ -194,24 +207,25 @@ def _add_context(self, name):
 
     def intercept(func, prefix):
         def f(*args, **kwargs):
+            ctx = get_context()
             _trace(prefix, f"Calling {func.__name__}{args + (kwargs,)}")
-            _trace(_CTX)
+            _trace(ctx)
 
             if _is_recursive_end(func.__name__):
-                _ = _CTX.pop()
+                _ = ctx.pop()
                 _trace(prefix, "--> level down")
-                _trace(_CTX)
+                _trace(ctx)
 
-            if _CTX.args is None:
+            if ctx.args is None:
                 _trace(prefix, "Updating")
-                _CTX.update(func.__name__, args, kwargs)
-                _trace(_CTX)
+                ctx.update(func.__name__, args, kwargs)
+                _trace(ctx)
 
             result = func(*args, **kwargs)
 
-            if func.__name__ == _CTX.func:
-                _CTX.obj = result
-                context = _CTX.pop()
+            if func.__name__ == ctx.func:
+                ctx.obj = result
+                context = ctx.pop()
 
                 if isinstance(result, cq.Sketch):
                     # Now deep clone the current state of the Sketch object
@@ -236,7 +250,7 @@ def _add_context(self, name):
                         except:  # pylint:disable=bare-except
                             pass
 
-                if _CTX.is_empty():
+                if ctx.is_empty():
                     if isinstance(result, cq.Sketch):
                         # to not conflict with overridden __getattribute__ us try...except
                         try:
@@ -252,25 +266,26 @@ def _add_context(self, name):
                     )
                 else:
                     if context["func"] != "sketch":
-                        _CTX.append_child(context)
+                        ctx.append_child(context)
                         _trace("<== added child", context)
-                _CTX.new()
+                ctx.new()
 
             _trace(prefix, "Leaving", func.__name__)
-            _trace(_CTX)
+            _trace(ctx)
             return result
 
         return f
 
     attr = object.__getattribute__(self, name)
     if callable(attr):
-        prefix = "    " * (_CTX.length - 1)
+        ctx = get_context()
+        prefix = "    " * (ctx.length - 1)
         if not _blacklist(attr.__name__):
             _trace(prefix, "==> intercepting", attr.__name__)
             if _is_recursive(attr.__name__):
                 _trace(prefix, "--> level up")
-                _CTX.new()
-            _trace(_CTX)
+                ctx.new()
+            _trace(ctx)
 
             return intercept(attr, prefix)
     return attr
@@ -560,8 +575,9 @@ def replay(
         )
         return show(cad_obj, cad_width=cad_width, height=height)
 
-    while not _CTX.is_top_level:
-        _CTX.pop()
+    ctx = get_context()
+    while not ctx.is_top_level:
+        ctx.pop()
 
     if not REPLAY:
         print(
@@ -640,8 +656,13 @@ def replay(
 
 
 def reset_replay(event=None):
-    _CTX.clear()
-    _CTX.new()
+    """Reset the replay contexts of all threads, registered as pre_run_cell hook"""
+    get_context()
+    with _CONTEXTS_LOCK:
+        contexts = list(_ALL_CONTEXTS)
+    for ctx in contexts:
+        ctx.clear()
+        ctx.new()
 
 
 def enable_replay(show_bbox=True, show_result=False, warning=True, debug=False):
@@ -14,19 +14,79 @@
 # limitations under the License.
 #
 
-import orjson
-from cad_viewer_widget.utils import viewer_args
+import importlib
+import threading
+
 from cad_viewer_widget import (
     open_viewer as _open_viewer,
+    close_sidecar as _close_sidecar,
+    get_default_sidecar as _get_default_sidecar,
+    get_sidecar as _get_sidecar,
+    get_sidecars as _get_sidecars,
+    close_sidecars as _close_sidecars,
 )
-from .comms import send_measure_request, send_backend
-from ocp_vscode.backend_logo import logo as b_logo
-from .logo import logo
+from ocp_tessellate import convert
+from .arrays import raw_objects, with_raw_parts, without_cad_objects
+from .budget import triangle_budget as _triangle_budget
+from .comms import get_target_viewer, release_backend, target_viewer
+from .decimate import decimated
+from .faces import face_stats
+from .jobs import cancellable, submit
+from .lazy import lazy as _lazy
+from .lazy import lazy_subtrees, register
+from .merge import merged
+from .pool import get_viewer_pool, init_viewer, take_viewer
+from .timing import instrument, record
+from .tools import invalidate_pick_index
 from ocp_vscode.show import _show, _show_object
 
+# account to_ocpgroup, tessellate_group and numpy_to_buffer_json to their stages
+# (ocp_vscode.show is shadowed by the show function in the ocp_vscode namespace)
+_show_module = importlib.import_module("ocp_vscode.show")
+
+# splitting off numpy meshes and placeholders for lazy groups are part of the conversion
+_show_module.to_ocpgroup = _lazy(raw_objects(_show_module.to_ocpgroup))
+instrument(_show_module)
+
+# decimation of large meshes has its own stage, outside of tessellation
+_show_module.tessellate_group = decimated(_show_module.tessellate_group)
+
+# a show() of numpy meshes only has no CAD objects to tessellate
+_show_module.tessellate_group = without_cad_objects(_show_module.tessellate_group)
+
+# merging the parts of large assemblies has its own stage, outside of serialization
+_show_module.numpy_to_buffer_json = merged(_show_module.numpy_to_buffer_json)
+
+# numpy meshes are added after serialization to keep them binary
+_show_module.numpy_to_buffer_json = with_raw_parts(_show_module.numpy_to_buffer_json)
+
+# renders of show_async stop at these steps when a newer one was started
+_show_module.to_ocpgroup = cancellable(_show_module.to_ocpgroup)
+_show_module.tessellate_group = cancellable(_show_module.tessellate_group)
+_show_module.numpy_to_buffer_json = cancellable(_show_module.numpy_to_buffer_json)
+convert.tessellate = cancellable(convert.tessellate)
+
+# arguments of show() for opening its viewer, see open_target
+LAYOUT_ARGS = (
+    "anchor",
+    "cad_width",
+    "height",
+    "theme",
+    "pinning",
+    "glass",
+    "tools",
+    "tree_width",
+)
+
+# show_object adds to the object stack of ocp_vscode, shared by all threads
+OBJECTS_LOCK = threading.Lock()
+
 __all__ = [
     "open_viewer",
+    "close_viewer",
+    "close_viewers",
     "show",
+    "show_async",
     "show_object",
 ]
 
@@ -50,7 +110,7 @@ def open_viewer(
     pinning=True,
     default=True,
 ):
-    viewer = _open_viewer(
+    kwargs = dict(
         title=title,
         anchor=anchor,
         cad_width=cad_width,
@@ -63,16 +123,30 @@ def open_viewer(
         pinning=pinning,
         default=default,
     )
-    l = orjson.loads(logo)
-    l["config"]["collapse"] = "R"
-    viewer.add_shapes(l["data"], **viewer_args(l["config"]), _is_logo=True)
-
-    send_backend({"model": b_logo}, jcv_id=viewer.widget.id)
-    viewer.widget.measure_callback = send_measure_request
+    # pooled viewers have the logo and its backend already
+    viewer = take_viewer(**kwargs)
+    if viewer is None:
+        viewer = init_viewer(_open_viewer(**kwargs))
 
     return viewer
 
 
+def close_viewer(title):
+    """Close the viewer with the given title and release its backend"""
+    viewer = _get_sidecars().get(title)
+    _close_sidecar(title)
+    if viewer is not None:
+        release_backend(viewer.widget.id)
+
+
+def close_viewers():
+    """Close all viewers and release their backends"""
+    ids = [viewer.widget.id for viewer in _get_sidecars().values()]
+    _close_sidecars()
+    for id_ in ids:
+        release_backend(id_)
+
+
 def show(
     *cad_objs,
     names=None,
@@ -123,6 +197,8 @@ def show(
     deviation=None,
     angular_tolerance=None,
     edge_accuracy=None,
+    triangle_budget=None,
+    lazy=None,
     default_color=None,
     default_edgecolor=None,
     default_facecolor=None,
@@ -147,7 +223,8 @@ def show(
     # pylint: disable=line-too-long
     """Show CAD objects in Visual Studio Code
     Parameters
-        cad_objs:                All cad objects that should be shown as positional parameters
+        cad_objs:                All cad objects that should be shown as positional parameters. RawMesh objects,
+                                 (n, 3) arrays and .npy files (point clouds) are sent as binary buffers
 
     Valid keywords for the CAD object attributes:
         names:                   List of names for the cad_objs. Needs to have the same length as cad_objs
@@ -215,6 +292,11 @@ def show(
         deviation:               Shapes: Deviation from linear deflection value (default=0.1)
         angular_tolerance:       Shapes: Angular deflection in radians for tessellation (default=0.2)
         edge_accuracy:           Edges: Precision of edge discretization (default: mesh quality / 100)
+        triangle_budget:         Shapes: Tessellate relative to the scene size and refine large parts first,
+                                 keeping the rendered triangles below this number (default=None: per part)
+        lazy:                    Send the groups below the root (True) or the groups with the given paths
+                                 as bounding box outlines, tessellated when their faces are switched on
+                                 in the viewer (default=None)
 
         default_color:           Default mesh color (default=(232, 176, 36))
         default_edgecolor:       Default color of the edges of a mesh (default=#707070)
@@ -242,9 +324,99 @@ def show(
     - Debug
         debug:                   Show debug statements to the VS Code browser console (default=False)
         timeit:                  Show timing information from level 0-3 (default=False)
+                                 Stage timings are always available via `viewer.timings` and `get_timings()`
+    """
+    kwargs = none_filter(locals(), ["cad_objs", "triangle_budget", "lazy"])
+    invalidate_pick_index(*cad_objs)
+    target = pooled_target(viewer, kwargs)
+    with record() as timings, face_stats(), _triangle_budget(
+        triangle_budget
+    ), lazy_subtrees(lazy) as placeholders, target_viewer(target):
+        viewer = _show(*cad_objs, **kwargs)
+
+    if viewer is not None:
+        viewer.timings = timings
+        register(
+            viewer,
+            cad_objs,
+            dict(kwargs, triangle_budget=triangle_budget),
+            placeholders,
+        )
+    return viewer
+
+
+def open_target(viewer, layout):
     """
-    kwargs = none_filter(locals(), ["cad_objs"])
-    return _show(*cad_objs, **kwargs)
+    Title and viewer for a render into viewer: the sidecar (the default sidecar for
+    None), opened if needed, or a new cell viewer. Returns (title, viewer).
+    """
+    title = _get_default_sidecar() if viewer is None else viewer
+    target = _get_sidecar(title) if title else None
+    if target is None:
+        target = open_viewer(title=title or None, **none_filter(layout, None))
+    return title, target
+
+
+def pooled_target(viewer, kwargs):
+    """
+    The viewer a show() into viewer renders to: the target of the thread, else a new
+    viewer taken from the viewer pool if show() would open one, else None to let
+    cad_viewer_widget look it up or open it
+    """
+    target = get_target_viewer()
+    if target is not None or get_viewer_pool()["idle"] == 0:
+        return target
+
+    title = _get_default_sidecar() if viewer is None else viewer
+    if title and _get_sidecar(title) is not None:
+        return None
+    return open_target(viewer, {key: kwargs.get(key) for key in LAYOUT_ARGS})[1]
+
+
+def show_async(
+    *cad_objs,
+    viewer=None,
+    anchor=None,
+    cad_width=None,
+    height=None,
+    theme=None,
+    pinning=None,
+    glass=None,
+    tools=None,
+    tree_width=None,
+    **kwargs,
+):
+    """
+    Show CAD objects like show(), with conversion, tessellation and upload in a
+    background thread. The viewer is opened (or looked up) right away, the model
+    is added when rendered.
+
+    A new show_async to the same viewer (sidecar title, or any cell viewer) cancels
+    the render in flight, its future raises a CancelledError.
+
+    Parameters: see show()
+
+    Returns: An awaitable future of the viewer when called from a running event
+    loop (e.g. a notebook cell), else a concurrent.futures.Future
+    """
+    layout = dict(
+        anchor=anchor,
+        cad_width=cad_width,
+        height=height,
+        theme=theme,
+        pinning=pinning,
+        glass=glass,
+        tools=tools,
+        tree_width=tree_width,
+    )
+    title, target = open_target(viewer, layout)
+    kwargs = dict(kwargs, **none_filter(dict(layout, viewer=viewer), None))
+
+    def render():
+        with target_viewer(target):
+            return show(*cad_objs, **kwargs)
+
+    return submit(title or "", render)
 
 
 def show_object(
@@ -297,6 +469,7 @@ def show_object(
     deviation=None,
     angular_tolerance=None,
     edge_accuracy=None,
+    triangle_budget=None,
     default_color=None,
     default_facecolor=None,
     default_thickedgecolor=None,
@@ -390,6 +563,8 @@ def show_object(
         deviation:               Shapes: Deviation from linear deflection value (default=0.1)
         angular_tolerance:       Shapes: Angular deflection in radians for tessellation (default=0.2)
         edge_accuracy:           Edges: Precision of edge discretization (default: mesh quality / 100)
+        triangle_budget:         Shapes: Tessellate relative to the scene size and refine large parts first,
+                                 keeping the rendered triangles below this number (default=None: per part)
 
         default_color:           Default mesh color (default=(232, 176, 36))
         default_edgecolor:       Default color of the edges of a mesh (default=(128, 128, 128))
@@ -417,8 +592,18 @@ def show_object(
 
     - Debug
         debug:                   Show debug statements to the VS Code browser console (default=False)
-        imeit:                   Show timing information from level 0-3 (default=False)
+        timeit:                  Show timing information from level 0-3 (default=False)
+                                 Stage timings are always available via `viewer.timings` and `get_timings()`
     """
 
-    kwargs = none_filter(locals(), ["obj"])
-    return _show_object(obj, **kwargs)
+    kwargs = none_filter(locals(), ["obj", "triangle_budget"])
+    invalidate_pick_index(obj)
+    target = pooled_target(viewer, kwargs)
+    with OBJECTS_LOCK, record() as timings, _triangle_budget(
+        triangle_budget
+    ), target_viewer(target):
+        viewer = _show_object(obj, **kwargs)
+
+    if viewer is not None:
+        viewer.timings = timings
+    return viewer
@@ -0,0 +1,174 @@
+"""Bounding box index of shapes for exact distance queries"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import numpy as np
+
+from OCP.Bnd import Bnd_Box
+from OCP.BRepAlgoAPI import BRepAlgoAPI_Common
+from OCP.BRepBndLib import BRepBndLib
+from OCP.BRepExtrema import BRepExtrema_DistShapeShape
+from OCP.BRepGProp import BRepGProp
+from OCP.GProp import GProp_GProps
+from ocp_tessellate.ocp_utils import get_edges, get_faces, get_vertices
+
+# above this number of candidate pairs, BRepExtrema on the full shapes is faster
+MAX_CANDIDATES = 250_000
+
+NO_RESULT = (np.nan,) * 7
+
+
+def bounding_box(shape):
+    """Axis aligned box (xmin, ymin, zmin, xmax, ymax, zmax) of a TopoDS_Shape"""
+    box = Bnd_Box()
+    # tight boxes from the geometry: boxes of the triangulation are enlarged by the
+    # deflection, which makes many face pairs look closer than the best distance
+    BRepBndLib.AddOptimal_s(shape, box, False, False)
+    if box.IsVoid():
+        return np.full(6, np.nan)
+    return np.array(box.Get())
+
+
+def box_distance(boxes1, boxes2):
+    """Lower bound of the distance between boxes, broadcasting (n, 6) against (m, 6)"""
+    gap = np.maximum(
+        0.0,
+        np.maximum(
+            boxes1[..., :3] - boxes2[..., 3:],
+            boxes2[..., :3] - boxes1[..., 3:],
+        ),
+    )
+    return np.sqrt(np.sum(gap * gap, axis=-1))
+
+
+def exact_distance(shape1, shape2):
+    """(distance, x1, y1, z1, x2, y2, z2) of the closest points of two shapes"""
+    dist = BRepExtrema_DistShapeShape(shape1, shape2)
+    if not dist.IsDone() or dist.NbSolution() == 0:
+        return NO_RESULT
+    p1 = dist.PointOnShape1(1)
+    p2 = dist.PointOnShape2(1)
+    return (dist.Value(), p1.X(), p1.Y(), p1.Z(), p2.X(), p2.Y(), p2.Z())
+
+
+def close_pairs(boxes, distance):
+    """
+    Index pairs (i, j), i < j, of the (n, 6) boxes closer than distance, by sweep and
+    prune along x instead of testing all n * (n - 1) / 2 pairs
+    """
+    order = np.argsort(boxes[:, 0], kind="stable")
+    boxes = boxes[order]
+    # boxes starting before the end of box k (plus distance) along x
+    ends = np.searchsorted(boxes[:, 0], boxes[:, 3] + distance, side="right")
+    pairs = []
+    for k, end in enumerate(ends):
+        if end <= k + 1:
+            continue
+        close = np.flatnonzero(box_distance(boxes[k], boxes[k + 1 : end]) <= distance)
+        for m in close + k + 1:
+            i, j = int(order[k]), int(order[m])
+            pairs.append((i, j) if i < j else (j, i))
+    return sorted(pairs)
+
+
+def common_volume(shape1, shape2):
+    """Volume of the intersection of two shapes, 0 if they only touch"""
+    common = BRepAlgoAPI_Common(shape1, shape2)
+    if not common.IsDone():
+        return np.nan
+    props = GProp_GProps()
+    BRepGProp.VolumeProperties_s(common.Shape(), props)
+    return max(0.0, props.Mass())
+
+
+class ShapeIndex:
+    """
+    Bounding boxes of the faces of a shape (edges for wires, vertices for points),
+    computed once and reused by all distance queries involving the shape
+    """
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.bbox = bounding_box(shape)
+        for explore in (get_faces, get_edges, get_vertices):
+            self.parts = list(explore(shape))
+            if self.parts:
+                break
+        else:
+            self.parts = [shape]
+        self.boxes = np.array([bounding_box(p) for p in self.parts]).reshape(-1, 6)
+        self.center = (self.bbox[:3] + self.bbox[3:]) / 2
+        self.centers = (self.boxes[:, :3] + self.boxes[:, 3:]) / 2
+
+    def __len__(self):
+        return len(self.parts)
+
+
+def _closest(lower, centers, center):
+    return int(np.lexsort((np.linalg.norm(centers - center, axis=1), lower))[0])
+
+
+def index_distance(index1, index2, limit=None):
+    """
+    Exact minimum distance of two indexed shapes by branch and bound over the boxes of
+    their faces: only face pairs whose boxes are closer than the best distance found
+    so far are handed to BRepExtrema.
+
+    With limit set, shapes whose boxes are further apart than limit are not measured
+    exactly and (lower bound, nan, ...) is returned.
+    """
+    lower = box_distance(index1.bbox, index2.bbox)
+    if limit is not None and lower > limit:
+        return (float(lower),) + NO_RESULT[1:]
+
+    # faces of one shape closer to the box of the other shape than the best distance
+    lower1 = box_distance(index1.boxes, index2.bbox)
+    lower2 = box_distance(index2.boxes, index1.bbox)
+
+    # any face pair gives an upper bound, the pair closest to each other's shape is a
+    # good guess. Many boxes touch or have the same distance, ties are broken by the
+    # distance of the box centers
+    i = _closest(lower1, index1.centers, index2.center)
+    j = _closest(lower2, index2.centers, index1.center)
+    best = exact_distance(index1.parts[i], index2.parts[j])
+    upper = best[0] if not np.isnan(best[0]) else np.inf
+
+    candidates1 = np.flatnonzero(lower1 <= upper)
+    candidates2 = np.flatnonzero(lower2 <= upper)
+    if len(candidates1) * len(candidates2) > MAX_CANDIDATES:
+        return exact_distance(index1.shape, index2.shape)
+
+    lower = box_distance(
+        index1.boxes[candidates1][:, None, :], index2.boxes[candidates2][None, :, :]
+    )
+    centers = np.linalg.norm(
+        index1.centers[candidates1][:, None, :]
+        - index2.centers[candidates2][None, :, :],
+        axis=-1,
+    )
+    order = np.lexsort((centers.ravel(), lower.ravel()))
+    rows, cols = np.unravel_index(order, lower.shape)
+    for k, row, col in zip(order, rows, cols):
+        if lower.flat[k] >= upper:
+            break
+        a, b = candidates1[row], candidates2[col]
+        if (a, b) == (i, j):
+            continue
+        result = exact_distance(index1.parts[a], index2.parts[b])
+        if result[0] < upper:
+            best, upper = result, result[0]
+    return best
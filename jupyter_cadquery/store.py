@@ -0,0 +1,184 @@
+"""Backend models of the server extension indexed by content hash"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import orjson
+
+# ensure the Jupyter Cadquery comms routines will be loaded
+os.environ["JUPYTER_CADQUERY"] = "1"
+from ocp_vscode.backend import ViewerBackend
+from ocp_vscode.comms import MessageType
+
+
+class UnknownViewerError(KeyError):
+    pass
+
+
+def build_model(raw_model):
+    """Build the backend model (shape id -> OCC shape) of a deserialized model"""
+    backend = ViewerBackend(port=0)
+    backend.load_model(raw_model)
+    return backend.model
+
+
+class ModelStore:
+    """
+    Loaded backend models (shape id -> OCC shape) indexed by the content hash of
+    the uploaded model and shared by all viewers showing the same model.
+
+    Models are reference counted by the viewers using them. A loaded model is never
+    mutated: a viewer showing a changed model releases the old and acquires a new
+    hash (copy-on-write), so memory scales with the number of distinct models.
+    Up to `retain` models without viewers are kept for a quick re-show.
+    """
+
+    def __init__(self, retain=4):
+        self.retain = retain
+        self.models = {}
+        self.sizes = {}
+        self.refcounts = {}
+        self.unreferenced = OrderedDict()
+
+    def __contains__(self, model_hash):
+        return model_hash in self.models
+
+    def __len__(self):
+        return len(self.models)
+
+    def get(self, model_hash):
+        return self.models.get(model_hash)
+
+    def add(self, model_hash, model, size):
+        if model_hash in self.models:
+            # loaded concurrently by another request, keep the first one
+            return self.models[model_hash]
+        self.models[model_hash] = model
+        self.sizes[model_hash] = size
+        self.refcounts[model_hash] = 0
+        self.unreferenced[model_hash] = None
+        return model
+
+    def acquire(self, model_hash):
+        self.refcounts[model_hash] += 1
+        self.unreferenced.pop(model_hash, None)
+
+    def release(self, model_hash):
+        if model_hash not in self.refcounts:
+            return
+        self.refcounts[model_hash] -= 1
+        if self.refcounts[model_hash] <= 0:
+            self.unreferenced[model_hash] = None
+            self.unreferenced.move_to_end(model_hash)
+            self._trim()
+
+    def _trim(self):
+        while len(self.unreferenced) > self.retain:
+            model_hash, _ = self.unreferenced.popitem(last=False)
+            del self.models[model_hash]
+            del self.sizes[model_hash]
+            del self.refcounts[model_hash]
+
+    def memory(self):
+        """Estimated memory of the loaded models (size of the serialized models)"""
+        return sum(self.sizes.values())
+
+
+class BackendHost:
+    """
+    The viewer backends and their shared models. Runs inside the Jupyter server
+    process or inside a backend worker process (see workers.py)
+    """
+
+    # calls return immediately, no need to offload them from the IOLoop
+    blocking = False
+
+    def __init__(self, retain=4):
+        self.models = ModelStore(retain=retain)
+        self.backends = {}
+        self.viewer_models = {}
+        # load runs in an executor thread, the other calls on the IOLoop
+        self.lock = threading.RLock()
+
+    def load(self, viewer, model_hash, raw_data):
+        """Load the serialized model for viewer and return the duration in seconds"""
+        start = time.perf_counter()
+        if self.attach(viewer, model_hash):
+            return time.perf_counter() - start
+
+        # parse and build outside of the lock, this is the expensive part
+        data = orjson.loads(raw_data)
+        if data is None or data.get("model") is None:
+            raise ValueError("Missing objects")
+        model = build_model(data["model"])
+        with self.lock:
+            # in one lock hold, so that no release can trim the unreferenced model
+            # before the viewer holds it
+            self.models.add(model_hash, model, len(raw_data))
+            if not self.attach(viewer, model_hash):
+                raise RuntimeError(f"Model {model_hash} vanished while loading")
+        return time.perf_counter() - start
+
+    def attach(self, viewer, model_hash):
+        """Attach an already loaded model to viewer, return False for unknown models"""
+        with self.lock:
+            model = self.models.get(model_hash)
+            if model is None:
+                return False
+
+            # the backend only holds the per viewer state (e.g. active tool), the
+            # model itself is shared with all viewers showing the same model
+            self.models.acquire(model_hash)
+            old_hash = self.viewer_models.get(viewer)
+            if old_hash is not None:
+                self.models.release(old_hash)
+
+            backend = ViewerBackend(port=0, jcv_id=viewer)
+            backend.model = model
+            self.backends[viewer] = backend
+            self.viewer_models[viewer] = model_hash
+            return True
+
+    def handle_event(self, viewer, message):
+        """Forward a measurement request to the backend of viewer"""
+        with self.lock:
+            backend = self.backends.get(viewer)
+        if backend is None:
+            raise UnknownViewerError(viewer)
+        return backend.handle_event(message, MessageType.UPDATES)
+
+    def release(self, viewer):
+        with self.lock:
+            self.backends.pop(viewer, None)
+            model_hash = self.viewer_models.pop(viewer, None)
+            if model_hash is not None:
+                self.models.release(model_hash)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "backends": len(self.backends),
+                "models": len(self.models),
+                "memory": self.models.memory(),
+            }
+
+    def shutdown(self):
+        pass
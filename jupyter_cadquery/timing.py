@@ -0,0 +1,192 @@
+"""Per-stage timings of show calls"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+from ocp_tessellate.utils import Timer
+
+__all__ = [
+    "get_timings",
+    "clear_timings",
+    "set_timings_history",
+    "timings_to_openmetrics",
+]
+
+STAGES = (
+    "conversion",
+    "tessellation",
+    "decimation",
+    "merge",
+    "serialization",
+    "widget_sync",
+    "backend_upload",
+    "load_model",
+)
+
+HISTORY = deque(maxlen=100)
+
+# timings of the running show call, per thread
+_LOCAL = threading.local()
+
+
+class ShowTimings:
+    """Durations in seconds of the stages of one show call"""
+
+    def __init__(self):
+        self.timestamp = time.time()
+        self.stages = {}
+        self.total = None
+
+    def add(self, stage, duration):
+        self.stages[stage] = self.stages.get(stage, 0.0) + duration
+
+    def to_dict(self):
+        return {
+            "timestamp": self.timestamp,
+            "total": self.total,
+            **{k: self.stages[k] for k in STAGES if k in self.stages},
+            **{k: v for k, v in self.stages.items() if k not in STAGES},
+        }
+
+    def __repr__(self):
+        stages = ", ".join(
+            f"{k}={v:.3f}"
+            for k, v in self.to_dict().items()
+            if k != "timestamp" and v is not None
+        )
+        return f"ShowTimings({stages})"
+
+
+@contextmanager
+def record():
+    """Collect the stage timings of the show call executed in this context"""
+    outer = getattr(_LOCAL, "current", None)
+    if outer is not None:
+        # nested show calls (e.g. show_object -> show) are accounted to the outer one
+        yield outer
+        return
+
+    timings = ShowTimings()
+    _LOCAL.current = timings
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings.total = time.perf_counter() - start
+        _LOCAL.current = None
+        if timings.stages:
+            HISTORY.append(timings)
+
+
+def add_stage(stage, duration):
+    """Add a duration measured elsewhere (e.g. on the server) to the current show call"""
+    current = getattr(_LOCAL, "current", None)
+    if current is not None and duration is not None:
+        current.add(stage, duration)
+
+
+@contextmanager
+def stage(name, timeit=False, level=1):
+    """Time a stage of the current show call and print it if timeit is set"""
+    start = time.perf_counter()
+    with Timer(False if timeit is None else timeit, "", name, level):
+        try:
+            yield
+        finally:
+            add_stage(name, time.perf_counter() - start)
+
+
+def timed(name, func):
+    """Wrap func so that every call is accounted to stage name"""
+    if getattr(func, "_jcq_stage", None) is not None:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            add_stage(name, time.perf_counter() - start)
+
+    wrapper._jcq_stage = name
+    return wrapper
+
+
+def instrument(module):
+    """Account the conversion steps of ocp_vscode.show to their stages"""
+    for attr, name in (
+        ("to_ocpgroup", "conversion"),
+        ("tessellate_group", "tessellation"),
+        ("numpy_to_buffer_json", "serialization"),
+    ):
+        setattr(module, attr, timed(name, getattr(module, attr)))
+
+
+#
+# History API
+#
+
+
+def get_timings(last=None):
+    """
+    Get the stage timings of the last show calls, oldest first
+
+    Parameters:
+        last:  Only return the last n entries (default: all entries of the history)
+    """
+    result = [t.to_dict() for t in HISTORY]
+    return result if last is None else result[-last:]
+
+
+def clear_timings():
+    """Clear the timings history"""
+    HISTORY.clear()
+
+
+def set_timings_history(size):
+    """Set the number of show calls kept in the timings history (default=100)"""
+    global HISTORY
+    HISTORY = deque(HISTORY, maxlen=size)
+
+
+def timings_to_openmetrics():
+    """Export the timings history as OpenMetrics text, one summary per stage"""
+    stats = {}
+    for timings in HISTORY:
+        for name, duration in timings.to_dict().items():
+            if name == "timestamp" or duration is None:
+                continue
+            count, total = stats.get(name, (0, 0.0))
+            stats[name] = (count + 1, total + duration)
+
+    metric = "jupyter_cadquery_show_stage_seconds"
+    lines = [
+        f"# TYPE {metric} summary",
+        f"# UNIT {metric} seconds",
+        f"# HELP {metric} Duration of the stages of show calls.",
+    ]
+    for name, (count, total) in stats.items():
+        lines.append(f'{metric}_count{{stage="{name}"}} {count}')
+        lines.append(f'{metric}_sum{{stage="{name}"}} {total:.6f}')
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
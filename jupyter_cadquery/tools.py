@@ -14,6 +14,7 @@
 # limitations under the License.
 #
 
+import weakref
 
 import numpy as np
 
@@ -23,6 +24,8 @@ from ocp_tessellate.ocp_utils import is_build123d_assembly, is_cadquery_assembly
 from ocp_tessellate.utils import numpy_to_json
 from ocp_vscode import show
 
+from .measure import model_mapping
+
 try:
     import cadquery as cq
 
@@ -68,22 +71,163 @@ def auto_show():
         )
 
 
-def get_pick(assembly, pick):
+#
+# Pick resolution
+#
+
+SUBSHAPES = ("faces", "edges", "vertices")
+
+# id(assembly) -> PickIndex, dropped when the assembly is shown again or deleted
+_PICK_INDEXES = {}
+
+
+class PickIndex:
+    """
+    Viewer tree paths and shape ids of a shown CadQuery or build123d assembly mapped to
+    the assembly nodes they belong to.
+
+    The ids are taken from the same conversion show() uses and are paired with the
+    assembly nodes by name (CadQuery) or by the order of the children (build123d).
+    """
+
+    def __init__(self, assembly):
+        self.is_cadquery = is_cadquery_assembly(assembly)
+        self.nodes = {}
+        self.ids = []
+        self.order = {}
+
+        mapping = model_mapping(assembly)
+        self.root = mapping["id"]
+        node = assembly
+        if self.is_cadquery:
+            # show() unwraps assemblies with one child and without shape
+            name = self.root.rsplit("/", 1)[-1]
+            while node.name != name and node.obj is None and len(node.children) == 1:
+                node = node.children[0]
+        self._node(self.root, node)
+        self._walk(mapping, node)
+
+    def _node(self, id_, node):
+        self.nodes[id_] = node
+        self.order[id_] = len(self.ids)
+        self.ids.append(id_)
+
+    def _add(self, entry, node):
+        self._node(entry["id"], node)
+        for part in entry.get("parts", ()):
+            self._add(part, node)
+
+    def _walk(self, group, node):
+        if self.is_cadquery:
+            children = {child.name: child for child in node.children}
+            pairs = [
+                (entry, children.get(entry["id"].rsplit("/", 1)[-1]))
+                for entry in group["parts"]
+            ]
+        else:
+            # one entry per child, joints come last
+            children = list(node.children)
+            pairs = [
+                (entry, children[i] if i < len(children) else None)
+                for i, entry in enumerate(group["parts"])
+            ]
+
+        for entry, child in pairs:
+            if child is None:
+                # shape of the node itself (CadQuery), mates or joints
+                self._add(entry, node)
+            elif entry.get("parts") is not None and child.children:
+                self._node(entry["id"], child)
+                self._walk(entry, child)
+            else:
+                self._add(entry, child)
+
+    def _id(self, pick):
+        if isinstance(pick, dict):
+            id_ = "/".join([pick["path"], pick["name"]])
+        else:
+            id_ = pick
+        if id_ in self.nodes:
+            return id_
+
+        # shown together with other objects, e.g. /Group/<root>/...
+        start = (id_ + "/").find(self.root + "/")
+        if start > 0:
+            id_ = id_[start:]
+            if id_ in self.nodes:
+                return id_
+
+        # shape ids of faces, edges and vertices belong to their part
+        parts = id_.rsplit("/", 2)
+        if len(parts) == 3 and parts[1] in SUBSHAPES and parts[0] in self.nodes:
+            return parts[0]
+
+        raise KeyError(f"{id_} is not part of the assembly")
+
+    def __contains__(self, pick):
+        try:
+            self._id(pick)
+            return True
+        except KeyError:
+            return False
+
+    def __getitem__(self, pick):
+        return self.nodes[self._id(pick)]
+
+    def get(self, pick, default=None):
+        try:
+            return self[pick]
+        except KeyError:
+            return default
+
+    def get_many(self, picks):
+        """Nodes of several picks (multi-pick)"""
+        return [self.get(pick) for pick in picks]
+
+    def get_range(self, first, last):
+        """Distinct nodes of all tree entries from first to last (range-pick)"""
+        start, end = sorted((self.order[self._id(first)], self.order[self._id(last)]))
+        nodes = [self.nodes[i] for i in self.ids[start : end + 1]]
+        return list({id(node): node for node in nodes}.values())
+
+
+def get_pick_index(assembly):
+    """The pick index of an assembly, built once until the assembly is shown again"""
+    key = id(assembly)
+    index = _PICK_INDEXES.get(key)
+    if index is None or index.assembly() is not assembly:
+        index = PickIndex(assembly)
+        index.assembly = weakref.ref(assembly, lambda _: _PICK_INDEXES.pop(key, None))
+        _PICK_INDEXES[key] = index
+    return index
+
+
+def invalidate_pick_index(*cad_objs):
+    for cad_obj in cad_objs:
+        _PICK_INDEXES.pop(id(cad_obj), None)
+
+
+def get_pick(assembly, pick, last=None):
+    """
+    Get the assembly node of a pick in the viewer, e.g. get_pick(assy, cv.last_pick)
+
+    Parameters:
+        assembly:  The shown CadQuery or build123d assembly
+        pick:      A pick of the viewer (cv.last_pick), a viewer tree path or shape id,
+                   or a list of them (multi-pick)
+        last:      With last, all nodes from pick to last in tree order (range-pick)
+    """
     if pick == {}:
         print("First double click on an object in the CAD viewer")
         return None
 
-    path = pick["path"]
-    name = pick["name"]
-    id_ = "/".join([path, name])
+    if not (is_cadquery_assembly(assembly) or is_build123d_assembly(assembly)):
+        print("Only CadQuery and build123d assemblies are supported")
+        return None
 
-    if is_cadquery_assembly(assembly):
-        short_path = "/".join(id_.split("/")[2:])
-        if assembly.objects.get(short_path) is not None:
-            return assembly.objects[short_path]
-        else:
-            short_path = "/".join(id_.split("/")[2:-1])
-            if assembly.objects.get(short_path) is not None:
-                return assembly.objects[short_path]
-    else:
-        print("Currently only CadQuery is supported")
+    index = get_pick_index(assembly)
+    if last is not None:
+        return index.get_range(pick, last)
+    elif isinstance(pick, (list, tuple)):
+        return index.get_many(pick)
+    return index.get(pick)
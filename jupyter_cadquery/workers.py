@@ -0,0 +1,264 @@
+"""Backend worker processes of the Jupyter server extension"""
+
+#
+# Copyright 2025 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# IPC protocol
+#
+# Every request is a tuple (op, args) sent over a multiprocessing pipe, op being
+# one of the BackendHost methods "load", "attach", "handle_event", "release" and
+# "stats". Models travel as the raw (uncompressed) bytes of the uploaded JSON.
+# The worker answers with (status, result):
+#   ("ok", result)      the call succeeded
+#   ("unknown", viewer) the viewer has no backend in this worker
+#   ("error", message)  the call raised, the worker is still healthy
+#   ("fatal", message)  the worker ran out of memory and exits
+#
+
+import multiprocessing
+import threading
+
+try:
+    import resource
+
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+from .store import BackendHost, UnknownViewerError
+
+OPS = ("load", "attach", "handle_event", "release", "stats")
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+def _serve(conn, memory_limit):
+    if memory_limit and HAS_RESOURCE:
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    host = BackendHost()
+    while True:
+        try:
+            op, args = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        if op == "stop":
+            break
+        elif op not in OPS:
+            conn.send(("error", f"Unknown operation {op}"))
+            continue
+
+        try:
+            conn.send(("ok", getattr(host, op)(*args)))
+        except MemoryError:
+            conn.send(("fatal", f"Memory limit of {memory_limit} MB exceeded"))
+            break
+        except UnknownViewerError as ex:
+            conn.send(("unknown", str(ex)))
+        except Exception as ex:  # pylint: disable=broad-except
+            conn.send(("error", f"{type(ex).__name__}: {ex}"))
+
+
+class Worker:
+    def __init__(self, index, memory_limit=0, log=None):
+        self.index = index
+        self.memory_limit = memory_limit
+        self.log = log
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.process = None
+        self.conn = None
+        self.start()
+
+    def start(self):
+        # spawn, since forking the Jupyter server with its IOLoop and threads is unsafe
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_serve,
+            args=(child, self.memory_limit),
+            name=f"jupyter-cadquery-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.generation += 1
+
+    def restart(self, reason):
+        if self.log is not None:
+            self.log.error(f"Restarting backend worker {self.index}: {reason}")
+        self.stop()
+        self.start()
+
+    def stop(self):
+        try:
+            self.conn.send(("stop", ()))
+        except (OSError, ValueError):
+            pass
+        self.conn.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+    def call(self, op, *args):
+        with self.lock:
+            if not self.process.is_alive():
+                self.restart(f"process exited with code {self.process.exitcode}")
+
+            try:
+                self.conn.send((op, args))
+                status, result = self.conn.recv()
+            except (EOFError, OSError) as ex:
+                self.restart(f"{type(ex).__name__}: {ex}")
+                raise WorkerError(f"Backend worker {self.index} died") from ex
+
+            if status == "fatal":
+                self.restart(result)
+                raise WorkerError(result)
+
+        if status == "unknown":
+            raise UnknownViewerError(args[0])
+        elif status == "error":
+            raise WorkerError(result)
+        return result
+
+
+class WorkerPool:
+    """
+    Host the viewer backends in worker processes, so that huge models do not
+    bloat the Jupyter server and a crash in OCC only takes down one worker.
+
+    Models are placed on a worker by their content hash, so that all viewers
+    showing the same model share it in the same worker.
+    """
+
+    # calls block on the workers and should be offloaded from the IOLoop
+    blocking = True
+
+    def __init__(self, workers=1, memory_limit=0, log=None):
+        self.workers = [Worker(i, memory_limit, log) for i in range(workers)]
+        self.viewers = {}  # viewer -> (worker, generation of the worker)
+        self.lock = threading.Lock()
+
+    def _worker_for_model(self, model_hash):
+        return self.workers[int(model_hash[:8], 16) % len(self.workers)]
+
+    def _worker_for_viewer(self, viewer):
+        with self.lock:
+            worker, generation = self.viewers.get(viewer, (None, None))
+        if worker is None or worker.generation != generation:
+            # the viewer was never loaded or its worker has been restarted
+            return None
+        return worker
+
+    def _move(self, viewer, worker):
+        old = self._worker_for_viewer(viewer)
+        if old is not None and old is not worker:
+            old.call("release", viewer)
+        with self.lock:
+            self.viewers[viewer] = (worker, worker.generation)
+
+    def load(self, viewer, model_hash, raw_data):
+        worker = self._worker_for_model(model_hash)
+        result = worker.call("load", viewer, model_hash, raw_data)
+        self._move(viewer, worker)
+        return result
+
+    def attach(self, viewer, model_hash):
+        worker = self._worker_for_model(model_hash)
+        if worker.call("attach", viewer, model_hash):
+            self._move(viewer, worker)
+            return True
+        return False
+
+    def handle_event(self, viewer, message):
+        worker = self._worker_for_viewer(viewer)
+        if worker is None:
+            raise UnknownViewerError(viewer)
+        return worker.call("handle_event", viewer, message)
+
+    def release(self, viewer):
+        worker = self._worker_for_viewer(viewer)
+        with self.lock:
+            self.viewers.pop(viewer, None)
+        if worker is not None:
+            worker.call("release", viewer)
+
+    def stats(self):
+        result = {"backends": 0, "models": 0, "memory": 0}
+        for worker in self.workers:
+            try:
+                stats = worker.call("stats")
+            except WorkerError:
+                continue
+            for k, v in stats.items():
+                result[k] += v
+        return result
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+if __name__ == "__main__":
+    #
+    # Local test harness: python -m jupyter_cadquery.workers
+    # Starts two workers, loads the backend logo and measures it. No Jupyter
+    # server or kernel is needed.
+    #
+    import os
+    import signal
+    import time
+
+    import orjson
+    from ocp_vscode.backend_logo import logo
+
+    from .compression import content_hash
+
+    pool = WorkerPool(workers=2, memory_limit=0)
+    try:
+        raw_data = orjson.dumps({"model": logo})
+        model_hash = content_hash(raw_data)
+
+        duration = pool.load("viewer-1", model_hash, raw_data)
+        print(f"load:    {duration:.3f} sec")
+        print(f"attach:  {pool.attach('viewer-2', model_hash)}")
+        print(f"stats:   {pool.stats()}")
+
+        shape_id = logo["parts"][0]["id"]
+        pool.handle_event("viewer-1", {"activeTool": "PropertiesMeasurement"})
+        start = time.perf_counter()
+        result = pool.handle_event("viewer-1", {"selectedShapeIDs": [shape_id]})
+        print(f"measure: {(time.perf_counter() - start) * 1000:.2f} ms, {result}")
+
+        worker = pool._worker_for_viewer("viewer-1")
+        os.kill(worker.process.pid, signal.SIGKILL)
+        worker.process.join()
+        try:
+            pool.handle_event("viewer-1", {"selectedShapeIDs": [shape_id]})
+        except (UnknownViewerError, WorkerError) as ex:
+            print(f"after crash: {type(ex).__name__} {ex}")
+        print(f"reattach after restart: {pool.attach('viewer-1', model_hash)}")
+        print(f"reload:  {pool.load('viewer-1', model_hash, raw_data):.3f} sec")
+        print(f"stats:   {pool.stats()}")
+    finally:
+        pool.shutdown()
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+from ocp_tessellate.utils import Color
+
+from jupyter_cadquery.arrays import (
+    CHUNKING,
+    RawMesh,
+    add_parts,
+    set_array_chunking,
+    split,
+)
+from jupyter_cadquery.features import viewer_supports
+
+
+def tetrahedron(**kwargs):
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=float)
+    triangles = np.array([[0, 2, 1], [0, 1, 3], [0, 3, 2], [1, 2, 3]])
+    return RawMesh(vertices, triangles, **kwargs)
+
+
+def test_split_keeps_cad_objects():
+    cad, points = object(), np.zeros((5, 3))
+    objs, names, colors, alphas, parts = split(
+        [cad, points], ["cad", "cloud"], ["red", "blue"], [0.5, 1.0]
+    )
+    assert objs == [cad]
+    assert (names, colors, alphas) == (["cad"], ["red"], [0.5])
+    assert [p["name"] for p in parts] == ["cloud"]
+    assert parts[0]["type"] == "vertices"
+
+
+@pytest.mark.parametrize(
+    "color, web_color",
+    [("red", "#ff0000"), ("#00ff00", "#00ff00"), ((0, 0, 255), "#0000ff")],
+)
+def test_raw_mesh_with_colors_and_alphas(color, web_color):
+    _, _, _, _, (part,) = split([tetrahedron()], None, [color], [0.25])
+    assert part["type"] == "shapes"
+    assert part["color"] == web_color
+    assert part["alpha"] == 0.25
+
+
+def test_users_color_is_not_modified():
+    color = Color("red")
+    _, _, _, _, (part,) = split([tetrahedron()], None, [color], [0.5])
+    assert part["alpha"] == 0.5
+    assert color.a == 1.0
+
+
+def test_mesh_color_and_default():
+    _, _, _, _, parts = split(
+        [tetrahedron(color="yellow"), tetrahedron()], None, None, None
+    )
+    assert parts[0]["color"] == "#ffff00"
+    assert parts[0]["alpha"] == 1.0
+    assert parts[1]["color"].startswith("#")
+
+
+def test_normals_and_bounding_box():
+    _, _, _, _, (part,) = split([tetrahedron(name="tet")], None, None, None)
+    normals = part["shape"]["normals"]
+    np.testing.assert_allclose(np.linalg.norm(normals, axis=1), 1, atol=1e-6)
+    assert part["bb"] == {
+        "xmin": 0.0,
+        "xmax": 1.0,
+        "ymin": 0.0,
+        "ymax": 1.0,
+        "zmin": 0.0,
+        "zmax": 1.0,
+    }
+
+    shapes = {"id": "/Group", "parts": [{"name": "tet"}], "bb": None}
+    add_parts(shapes, [part])
+    assert [p["name"] for p in shapes["parts"]] == ["tet", "tet_1"]
+    assert shapes["parts"][1]["id"] == "/Group/tet_1"
+
+
+def test_vertex_colors_need_a_viewer():
+    colors = np.zeros((4, 3), dtype=np.uint8)
+    if viewer_supports("vertex_colors"):
+        mesh = tetrahedron(colors=colors)
+        assert mesh.colors is not None
+    else:
+        with pytest.warns(UserWarning, match="vertex colors"):
+            mesh = tetrahedron(colors=colors)
+        _, _, _, _, (part,) = split([mesh], None, None, None)
+        assert "colors" not in part["shape"]
+
+
+def test_chunking_needs_a_viewer(monkeypatch):
+    monkeypatch.setitem(CHUNKING, "chunk_size", None)
+    if viewer_supports("array_chunks"):
+        pytest.skip("the installed viewer reassembles chunked arrays")
+    with pytest.raises(RuntimeError):
+        set_array_chunking(1024)
+    assert CHUNKING["chunk_size"] is None
+    set_array_chunking(None)
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+from OCP.BRep import BRep_Tool
+from OCP.BRepPrimAPI import BRepPrimAPI_MakeCylinder
+from OCP.TopLoc import TopLoc_Location
+from ocp_tessellate.cad_objects import OcpGroup, OcpObject
+from ocp_tessellate.ocp_utils import get_faces
+from ocp_tessellate.tessellator import cache
+
+from jupyter_cadquery import budget
+from jupyter_cadquery.budget import (
+    _Part,
+    budgeted,
+    get_tessellation_plan,
+    triangle_budget,
+)
+
+
+def cylinder():
+    shape = BRepPrimAPI_MakeCylinder(10.0, 30.0).Shape()
+    return {"obj": shape, "cache_id": f"test_budget_{id(shape)}", "name": "cyl"}
+
+
+def triangulated(shape):
+    return any(
+        BRep_Tool.Triangulation_s(face, TopLoc_Location()) is not None
+        for face in get_faces(shape)
+    )
+
+
+def test_levels_leave_the_users_shape_alone():
+    instance = cylinder()
+    part = _Part(instance, 1, 0.1, 0.2, True)
+    fine, coarse = part.mesh(1.0), part.mesh(8.0)
+    assert coarse < fine
+    assert not triangulated(instance["obj"])
+
+
+@pytest.mark.parametrize("render_edges", [True, False])
+def test_cached_levels_are_not_meshed_again(monkeypatch, render_edges):
+    part = _Part(cylinder(), 2, 0.1, 0.2, render_edges)
+    triangles = part.mesh(4.0)
+    size = len(cache)
+
+    def clean(shape):
+        raise AssertionError("cached level meshed again")
+
+    monkeypatch.setattr(budget.BRepTools, "Clean_s", clean)
+    assert part.mesh(4.0) == triangles
+    assert len(cache) == size
+
+
+def test_plans_are_kept_per_thread():
+    instance = cylinder()
+    group = OcpGroup([OcpObject("solid", ref=0, name="cyl")])
+    tessellate_group = budgeted(lambda group, instances, kwargs: None)
+    barrier, plans = threading.Barrier(2), {}
+    main = get_tessellation_plan()
+
+    def show(budget):
+        with triangle_budget(budget):
+            tessellate_group(group, [instance], {})
+        barrier.wait()
+        plans[budget] = get_tessellation_plan()
+
+    threads = [threading.Thread(target=show, args=(b,)) for b in (100, 5000)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert {b: plan["budget"] for b, plan in plans.items()} == {100: 100, 5000: 5000}
+    assert [p["name"] for p in plans[100]["parts"]] == ["cyl"]
+    assert get_tessellation_plan() is main
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+
+import orjson
+import pytest
+
+from jupyter_cadquery import app
+from jupyter_cadquery.channel import HEADER, pack, unpack
+
+
+def test_frame_round_trip():
+    body = orjson.dumps({"viewer": "v1", "data": ["/Group/Solid"]})
+    for request_id in (0, 1, 2**32 + 5, 2**64 - 1):
+        frame = pack(request_id, body)
+        assert len(frame) == HEADER.size + len(body) == 8 + len(body)
+        assert unpack(frame) == (request_id, body)
+
+
+def test_frame_ids_are_little_endian():
+    assert pack(1, b"")[:8] == b"\x01" + b"\x00" * 7
+
+
+@pytest.mark.parametrize("frame", [b"", b"1234567", "text frame"])
+def test_frames_without_request_id(frame):
+    with pytest.raises(ValueError):
+        unpack(frame)
+
+
+class Socket:
+    """The parts of MeasureSocketHandler that reply uses"""
+
+    metrics_name = "measure_ws"
+    log = logging.getLogger("test_channel")
+
+    def __init__(self):
+        self.sent = []
+
+    async def write_message(self, message, binary=False):
+        self.sent.append(unpack(message))
+
+
+def reply(frame, monkeypatch, measure=None):
+    if measure is not None:
+        monkeypatch.setattr(app, "measure", measure)
+    socket = Socket()
+    asyncio.run(app.MeasureSocketHandler.reply(socket, frame))
+    return [(request_id, orjson.loads(body)) for request_id, body in socket.sent]
+
+
+def test_reply(monkeypatch):
+    async def measure(viewer, data, log):
+        return {"success": [viewer, data]}
+
+    frame = pack(7, orjson.dumps({"viewer": "v1", "data": {"a": 1}}))
+    assert reply(frame, monkeypatch, measure) == [(7, {"success": ["v1", {"a": 1}]})]
+
+
+@pytest.mark.parametrize("body", [b"{not json", b"[1, 2]"])
+def test_malformed_request_gets_an_error_frame(monkeypatch, body):
+    ((request_id, result),) = reply(pack(42, body), monkeypatch)
+    assert request_id == 42
+    assert result["error"].startswith("Malformed request")
+
+
+def test_failed_measurement_gets_an_error_frame(monkeypatch):
+    async def measure(viewer, data, log):
+        raise RuntimeError("boom")
+
+    frame = pack(3, orjson.dumps({"viewer": "v1", "data": {}}))
+    assert reply(frame, monkeypatch, measure) == [
+        (3, {"error": "Measurement failed: boom"})
+    ]
+
+
+def test_frame_without_request_id_is_dropped(monkeypatch):
+    assert reply(b"1234", monkeypatch) == []
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from jupyter_cadquery.compression import (
+    CODECS,
+    PayloadTooLarge,
+    compress,
+    content_hash,
+    content_hasher,
+    decompress,
+    decompressor,
+)
+
+# compressible, but not trivially
+PAYLOAD = b"".join(os.urandom(16) * 64 for _ in range(2048))
+
+CODEC_PARAMS = [None] + CODECS
+
+
+def encoded(codec):
+    return PAYLOAD if codec is None else compress(PAYLOAD, codec)
+
+
+def decode(codec, limit, chunk_size=65536):
+    decoder = decompressor(codec, limit)
+    data = encoded(codec)
+    return b"".join(
+        decoder.decompress(data[i : i + chunk_size])
+        for i in range(0, len(data), chunk_size)
+    )
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_round_trip(codec):
+    assert decompress(compress(PAYLOAD, codec), codec) == PAYLOAD
+
+
+@pytest.mark.parametrize("codec", CODEC_PARAMS)
+@pytest.mark.parametrize("limit", [None, len(PAYLOAD)])
+def test_streaming_within_the_limit(codec, limit):
+    assert decode(codec, limit) == PAYLOAD
+
+
+@pytest.mark.parametrize("codec", CODEC_PARAMS)
+@pytest.mark.parametrize("limit", [0, 1000, len(PAYLOAD) - 1])
+def test_streaming_beyond_the_limit(codec, limit):
+    with pytest.raises(PayloadTooLarge):
+        decode(codec, limit)
+
+
+@pytest.mark.parametrize("codec", CODEC_PARAMS)
+def test_small_chunks(codec):
+    assert decode(codec, len(PAYLOAD), chunk_size=7) == PAYLOAD
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        decompressor("gzip")
+
+
+def test_incremental_hash():
+    hasher = content_hasher()
+    for i in range(0, len(PAYLOAD), 1000):
+        hasher.update(PAYLOAD[i : i + 1000])
+    assert hasher.hexdigest() == content_hash(PAYLOAD)
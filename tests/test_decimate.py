@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from jupyter_cadquery.decimate import (
+    _clusters,
+    _hard_vertices,
+    _place,
+    _weld,
+    decimate_mesh,
+)
+
+
+def surface(n=150, faces=1):
+    """Smooth height field of 2 * (n-1)**2 triangles, split into faces"""
+    x, y = np.meshgrid(np.linspace(0, 10, n), np.linspace(0, 10, n))
+    z = np.sin(x) * np.cos(y)
+    vertices = np.column_stack([x.ravel(), y.ravel(), z.ravel()])
+
+    index = np.arange(n * n).reshape(n, n)
+    a, b = index[:-1, :-1].ravel(), index[:-1, 1:].ravel()
+    c, d = index[1:, :-1].ravel(), index[1:, 1:].ravel()
+    triangles = np.concatenate([np.column_stack([a, b, d]), np.column_stack([a, d, c])])
+
+    p0, p1, p2 = (vertices[triangles[:, k]] for k in range(3))
+    cross = np.cross(p1 - p0, p2 - p0)
+    normals = cross / np.linalg.norm(cross, axis=1)[:, None]
+
+    # every triangle gets its own corners, as faces of ocp_tessellate do
+    per_face = np.full(faces, len(triangles) // faces)
+    per_face[-1] += len(triangles) - per_face.sum()
+    return {
+        "vertices": vertices[triangles].astype(np.float32).ravel(),
+        "triangles": np.arange(3 * len(triangles), dtype=np.int32),
+        "normals": np.repeat(normals, 3, axis=0).astype(np.float32).ravel(),
+        "triangles_per_face": per_face.astype(np.int32),
+        "edges": np.zeros(6, dtype=np.float32),
+        "edge_types": np.zeros(1, dtype=np.int32),
+        "segments_per_edge": np.ones(1, dtype=np.int32),
+        "obj_vertices": np.zeros(3, dtype=np.float32),
+    }
+
+
+def count(mesh):
+    return len(mesh["triangles"]) // 3
+
+
+def test_ratio_target():
+    mesh = surface()
+    result = decimate_mesh(mesh, ratio=0.1)
+    assert 0.05 * count(mesh) < count(result) <= 0.1 * count(mesh)
+    assert result["triangles_per_face"].sum() == count(result)
+    assert len(result["normals"]) == len(result["vertices"])
+
+
+def test_error_bounds_vertex_displacement():
+    mesh = surface()
+    error = 0.3
+    result = decimate_mesh(mesh, error=error)
+    assert count(result) < 0.5 * count(mesh)
+
+    # same steps as decimate_mesh, every vertex to the position of its cluster
+    vertices = mesh["vertices"].reshape(-1, 3)
+    triangles = mesh["triangles"].reshape(-1, 3)
+    welded = _weld(vertices)
+    points = np.zeros((welded.max() + 1, 3))
+    points[welded] = vertices
+    wt = welded[triangles]
+    hard = _hard_vertices(
+        wt, mesh["normals"].reshape(-1, 3)[triangles[:, 0]], len(points), 30
+    )
+    clusters = _clusters(points, hard, error / np.sqrt(3))
+    position = _place(points, wt, clusters, hard)
+
+    moved = np.linalg.norm(points - position[clusters], axis=1)
+    assert moved.max() <= error * (1 + 1e-6)
+    assert np.all(moved[hard] == 0)
+
+
+def test_edges_of_real_breps_are_kept():
+    mesh = surface(faces=4)
+    result = decimate_mesh(mesh, ratio=0.1)
+    np.testing.assert_array_equal(result["edges"], mesh["edges"])
+    np.testing.assert_array_equal(result["obj_vertices"], mesh["obj_vertices"])
+
+
+def test_edges_of_mesh_breps_are_dropped():
+    mesh = surface(n=40)
+    mesh["triangles_per_face"] = np.ones(count(mesh), dtype=np.int32)
+    result = decimate_mesh(mesh, ratio=0.2)
+    assert count(result) <= 0.2 * count(mesh)
+    assert len(result["edges"]) == 0
+    assert len(result["segments_per_edge"]) == 0
+    assert len(result["obj_vertices"]) == 0
+
+
+@pytest.mark.parametrize("ratio", [0.05, 0.5])
+def test_decimated_vertices_stay_on_surface(ratio):
+    result = decimate_mesh(surface(), ratio=ratio)
+    x, y, z = result["vertices"].reshape(-1, 3).T
+    # cells of a coarse ratio are larger, the surface curves within them
+    assert np.abs(z - np.sin(x) * np.cos(y)).max() < 0.5
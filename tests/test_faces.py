@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+from OCP.BRepPrimAPI import BRepPrimAPI_MakeBox
+from ocp_tessellate.tessellator import tessellate
+
+from jupyter_cadquery.faces import (
+    FACE_CACHE,
+    face_cached,
+    face_stats,
+    get_face_cache_stats,
+)
+
+
+@pytest.fixture
+def face_cache(monkeypatch):
+    monkeypatch.setitem(FACE_CACHE, "enabled", True)
+    return face_cached(tessellate)
+
+
+def test_stats_are_kept_per_thread(face_cache):
+    barrier, results = threading.Barrier(2), {}
+    main = get_face_cache_stats()
+
+    def show(name, size):
+        box = BRepPrimAPI_MakeBox(size, 1.0, 1.0).Shape()
+        with face_stats():
+            face_cache(box, f"test_faces_{name}_{id(box)}", 0.1, 0.01, 0.2)
+            face_cache(box, f"test_faces_{name}_{id(box)}_again", 0.1, 0.01, 0.2)
+        barrier.wait()
+        results[name] = get_face_cache_stats()
+
+    threads = [
+        threading.Thread(target=show, args=(name, size))
+        for name, size in (("a", 2.0), ("b", 3.0))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for stats in results.values():
+        assert stats == {"hits": 6, "misses": 6, "hit_rate": 0.5}
+    assert get_face_cache_stats() == main
+
+
+def test_nested_shows_count_into_the_outer_one():
+    with face_stats() as outer:
+        with face_stats() as inner:
+            inner["hits"] += 1
+    assert inner is outer
+    assert get_face_cache_stats()["hits"] == 1
@@ -0,0 +1,29 @@
+import pytest
+
+from jupyter_cadquery import features
+from jupyter_cadquery.comms import MESH_ENCODING, set_mesh_encoding
+from jupyter_cadquery.features import require_viewer, viewer_supports
+
+
+def test_versions(monkeypatch):
+    monkeypatch.setitem(features.VIEWER_FEATURES, "test", ("draw tests", "3.1.0"))
+    assert not viewer_supports("test", "3.0.2")
+    assert viewer_supports("test", "3.1.0")
+    assert viewer_supports("test", "3.10.0rc1")
+    assert viewer_supports("test", "4.0")
+
+
+def test_unreleased_feature_is_refused(monkeypatch):
+    monkeypatch.setitem(features.VIEWER_FEATURES, "test", ("draw tests", None))
+    assert not viewer_supports("test", "99.0.0")
+    with pytest.raises(RuntimeError, match="draw tests"):
+        require_viewer("test")
+
+
+def test_quantized_meshes_need_a_viewer(monkeypatch):
+    monkeypatch.setitem(MESH_ENCODING, "encoding", None)
+    if viewer_supports("quantized_meshes"):
+        pytest.skip("the installed viewer decodes quantized meshes")
+    with pytest.raises(RuntimeError):
+        set_mesh_encoding("quantized")
+    assert MESH_ENCODING["encoding"] is None
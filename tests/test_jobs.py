@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+from jupyter_cadquery.jobs import (
+    Superseded,
+    cancellable,
+    check,
+    current_job,
+    in_kernel,
+    submit,
+)
+
+
+def test_result_and_errors():
+    assert submit("test_result", lambda x: 2 * x, 21).result(5) == 42
+
+    def fail():
+        raise ValueError("no shapes")
+
+    with pytest.raises(ValueError):
+        submit("test_result", fail).result(5)
+
+
+def blocked(started, release, steps):
+    """A show function waiting for release before its next checkpoint"""
+
+    @cancellable
+    def tessellate():
+        steps.append("tessellate")
+
+    def show():
+        started.set()
+        release.wait(5)
+        tessellate()
+        return "viewer"
+
+    return show
+
+
+def test_newer_show_supersedes_the_running_one():
+    started, release, steps = threading.Event(), threading.Event(), []
+    first = submit("test_supersede", blocked(started, release, steps))
+    started.wait(5)
+    second = submit("test_supersede", lambda: "second viewer")
+    release.set()
+
+    with pytest.raises(Superseded):
+        first.result(5)
+    assert second.result(5) == "second viewer"
+    assert steps == []
+
+
+def test_other_viewers_are_not_superseded():
+    started, release, steps = threading.Event(), threading.Event(), []
+    first = submit("test_slot_a", blocked(started, release, steps))
+    started.wait(5)
+    second = submit("test_slot_b", lambda: "b")
+    release.set()
+    assert first.result(5) == "viewer"
+    assert second.result(5) == "b"
+    assert steps == ["tessellate"]
+
+
+def test_queued_job_can_be_cancelled():
+    started, release, steps = threading.Event(), threading.Event(), []
+    first = submit("test_cancel", blocked(started, release, steps))
+    started.wait(5)
+    queued = submit("test_cancel_other", lambda: steps.append("ran"))
+    assert queued.cancel()
+    release.set()
+    assert first.result(5) == "viewer"
+    assert steps == ["tessellate"]
+
+
+def test_kernel_calls_of_superseded_jobs_are_dropped():
+    calls = []
+
+    def show(slot):
+        if slot == "test_kernel_old":
+            submit("test_kernel_old", lambda: None)
+        in_kernel(calls.append, slot)
+        return current_job().slot
+
+    old = submit("test_kernel_old", show, "test_kernel_old")
+    assert submit("test_kernel_new", show, "test_kernel_new").result(5) == (
+        "test_kernel_new"
+    )
+    assert calls == ["test_kernel_new"]
+    with pytest.raises(Superseded):
+        old.result(5)
+
+
+def test_outside_of_render_thread():
+    assert current_job() is None
+    check()
+    calls = []
+    in_kernel(calls.append, 1)
+    assert calls == [1]
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from OCP.BRepPrimAPI import BRepPrimAPI_MakeBox, BRepPrimAPI_MakeSphere
+from OCP.gp import gp_Pnt
+
+from jupyter_cadquery.measure import interference_check, measure_batch, shape_ids
+
+
+def box(x, y, z, size=10.0):
+    return BRepPrimAPI_MakeBox(gp_Pnt(x, y, z), size, size, size).Shape()
+
+
+def sphere(x, y, z, radius):
+    return BRepPrimAPI_MakeSphere(gp_Pnt(x, y, z), radius).Shape()
+
+
+def records(table):
+    if hasattr(table, "to_dict"):
+        return table.to_dict("records")
+    return [dict(zip(table.dtype.names, row)) for row in table]
+
+
+def rows(shapes, **kwargs):
+    return records(interference_check(shapes, workers=0, **kwargs))
+
+
+def test_touching_pair_is_contact():
+    (row,) = rows([box(0, 0, 0), box(10, 0, 0)])
+    assert row["status"] == "contact"
+    assert row["distance"] == pytest.approx(0.0, abs=1e-6)
+    assert row["volume"] == pytest.approx(0.0, abs=1e-6)
+
+
+def test_overlapping_pair_is_interference():
+    (row,) = rows([box(0, 0, 0), box(8, 0, 0)])
+    assert row["status"] == "interference"
+    assert row["distance"] == 0.0
+    assert row["volume"] == pytest.approx(2 * 10 * 10)
+
+
+def test_enclosed_pair_is_interference():
+    (row,) = rows([box(-5, -5, -5), sphere(0, 0, 0, 1.0)])
+    assert row["status"] == "interference"
+    assert row["distance"] == 0.0
+    assert row["volume"] == pytest.approx(4 / 3 * np.pi, rel=1e-3)
+
+
+def test_separate_pair_within_clearance():
+    assert rows([box(0, 0, 0), box(12, 0, 0)]) == []
+
+    (row,) = rows([box(0, 0, 0), box(12, 0, 0)], min_clearance=3.0)
+    assert row["status"] == "clearance"
+    assert row["distance"] == pytest.approx(2.0)
+    assert row["volume"] == 0.0
+
+
+def top_level(model):
+    """Ids of the solids, without their faces, edges and vertices"""
+    return [i for i in shape_ids(model) if i.count("/") == 2]
+
+
+def test_batch_min_distance_and_distance():
+    model = [box(0, 0, 0), box(20, 0, 0), sphere(5, 5, 25, 2.0)]
+    solids = top_level(model)
+    assert len(solids) == 3
+    pairs = [(solids[0], solids[1]), (solids[0], solids[2]), (solids[1], solids[2])]
+
+    table = records(measure_batch(model, pairs, "min_distance", workers=0))
+    assert [(r["id1"], r["id2"]) for r in table] == pairs
+    assert table[0]["distance"] == pytest.approx(10.0)
+    assert table[1]["distance"] == pytest.approx(13.0)
+    assert table[2]["distance"] == pytest.approx(np.hypot(15, 15) - 2.0)
+
+    (row,) = records(measure_batch(model, pairs[:1], "distance"))
+    assert row["distance"] == pytest.approx(20.0)
+
+
+def test_batch_properties():
+    model = [box(0, 0, 0), sphere(5, 5, 25, 2.0)]
+    table = records(measure_batch(model, top_level(model), "properties"))
+    volumes = sorted(r["volume"] for r in table)
+    assert volumes == pytest.approx([4 / 3 * np.pi * 8, 1000.0], rel=1e-6)
+
+
+def test_batch_errors():
+    model = [box(0, 0, 0), box(20, 0, 0)]
+    with pytest.raises(ValueError):
+        measure_batch(model, [], "volume")
+    with pytest.raises(KeyError):
+        measure_batch(model, [("/Group/Solid", "/Group/Missing")], "min_distance")
@@ -0,0 +1,158 @@
+import copy
+
+import numpy as np
+import pytest
+
+from jupyter_cadquery.features import viewer_supports
+from jupyter_cadquery.merge import MERGE, merge, part_mesh, set_merge_mode
+
+
+def rotation(q):
+    """Matrix of the unit quaternion (x, y, z, w)"""
+    x, y, z, w = q
+    return np.array(
+        [
+            [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+            [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+            [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+        ]
+    )
+
+
+def quaternion(axis, angle):
+    axis = np.asarray(axis, dtype=float) / np.linalg.norm(axis)
+    return tuple(axis * np.sin(angle / 2)) + (np.cos(angle / 2),)
+
+
+def instance(rng, vertices=12, faces=3, edges=4):
+    normals = rng.normal(size=(vertices, 3))
+    return {
+        "vertices": rng.uniform(-1, 1, 3 * vertices).astype(np.float32),
+        "normals": (normals / np.linalg.norm(normals, axis=1)[:, None])
+        .astype(np.float32)
+        .ravel(),
+        "triangles": rng.integers(0, vertices, 3 * 2 * faces).astype(np.int32),
+        "edges": rng.uniform(-1, 1, 6 * edges).astype(np.float32),
+        "obj_vertices": rng.uniform(-1, 1, 3 * 2).astype(np.float32),
+        "face_types": np.zeros(faces, dtype=np.int32),
+        "triangles_per_face": np.full(faces, 2, dtype=np.int32),
+        "edge_types": np.zeros(2, dtype=np.int32),
+        "segments_per_edge": np.full(2, 2, dtype=np.int32),
+    }
+
+
+def assembly():
+    """Two levels of located groups, two materials and a textured part"""
+    rng = np.random.default_rng(3)
+    instances = [instance(rng) for _ in range(4)]
+    parts = []
+    for i in range(6):
+        parts.append(
+            {
+                "id": f"/root/group/part{i}",
+                "type": "shapes",
+                "color": "#e8b024" if i % 2 else "#4080ff",
+                "alpha": 1.0,
+                "renderback": False,
+                "loc": ((i, 2.0 * i, -1.0), quaternion((1, i, 2), 0.3 * i)),
+                "shape": {"ref": i % 3},
+            }
+        )
+    parts.append(
+        {
+            "id": "/root/group/textured",
+            "type": "shapes",
+            "color": "#ffffff",
+            "loc": None,
+            "texture": {"image": "..."},
+            "shape": {"ref": 3},
+        }
+    )
+    group = {
+        "id": "/root/group",
+        "loc": ((10.0, 0.0, 5.0), quaternion((0, 0, 1), 0.5)),
+        "parts": parts,
+    }
+    shapes = {
+        "id": "/root",
+        "loc": ((0.0, -3.0, 0.0), quaternion((0, 1, 0), -0.7)),
+        "parts": [group],
+    }
+    return instances, shapes
+
+
+def expected(instances, shapes, part_id):
+    """Mesh of a part transformed into the frame of the root group by hand"""
+    group = shapes["parts"][0]
+    part = next(p for p in group["parts"] if p["id"] == part_id)
+    mesh = instances[part["shape"]["ref"]]
+
+    rotate, translate = np.eye(3), np.zeros(3)
+    for loc in (group["loc"], part["loc"]):
+        r = rotation(loc[1])
+        rotate, translate = rotate @ r, rotate @ np.asarray(loc[0]) + translate
+
+    result = dict(mesh)
+    for key in ("vertices", "edges", "obj_vertices"):
+        result[key] = (mesh[key].reshape(-1, 3) @ rotate.T + translate).ravel()
+    result["normals"] = (mesh["normals"].reshape(-1, 3) @ rotate.T).ravel()
+    return result
+
+
+def test_part_mesh_round_trip(monkeypatch):
+    monkeypatch.setitem(MERGE, "min_parts", 2)
+    instances, shapes = assembly()
+    original = copy.deepcopy((instances, shapes))
+
+    new_instances, new_shapes, meshes = merge(instances, shapes)
+    assert len(meshes) == 2
+
+    merged_parts = [
+        p for p in new_shapes["parts"][0]["parts"] if "merged" in p["shape"]
+    ]
+    assert len(merged_parts) == 6
+    for part in merged_parts:
+        assert part["loc"] is None
+        mesh = part_mesh(meshes, part)
+        reference = expected(*original, part["id"])
+        for key, value in reference.items():
+            np.testing.assert_allclose(mesh[key], value, atol=1e-5, err_msg=key)
+
+    # the textured part keeps its (renumbered) instance and takes over the loc of
+    # its group, which the merged meshes already contain
+    group = new_shapes["parts"][0]
+    assert group["loc"] is None
+    (textured,) = [p for p in group["parts"] if "ref" in p["shape"]]
+    assert len(new_instances) == 1
+    assert new_instances[textured["shape"]["ref"]] is instances[3]
+    t, q = original[1]["parts"][0]["loc"]
+    np.testing.assert_allclose(textured["loc"][0], t, atol=1e-9)
+    np.testing.assert_allclose(np.abs(np.dot(textured["loc"][1], q)), 1, atol=1e-9)
+
+
+def test_small_assemblies_are_not_merged():
+    instances, shapes = assembly()
+    result = merge(instances, shapes)
+    assert result == (instances, shapes, [])
+
+
+@pytest.mark.parametrize("key", ["triangles", "edges", "triangles_per_face"])
+def test_merged_buffers_concatenate_the_parts(monkeypatch, key):
+    monkeypatch.setitem(MERGE, "min_parts", 2)
+    instances, shapes = assembly()
+    _, new_shapes, meshes = merge(instances, shapes)
+    parts = [p for p in new_shapes["parts"][0]["parts"] if "merged" in p["shape"]]
+    for index, mesh in enumerate(meshes):
+        members = [p for p in parts if p["shape"]["merged"] == index]
+        size = sum(len(part_mesh(meshes, p)[key]) for p in members)
+        assert size == len(mesh[key])
+
+
+def test_merge_mode_needs_a_viewer(monkeypatch):
+    monkeypatch.setitem(MERGE, "enabled", False)
+    if viewer_supports("merged_meshes"):
+        pytest.skip("the installed viewer draws merged meshes")
+    with pytest.raises(RuntimeError):
+        set_merge_mode(True)
+    assert not MERGE["enabled"]
+    set_merge_mode(False)
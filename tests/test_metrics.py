@@ -0,0 +1,66 @@
+from jupyter_cadquery.metrics import REGISTRY, Counter, Gauge, Histogram, Registry
+
+
+def test_counter():
+    counter = Counter("requests_total", "Number of requests.", ("handler", "status"))
+    counter.inc("objects", "200")
+    counter.inc("measure", "400")
+    counter.inc("objects", "200", value=2)
+    assert counter.render() == [
+        "# HELP jupyter_cadquery_requests_total Number of requests.",
+        "# TYPE jupyter_cadquery_requests_total counter",
+        'jupyter_cadquery_requests_total{handler="measure",status="400"} 1',
+        'jupyter_cadquery_requests_total{handler="objects",status="200"} 3',
+    ]
+
+
+def test_gauge_reads_the_value_on_render():
+    value = [1]
+    gauge = Gauge("models", "Loaded models.", lambda: value[0])
+    value[0] = 5
+    assert gauge.render()[-1] == "jupyter_cadquery_models 5"
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("duration_seconds", "Duration.", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+    assert histogram.render()[2:] == [
+        'jupyter_cadquery_duration_seconds_bucket{le="0.1"} 2',
+        'jupyter_cadquery_duration_seconds_bucket{le="1"} 3',
+        'jupyter_cadquery_duration_seconds_bucket{le="+Inf"} 4',
+        "jupyter_cadquery_duration_seconds_sum 2.65",
+        "jupyter_cadquery_duration_seconds_count 4",
+    ]
+
+
+def test_histogram_with_labels():
+    histogram = Histogram("latency", "Latency.", buckets=(1,), labels=("handler",))
+    histogram.observe(0.5, "objects")
+    lines = histogram.render()
+    assert 'jupyter_cadquery_latency_bucket{handler="objects",le="1"} 1' in lines
+    assert 'jupyter_cadquery_latency_count{handler="objects"} 1' in lines
+
+
+def test_registry_renders_in_registration_order():
+    registry = Registry()
+    counter = registry.register(Counter("a_total", "A."))
+    registry.register(Gauge("b", "B.", lambda: 0))
+    counter.inc()
+    assert registry.render() == "\n".join(
+        [
+            "# HELP jupyter_cadquery_a_total A.",
+            "# TYPE jupyter_cadquery_a_total counter",
+            "jupyter_cadquery_a_total 1",
+            "# HELP jupyter_cadquery_b B.",
+            "# TYPE jupyter_cadquery_b gauge",
+            "jupyter_cadquery_b 0",
+            "",
+        ]
+    )
+
+
+def test_server_metrics_are_registered():
+    text = REGISTRY.render()
+    for name in ("requests_total", "request_duration_seconds", "objects_payload_bytes"):
+        assert f"# TYPE jupyter_cadquery_{name} " in text
@@ -0,0 +1,34 @@
+import cad_viewer_widget
+
+from jupyter_cadquery import pool
+from jupyter_cadquery.comms import target_viewer
+from jupyter_cadquery.pool import (
+    MIN_CAD_WIDTH,
+    MIN_TREE_WIDTH,
+    get_viewer_pool,
+    set_viewer_pool,
+    take_viewer,
+)
+from jupyter_cadquery.show import pooled_target
+
+
+def test_pool_leaves_cad_viewer_widget_alone():
+    open_viewer = cad_viewer_widget.open_viewer
+    set_viewer_pool(0)
+    assert cad_viewer_widget.open_viewer is open_viewer
+    assert get_viewer_pool() == {"idle": 0, "size": 0}
+
+
+def test_small_viewers_are_not_taken_from_the_pool(monkeypatch):
+    idle = object()
+    monkeypatch.setattr(pool, "POOL", [idle])
+    assert take_viewer(cad_width=MIN_CAD_WIDTH - 1) is None
+    assert take_viewer(tree_width=MIN_TREE_WIDTH - 1) is None
+    assert pool.POOL == [idle]
+
+
+def test_show_without_pool_lets_cad_viewer_widget_open_the_viewer():
+    assert pooled_target(None, {}) is None
+    viewer = object()
+    with target_viewer(viewer):
+        assert pooled_target("Sidecar", {}) is viewer
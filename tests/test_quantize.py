@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from jupyter_cadquery.quantize import (
+    _buffer,
+    decode_buffer,
+    encode_mesh,
+    encode_shapes,
+    linear_deflection,
+    oct_decode,
+    oct_encode,
+)
+
+
+def mesh(size=100.0, count=3000, seed=1):
+    rng = np.random.default_rng(seed)
+    vertices = rng.uniform(-size / 2, size / 2, (count, 3)).astype(np.float32)
+    normals = rng.normal(size=(count, 3))
+    normals = (normals / np.linalg.norm(normals, axis=1)[:, None]).astype(np.float32)
+    triangles = rng.integers(0, count, 3 * count).astype(np.int32)
+    edges = rng.uniform(-size / 2, size / 2, (200, 3)).astype(np.float32)
+    return {
+        "vertices": _buffer(vertices),
+        "normals": _buffer(normals),
+        "triangles": _buffer(triangles),
+        "edges": _buffer(edges),
+        "obj_vertices": _buffer(vertices[:8]),
+    }
+
+
+def test_round_trip_error():
+    original = mesh()
+    data = {"instances": [original]}
+    (encoded,) = encode_shapes(data, deviation=0.1, max_error=0.1)["instances"]
+    assert data["instances"][0] is original
+
+    vertices = decode_buffer(original["vertices"]).reshape(-1, 3)
+    bbox_min, bbox_max = vertices.min(axis=0), vertices.max(axis=0)
+    bound = 0.1 * linear_deflection(bbox_min, bbox_max, 0.1)
+    for key in ("vertices", "edges", "obj_vertices"):
+        assert encoded[key]["encoding"] == "quantized"
+        assert encoded[key]["dtype"] == "int16"
+        decoded = decode_buffer(encoded[key])
+        assert decoded.dtype == np.float32
+        error = np.abs(decoded - decode_buffer(original[key])).max()
+        assert error <= bound
+        assert error <= max(encoded[key]["scale"]) / 2 * (1 + 1e-3)
+
+    assert encoded["triangles"]["dtype"] == "uint16"
+    np.testing.assert_array_equal(
+        decode_buffer(encoded["triangles"]), decode_buffer(original["triangles"])
+    )
+
+
+def test_normals_round_trip():
+    normals = decode_buffer(mesh()["normals"]).reshape(-1, 3)
+    axes = np.vstack([np.eye(3), -np.eye(3)]).astype(np.float32)
+    normals = np.vstack([normals, axes])
+    decoded = oct_decode(oct_encode(normals))
+    # chord length, about the angle in radians
+    assert np.linalg.norm(decoded - normals, axis=1).max() < 1e-4
+    np.testing.assert_allclose(decoded[-6:], axes, atol=1e-6)
+
+
+def test_coarse_mesh_keeps_float32():
+    original = mesh()
+    # a tolerance far below the int16 resolution of the bounding box
+    assert encode_mesh(original, deviation=1e-4, max_error=0.1) is original
+
+
+@pytest.mark.parametrize("count", [65536, 65537])
+def test_indices_fit_uint16(count):
+    encoded = encode_mesh(mesh(count=count))
+    dtype = "uint16" if count <= 65536 else "int32"
+    assert encoded["triangles"]["dtype"] == dtype
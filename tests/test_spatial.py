@@ -0,0 +1,100 @@
+import itertools
+
+import numpy as np
+import pytest
+from OCP.BRepAlgoAPI import BRepAlgoAPI_Cut
+from OCP.BRepPrimAPI import (
+    BRepPrimAPI_MakeBox,
+    BRepPrimAPI_MakeCylinder,
+    BRepPrimAPI_MakeSphere,
+    BRepPrimAPI_MakeTorus,
+)
+from OCP.gp import gp_Ax2, gp_Dir, gp_Pnt
+
+from jupyter_cadquery.spatial import (
+    ShapeIndex,
+    box_distance,
+    close_pairs,
+    exact_distance,
+    index_distance,
+)
+
+
+def brute_force(boxes, distance):
+    return [
+        (i, j)
+        for i, j in itertools.combinations(range(len(boxes)), 2)
+        if box_distance(boxes[i], boxes[j][None])[0] <= distance
+    ]
+
+
+@pytest.mark.parametrize("distance", [0.0, 0.5, 3.0])
+def test_close_pairs_match_brute_force(distance):
+    rng = np.random.default_rng(7)
+    lower = rng.uniform(0, 50, (300, 3))
+    boxes = np.hstack([lower, lower + rng.uniform(0.1, 4, (300, 3))])
+    # duplicates and boxes sharing a face, ties of the sweep
+    boxes[10] = boxes[11]
+    boxes[20, 0] = boxes[21, 3]
+    assert close_pairs(boxes, distance) == brute_force(boxes, distance)
+
+
+def test_close_pairs_single_box():
+    assert close_pairs(np.array([[0.0, 0, 0, 1, 1, 1]]), 1.0) == []
+
+
+def plate_with_hole():
+    plate = BRepPrimAPI_MakeBox(gp_Pnt(-10, -10, 0), 20, 20, 2).Shape()
+    hole = BRepPrimAPI_MakeCylinder(gp_Ax2(gp_Pnt(0, 0, -1), gp_Dir(0, 0, 1)), 4, 4)
+    return BRepAlgoAPI_Cut(plate, hole.Shape()).Shape()
+
+
+PAIRS = {
+    "boxes": (
+        BRepPrimAPI_MakeBox(gp_Pnt(0, 0, 0), 10, 10, 10).Shape(),
+        BRepPrimAPI_MakeBox(gp_Pnt(13, 4, -2), 5, 5, 5).Shape(),
+    ),
+    "box sphere": (
+        BRepPrimAPI_MakeBox(gp_Pnt(0, 0, 0), 10, 10, 10).Shape(),
+        BRepPrimAPI_MakeSphere(gp_Pnt(15, 15, 15), 3).Shape(),
+    ),
+    "sphere in hole": (
+        plate_with_hole(),
+        BRepPrimAPI_MakeSphere(gp_Pnt(0, 0, 1), 2.5).Shape(),
+    ),
+    "torus cylinder": (
+        BRepPrimAPI_MakeTorus(gp_Ax2(gp_Pnt(0, 0, 0), gp_Dir(0, 0, 1)), 10, 2).Shape(),
+        BRepPrimAPI_MakeCylinder(
+            gp_Ax2(gp_Pnt(0, 0, -5), gp_Dir(0, 0, 1)), 3, 10
+        ).Shape(),
+    ),
+    "touching": (
+        BRepPrimAPI_MakeBox(gp_Pnt(0, 0, 0), 10, 10, 10).Shape(),
+        BRepPrimAPI_MakeBox(gp_Pnt(10, 2, 2), 4, 4, 4).Shape(),
+    ),
+}
+
+
+@pytest.mark.parametrize("name", PAIRS)
+def test_index_distance_matches_full_shapes(name):
+    shape1, shape2 = PAIRS[name]
+    result = index_distance(ShapeIndex(shape1), ShapeIndex(shape2))
+    reference = exact_distance(shape1, shape2)
+    assert result[0] == pytest.approx(reference[0], abs=1e-6)
+
+    # the closest points belong to the shapes and are result[0] apart
+    p1, p2 = np.array(result[1:4]), np.array(result[4:7])
+    assert np.linalg.norm(p2 - p1) == pytest.approx(result[0], abs=1e-6)
+    point1 = BRepPrimAPI_MakeSphere(gp_Pnt(*p1), 1e-3).Shape()
+    point2 = BRepPrimAPI_MakeSphere(gp_Pnt(*p2), 1e-3).Shape()
+    assert exact_distance(point1, shape1)[0] < 1e-6
+    assert exact_distance(point2, shape2)[0] < 1e-6
+
+
+def test_index_distance_limit():
+    shape1, shape2 = PAIRS["box sphere"]
+    index1, index2 = ShapeIndex(shape1), ShapeIndex(shape2)
+    lower = box_distance(index1.bbox, index2.bbox)
+    result = index_distance(index1, index2, limit=lower / 2)
+    assert result[0] == pytest.approx(lower)
+    assert np.isnan(result[1:]).all()
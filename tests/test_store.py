@@ -0,0 +1,96 @@
+import orjson
+import pytest
+
+from jupyter_cadquery import store
+from jupyter_cadquery.store import BackendHost, ModelStore, UnknownViewerError
+
+
+def test_refcount_keeps_models_in_use():
+    models = ModelStore(retain=0)
+    model = models.add("a", {"/Group/a": "shape"}, 10)
+    models.acquire("a")
+    models.acquire("a")
+    models.release("a")
+    assert models.get("a") is model
+
+    models.release("a")
+    assert "a" not in models
+    assert models.memory() == 0
+
+
+def test_first_load_wins():
+    models = ModelStore()
+    first = models.add("a", "first", 10)
+    assert models.add("a", "second", 20) is first
+    assert models.memory() == 10
+
+
+def test_trim_drops_the_oldest_unreferenced_models():
+    models = ModelStore(retain=2)
+    for model_hash in "abc":
+        models.add(model_hash, model_hash, 1)
+        models.acquire(model_hash)
+    for model_hash in "abc":
+        models.release(model_hash)
+    assert ("a" in models, "b" in models, "c" in models) == (False, True, True)
+
+    # a re-shown model is referenced again and not trimmed
+    models.acquire("b")
+    models.add("d", "d", 1)
+    models.release("d")
+    assert len(models) == 3
+    models.add("e", "e", 1)
+    models.release("e")
+    assert sorted(models.models) == ["b", "d", "e"]
+
+
+def test_release_of_unknown_hash():
+    models = ModelStore()
+    models.release("unknown")
+    assert len(models) == 0
+
+
+@pytest.fixture
+def host(monkeypatch):
+    monkeypatch.setattr(store, "build_model", lambda raw_model: dict(raw_model))
+    return BackendHost(retain=1)
+
+
+def raw(model):
+    return orjson.dumps({"model": model})
+
+
+def test_viewers_share_models(host):
+    host.load("v1", "a", raw({"/a": 1}))
+    assert host.attach("v2", "a")
+    assert host.backends["v1"].model is host.backends["v2"].model
+    assert host.models.refcounts["a"] == 2
+    assert host.stats() == {"backends": 2, "models": 1, "memory": len(raw({"/a": 1}))}
+
+
+def test_attach_of_unknown_model(host):
+    assert not host.attach("v1", "unknown")
+    assert "v1" not in host.backends
+
+
+def test_new_model_releases_the_old_one(host):
+    host.load("v1", "a", raw({"/a": 1}))
+    host.load("v1", "b", raw({"/b": 1}))
+    host.load("v1", "c", raw({"/c": 1}))
+    assert host.models.refcounts == {"b": 0, "c": 1}
+    assert host.viewer_models == {"v1": "c"}
+
+
+def test_release_and_retain(host):
+    host.load("v1", "a", raw({"/a": 1}))
+    host.release("v1")
+    assert host.stats()["backends"] == 0
+    # retained for a quick re-show
+    assert host.attach("v1", "a")
+    with pytest.raises(UnknownViewerError):
+        host.handle_event("v2", {})
+
+
+def test_missing_model(host):
+    with pytest.raises(ValueError):
+        host.load("v1", "a", b"{}")
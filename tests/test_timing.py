@@ -0,0 +1,96 @@
+from collections import deque
+
+import pytest
+
+from jupyter_cadquery import timing
+from jupyter_cadquery.timing import (
+    add_stage,
+    clear_timings,
+    get_timings,
+    record,
+    set_timings_history,
+    stage,
+    timed,
+    timings_to_openmetrics,
+)
+
+
+@pytest.fixture(autouse=True)
+def history(monkeypatch):
+    monkeypatch.setattr(timing, "HISTORY", deque(maxlen=100))
+
+
+def show(**stages):
+    with record() as timings:
+        for name, duration in stages.items():
+            add_stage(name, duration)
+    return timings
+
+
+def test_stages_in_pipeline_order():
+    show(load_model=0.5, tessellation=1.0, custom=0.25, conversion=0.5)
+    show(tessellation=0.25)
+    first, second = get_timings()
+    assert list(first)[:2] == ["timestamp", "total"]
+    assert list(first)[2:] == ["conversion", "tessellation", "load_model", "custom"]
+    assert first["tessellation"] == 1.0
+    assert second["tessellation"] == 0.25
+    assert get_timings(last=1) == [second]
+
+
+def test_nested_shows_count_into_the_outer_one():
+    with record() as outer:
+        add_stage("conversion", 1.0)
+        with record() as inner:
+            add_stage("conversion", 2.0)
+    assert inner is outer
+    assert outer.stages == {"conversion": 3.0}
+    assert len(get_timings()) == 1
+
+
+def test_stages_outside_of_show_and_empty_shows_are_dropped():
+    add_stage("conversion", 1.0)
+    show()
+    assert get_timings() == []
+
+
+def test_stage_and_timed():
+    double = timed("tessellation", lambda x: 2 * x)
+    assert timed("merge", double) is double
+    with record() as timings:
+        assert double(2) == 4
+        with stage("merge"):
+            pass
+    assert set(timings.stages) == {"tessellation", "merge"}
+    assert timings.total >= sum(timings.stages.values())
+
+
+def test_history_size():
+    for i in range(5):
+        show(conversion=float(i))
+    set_timings_history(3)
+    assert [t["conversion"] for t in get_timings()] == [2.0, 3.0, 4.0]
+    show(conversion=5.0)
+    assert len(get_timings()) == 3
+    clear_timings()
+    assert get_timings() == []
+
+
+def test_openmetrics():
+    show(conversion=0.5, tessellation=1.5)
+    show(conversion=0.25)
+    text = timings_to_openmetrics()
+    lines = text.splitlines()
+    metric = "jupyter_cadquery_show_stage_seconds"
+    assert lines[0] == f"# TYPE {metric} summary"
+    assert lines[-1] == "# EOF"
+    assert text.endswith("\n")
+    assert f'{metric}_count{{stage="conversion"}} 2' in lines
+    assert f'{metric}_sum{{stage="conversion"}} 0.750000' in lines
+    assert f'{metric}_count{{stage="tessellation"}} 1' in lines
+    assert f'{metric}_count{{stage="total"}} 2' in lines
+    assert not any("timestamp" in line for line in lines)
+
+
+def test_openmetrics_of_empty_history():
+    assert timings_to_openmetrics().splitlines()[-1] == "# EOF"
@@ -0,0 +1,106 @@
+import pytest
+
+from jupyter_cadquery.tools import PickIndex
+
+
+class Node:
+    """Assembly node with the attributes PickIndex reads"""
+
+    def __init__(self, name, *children, obj=None):
+        self.name = name
+        self.children = list(children)
+        self.obj = obj
+
+    def __repr__(self):
+        return self.name
+
+
+def group(id_, *parts):
+    return {"id": id_, "parts": list(parts)}
+
+
+def shape(id_):
+    return {"id": id_}
+
+
+def index(mapping, assembly, is_cadquery):
+    """PickIndex of an assembly and its mapping as model_mapping returns it"""
+    result = PickIndex.__new__(PickIndex)
+    result.is_cadquery = is_cadquery
+    result.nodes, result.ids, result.order = {}, [], {}
+    result.root = mapping["id"]
+    result._node(result.root, assembly)
+    result._walk(mapping, assembly)
+    return result
+
+
+@pytest.fixture
+def cadquery():
+    wheel = Node("wheel", obj="wheel shape")
+    axle = Node("axle", wheel, Node("hub", obj="hub shape"), obj="axle shape")
+    car = Node("car", axle, Node("body", obj="body shape"), obj="car shape")
+    mapping = group(
+        "/car",
+        shape("/car/car"),
+        group("/car/axle", shape("/car/axle/axle"), shape("/car/axle/wheel")),
+        shape("/car/body"),
+    )
+    return index(mapping, car, True), car
+
+
+def test_cadquery_nodes_by_name(cadquery):
+    picks, car = cadquery
+    axle, body = car.children
+    assert picks["/car"] is car
+    assert picks["/car/car"] is car
+    assert picks["/car/axle"] is axle
+    assert picks["/car/axle/axle"] is axle
+    assert picks["/car/axle/wheel"] is axle.children[0]
+    assert picks["/car/body"] is body
+
+
+def test_viewer_picks_and_shape_ids(cadquery):
+    picks, car = cadquery
+    body = car.children[1]
+    assert picks[{"path": "/car", "name": "body"}] is body
+    assert picks["/car/body/faces/faces_3"] is body
+    # shown together with other objects
+    assert picks["/Group/car/body"] is body
+    assert "/car/wheels" not in picks
+    assert picks.get("/car/body/solids/solid_0") is None
+    with pytest.raises(KeyError):
+        picks["/car/wheels"]
+
+
+def test_multi_and_range_picks(cadquery):
+    picks, car = cadquery
+    axle, body = car.children
+    assert picks.get_many(["/car/body", "/car/unknown"]) == [body, None]
+    assert picks.get_range("/car/body", "/car/axle/axle") == [
+        axle,
+        axle.children[0],
+        body,
+    ]
+    assert picks.get_range("/car/car", "/car/axle/wheel") == [
+        car,
+        axle,
+        axle.children[0],
+    ]
+
+
+def test_build123d_nodes_by_order():
+    left, right = Node("left"), Node("right")
+    wheels = Node("wheels", left, right)
+    car = Node("car", wheels, Node("body"))
+    mapping = group(
+        "/car",
+        group("/car/wheels", shape("/car/wheels/Solid"), shape("/car/wheels/Solid_1")),
+        shape("/car/Solid"),
+        shape("/car/joint"),
+    )
+    picks = index(mapping, car, False)
+    assert picks["/car/wheels"] is wheels
+    assert picks["/car/wheels/Solid_1"] is right
+    assert picks["/car/Solid"] is car.children[1]
+    # entries beyond the children (joints) belong to the parent
+    assert picks["/car/joint"] is car